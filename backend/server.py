@@ -1,15 +1,38 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Query, Header
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
+import asyncio
 from pathlib import Path
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import httpx
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
+import base64
+import csv
+import io
+import zlib
+import hashlib
+import hmac
+from array import array
+import math
+import random
+import time
+import re
+import tempfile
+import bisect
+import heapq
+import unicodedata
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager, suppress
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -25,6 +48,12 @@ def get_kuwait_time_iso():
     """Get Kuwait time as ISO string"""
     return get_kuwait_time().isoformat()
 
+KUWAIT_TZ = timezone(timedelta(hours=3))
+
+def get_utc_time_iso():
+    """Get current UTC time as an offset-aware ISO string (for timestamptz columns)"""
+    return datetime.now(timezone.utc).isoformat()
+
 # Supabase configuration
 SUPABASE_URL = os.environ.get('SUPABASE_URL', 'https://sqhjsctsxlnivcbeclrn.supabase.co')
 SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY', '')
@@ -37,7 +66,55 @@ TAP_SECRET_KEY = os.environ.get('TAP_SECRET_KEY', 'sk_live_gBTwKh2Y0XGztTpcUqKvP
 TAP_PUBLIC_KEY = os.environ.get('TAP_PUBLIC_KEY', 'pk_live_gBTwKm2F0JfNOyR7q4rUslviegVxP')
 TAP_MERCHANT_ID = os.environ.get('TAP_MERCHANT_ID', '68010541')
 
-app = FastAPI(title="Bam Burgers API", version="2.0.0")
+# Cart quote signing key. Without QUOTE_SIGNING_KEY a key is derived from the service key
+# (HKDF, fixed label) so the service key itself never signs client-visible tokens; with neither,
+# quotes only verify on the worker that issued them
+QUOTE_SIGNING_KEY = os.environ.get('QUOTE_SIGNING_KEY', '')
+QUOTE_KEY_LABEL = b'bam-burgers/cart-quote/v1'
+
+# Geocoding
+NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org')
+GEOCODE_CACHE_PATH = Path(os.environ.get('GEOCODE_CACHE_PATH', str(ROOT_DIR / 'geocode_cache.json')))
+GEOCODE_CACHE_SIZE = int(os.environ.get('GEOCODE_CACHE_SIZE', '20000'))
+
+# Cold-order archive (Parquet files partitioned by month)
+ARCHIVE_DIR = Path(os.environ.get('ARCHIVE_DIR', str(ROOT_DIR / 'archive')))
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+
+# Dispatch: branch location (falls back to branches.latitude/longitude) and travel assumptions
+BRANCH_LAT = os.environ.get('BRANCH_LAT')
+BRANCH_LNG = os.environ.get('BRANCH_LNG')
+DELIVERY_SPEED_KMH = float(os.environ.get('DELIVERY_SPEED_KMH', '30'))
+DELIVERY_ROAD_FACTOR = float(os.environ.get('DELIVERY_ROAD_FACTOR', '1.3'))
+DELIVERY_HANDOFF_MINUTES = float(os.environ.get('DELIVERY_HANDOFF_MINUTES', '3'))
+
+# Kitchen capacity: parallel stations, and what happens once the queue is longer than the limit
+KITCHEN_STATIONS = int(os.environ.get('KITCHEN_STATIONS', '3'))
+KITCHEN_MAX_QUEUE_MINUTES = float(os.environ.get('KITCHEN_MAX_QUEUE_MINUTES', '45'))
+KITCHEN_OVERLOAD_MODE = os.environ.get('KITCHEN_OVERLOAD_MODE', 'defer')  # 'defer' or 'reject'
+
+# Order item modifiers: 'rows' (order_item_modifiers table) or 'json' (order_items.modifiers column)
+ORDER_ITEM_MODIFIERS_STORAGE = os.environ.get('ORDER_ITEM_MODIFIERS_STORAGE', 'rows')
+
+# Order numbers: <prefix>-<YYYYMMDD>-<daily sequence>; set a distinct prefix per branch
+# when several branches share a tenant
+ORDER_NUMBER_PREFIX = os.environ.get('ORDER_NUMBER_PREFIX', 'WEB')
+ORDER_NUMBER_BLOCK = int(os.environ.get('ORDER_NUMBER_BLOCK', '20'))
+ORDER_NUMBER_CAS_ATTEMPTS = 10
+
+# Denormalized item/payment summary columns on orders, used by the admin lists
+ORDER_SUMMARY_FIELDS = os.environ.get('ORDER_SUMMARY_FIELDS', 'false').lower() in ('1', 'true', 'yes')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    kitchen_board.start()
+    try:
+        yield
+    finally:
+        await kitchen_board.stop()
+
+
+app = FastAPI(title="Bam Burgers API", version="2.0.0", lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 logging.basicConfig(level=logging.INFO)
@@ -49,6 +126,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Changes-Cursor"],
 )
 
 # In-memory store for pending payments (in production, use Redis or database)
@@ -102,6 +180,7 @@ class CreateOrderRequest(BaseModel):
     payment_method: Optional[str] = "cash"
     loyalty_points_used: int = 0
     loyalty_points_earned: int = 0
+    quote_token: Optional[str] = None
 
 class OrderResponse(BaseModel):
     id: str
@@ -110,10 +189,31 @@ class OrderResponse(BaseModel):
     created_at: str
     payment_url: Optional[str] = None
     requires_payment: bool = False
+    estimated_ready_time: Optional[str] = None
 
 class UpdateStatusRequest(BaseModel):
     status: str
 
+class BulkUpdateStatusRequest(BaseModel):
+    order_ids: List[str]
+    status: str
+
+class QuoteItem(BaseModel):
+    item_id: str
+    quantity: int = 1
+    modifier_ids: List[str] = []
+    notes: Optional[str] = None
+
+class CartQuoteRequest(BaseModel):
+    order_type: str = 'delivery'
+    items: List[QuoteItem]
+    coupon_code: Optional[str] = None
+    customer_id: Optional[str] = None
+    delivery_zone_id: Optional[str] = None
+    geo_lat: Optional[float] = None
+    geo_lng: Optional[float] = None
+    loyalty_points: int = 0
+
 class CouponCreate(BaseModel):
     code: str
     description: Optional[str] = ""
@@ -178,28 +278,39 @@ class ItemModifierGroupLink(BaseModel):
     modifier_group_id: str
     sort_order: int = 0
 
+class MenuImportRequest(BaseModel):
+    categories: List[dict] = []
+    modifier_groups: List[dict] = []
+    items: List[dict] = []
+    modifiers: List[dict] = []
+
+class ReorderRequest(BaseModel):
+    ids: List[str]
+
 
 # ==================== SUPABASE HELPER ====================
 
-async def supabase_request(method: str, table: str, data: dict = None, params: dict = None):
-    """Make request to Supabase REST API"""
+async def supabase_send(method: str, table: str, data=None, params=None, headers: dict = None) -> httpx.Response:
+    """Send a request to the Supabase REST API and return the raw response"""
     url = f"{SUPABASE_URL}/rest/v1/{table}"
-    headers = {
+    request_headers = {
         'apikey': SUPABASE_SERVICE_KEY,
         'Authorization': f'Bearer {SUPABASE_SERVICE_KEY}',
         'Content-Type': 'application/json',
         'Prefer': 'return=representation'
     }
+    if headers:
+        request_headers.update(headers)
     
     async with httpx.AsyncClient(timeout=30.0) as client:
         if method == 'GET':
-            response = await client.get(url, headers=headers, params=params)
+            response = await client.get(url, headers=request_headers, params=params)
         elif method == 'POST':
-            response = await client.post(url, headers=headers, json=data)
+            response = await client.post(url, headers=request_headers, json=data, params=params)
         elif method == 'PATCH':
-            response = await client.patch(url, headers=headers, json=data, params=params)
+            response = await client.patch(url, headers=request_headers, json=data, params=params)
         elif method == 'DELETE':
-            response = await client.delete(url, headers=headers, params=params)
+            response = await client.delete(url, headers=request_headers, params=params)
         else:
             raise ValueError(f"Unsupported method: {method}")
         
@@ -207,14 +318,413 @@ async def supabase_request(method: str, table: str, data: dict = None, params: d
             logging.error(f"Supabase error: {response.status_code} - {response.text}")
             raise HTTPException(status_code=response.status_code, detail=response.text)
         
-        return response.json() if response.text else None
+        return response
+
+
+async def supabase_request(method: str, table: str, data: dict = None, params: dict = None):
+    """Make request to Supabase REST API"""
+    response = await supabase_send(method, table, data=data, params=params)
+    return response.json() if response.text else None
+
+
+async def supabase_request_with_count(table: str, params: dict, count: str = 'exact'):
+    """GET rows plus the total row count PostgREST reports in Content-Range.
+    
+    count is 'exact', 'planned' or 'estimated' (see the PostgREST Prefer header).
+    """
+    response = await supabase_send('GET', table, params=params, headers={'Prefer': f'count={count}'})
+    rows = response.json() if response.text else []
+    total = None
+    content_range = response.headers.get('content-range', '')
+    if '/' in content_range:
+        total_part = content_range.rsplit('/', 1)[1]
+        if total_part.isdigit():
+            total = int(total_part)
+    return rows, total
+
+
+# ==================== COLUMN SETS ====================
+
+# Columns returned by read endpoints instead of select=*. Bulky or internal
+# columns (provider_response, tenant_id, ...) are left out; ?fields= can
+# narrow a set further but never widen it.
+ORDER_COLUMNS = (
+    'id', 'order_number', 'order_type', 'channel', 'status', 'branch_id', 'customer_id',
+    'customer_name', 'customer_phone', 'customer_email', 'delivery_address',
+    'delivery_instructions', 'subtotal', 'discount_amount', 'delivery_fee', 'tax_amount',
+    'service_charge', 'total_amount', 'payment_status', 'transaction_id', 'notes',
+    'created_at', 'accepted_at', 'completed_at', 'updated_at',
+)
+ORDER_ITEM_COLUMNS = (
+    'id', 'order_id', 'item_id', 'item_name_en', 'item_name_ar', 'quantity',
+    'unit_price', 'total_price', 'notes', 'status',
+)
+ORDER_ITEM_MODIFIER_COLUMNS = (
+    'order_item_id', 'modifier_id', 'modifier_name_en', 'modifier_name_ar', 'quantity', 'price',
+)
+# Written on the order row when ORDER_SUMMARY_FIELDS is on; item_count counts lines, not quantities
+ORDER_SUMMARY_COLUMNS = ('item_count', 'item_names', 'payment_method', 'payment_provider')
+# payment_status of online orders whose charge has not gone through yet; many never will
+UNPAID_PAYMENT_STATUSES = ('payment_pending', 'failed')
+PAYMENT_COLUMNS = (
+    'id', 'order_id', 'payment_method', 'provider', 'amount', 'currency', 'status',
+    'transaction_id', 'completed_at',
+)
+MENU_CATEGORY_COLUMNS = (
+    'id', 'name_en', 'name_ar', 'description_en', 'description_ar', 'image_url', 'sort_order',
+)
+MENU_ITEM_COLUMNS = (
+    'id', 'category_id', 'name_en', 'name_ar', 'description_en', 'description_ar',
+    'image_url', 'base_price', 'calories', 'prep_time_minutes', 'sort_order',
+)
+MODIFIER_GROUP_COLUMNS = (
+    'id', 'name_en', 'name_ar', 'min_select', 'max_select', 'required', 'sort_order',
+)
+MODIFIER_COLUMNS = (
+    'id', 'modifier_group_id', 'name_en', 'name_ar', 'price', 'default_selected', 'sort_order',
+)
+DELIVERY_ZONE_COLUMNS = (
+    'id', 'zone_name', 'zone_type', 'coordinates', 'delivery_fee', 'min_order_amount',
+    'estimated_time_minutes', 'status',
+)
+# Admin lists include inactive rows, so they also carry status
+ADMIN_MENU_CATEGORY_COLUMNS = MENU_CATEGORY_COLUMNS + ('status',)
+ADMIN_MENU_ITEM_COLUMNS = MENU_ITEM_COLUMNS + ('status',)
+ADMIN_MODIFIER_GROUP_COLUMNS = MODIFIER_GROUP_COLUMNS + ('status',)
+ADMIN_MODIFIER_COLUMNS = MODIFIER_COLUMNS + ('status',)
+COUPON_COLUMNS = (
+    'id', 'code', 'name_en', 'name_ar', 'discount_type', 'discount_value', 'min_basket',
+    'max_discount', 'valid_from', 'valid_to', 'usage_limit', 'per_customer_limit',
+    'status', 'created_at',
+)
+# The admin panel's schema for loyalty_settings (see loyalty_terms)
+LOYALTY_SETTINGS_COLUMNS = (
+    'id', 'enabled', 'points_per_kwd', 'min_order_amount', 'earn_on_tax', 'earn_on_delivery_fee',
+    'redemption_rate', 'min_points_to_redeem', 'max_redemption_percent', 'points_expiry_days',
+    'expiry_type', 'notes',
+)
+
+
+def select_columns(columns: tuple, fields: Optional[str] = None, required: tuple = ('id',)) -> str:
+    """PostgREST select for an endpoint's column set, narrowed by a ?fields= list.
+    
+    required columns are always included (ids and cursor keys the endpoint needs).
+    """
+    if not fields:
+        return ','.join(columns)
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    selected = [column for column in required if column not in requested] + requested
+    return ','.join(selected)
+
+
+# ==================== CURSORS ====================
+
+def encode_cursor(position: dict) -> str:
+    """Encode a keyset position as an opaque URL-safe cursor"""
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, keys: tuple) -> dict:
+    """Decode a cursor produced by encode_cursor, checking it carries the expected keys"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(position, dict) or any(not position.get(key) for key in keys):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def postgrest_quote(value) -> str:
+    """Quote a value for use inside a PostgREST or=/and= filter list"""
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def keyset_filter(column: str, value: str, row_id: str, descending: bool = True) -> str:
+    """PostgREST or= filter selecting rows strictly after (column, id) in sort order"""
+    op = 'lt' if descending else 'gt'
+    quoted = postgrest_quote(value)
+    return f"({column}.{op}.{quoted},and({column}.eq.{quoted},id.{op}.{postgrest_quote(row_id)}))"
+
+
+def parse_range_bound(value: str, end: bool = False) -> str:
+    """Parse a from/to query value into an ISO timestamp.
+    
+    Naive values are taken as Kuwait local time. A bare date used as the
+    upper bound covers that whole day.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=KUWAIT_TZ)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.isoformat()
+
+
+def date_range_filter(column: str, date_from: Optional[str], date_to: Optional[str]) -> Optional[str]:
+    """PostgREST and= filter for column >= from and column < to"""
+    conditions = []
+    if date_from:
+        conditions.append(f"{column}.gte.{postgrest_quote(parse_range_bound(date_from))}")
+    if date_to:
+        conditions.append(f"{column}.lt.{postgrest_quote(parse_range_bound(date_to, end=True))}")
+    return f"({','.join(conditions)})" if conditions else None
+
+
+class OrderNumberAllocator:
+    """Daily order number sequence per printed prefix, handed out from in-memory blocks.
+    
+    Numbers read PREFIX-YYYYMMDD-NNNN, so the sequence is keyed by what is
+    printed: the prefix. Each worker reserves ORDER_NUMBER_BLOCK numbers at
+    a time by advancing a durable high-water mark in order_number_counters:
+        CREATE TABLE order_number_counters (
+            prefix text NOT NULL,
+            business_date date NOT NULL,
+            branch_id uuid NOT NULL,
+            high_water integer NOT NULL,
+            updated_at timestamptz DEFAULT now(),
+            PRIMARY KEY (prefix, business_date)
+        );
+    A prefix belongs to one branch: a counter row created by another branch
+    is refused, so two branches configured with the same ORDER_NUMBER_PREFIX
+    cannot print the same numbers. The mark only moves forward
+    (compare-and-set PATCH), so numbers are never reused, even across
+    restarts; numbers left in a worker's block when it stops are skipped.
+    Within a worker numbers increase; blocks of different workers
+    interleave. The next block is reserved in the background once the
+    current one is half used, so orders normally never wait on the database.
+    If the table does not exist the allocator disables itself on the first
+    404 instead of failing a round trip for every order.
+    """
+    
+    def __init__(self, prefix: str = ORDER_NUMBER_PREFIX, branch_id: str = BRANCH_ID, block: int = ORDER_NUMBER_BLOCK):
+        self.prefix = prefix
+        self.branch_id = branch_id
+        self.block = block
+        self.disabled = False
+        self.current = None  # [business_date, next, last]
+        self.reserved = None  # (business_date, first, last) fetched ahead
+        self._refill = None  # in-flight reservation task
+        self._lock = asyncio.Lock()
+    
+    async def _seed(self, business_date: str) -> int:
+        """Highest sequence already used that day (orders numbered before the counter existed)"""
+        day_prefix = f'{self.prefix}-{business_date.replace("-", "")}-'
+        rows = await supabase_request('GET', 'orders', params={
+            'select': 'order_number',
+            'tenant_id': f'eq.{TENANT_ID}',
+            'order_number': f'like.{day_prefix}*',
+            # R-suffixed fallback numbers sort above every digit suffix and are not part of the sequence
+            'and': f'(order_number.not.like.{postgrest_quote(day_prefix + "R*")})',
+            'order': 'order_number.desc',
+            'limit': '1',
+        })
+        suffix = (rows or [{}])[0].get('order_number', '').rsplit('-', 1)[-1]
+        return int(suffix) if suffix.isdigit() else 0
+    
+    async def _reserve(self, business_date: str) -> tuple:
+        """Advance the high-water mark by one block; returns (first, last)"""
+        try:
+            return await self._advance(business_date)
+        except HTTPException as e:
+            if e.status_code == 404:
+                self.disabled = True
+                logging.error("order_number_counters table is missing; order numbers fall back to random suffixes until restart")
+            raise
+    
+    async def _advance(self, business_date: str) -> tuple:
+        key = {'prefix': f'eq.{self.prefix}', 'business_date': f'eq.{business_date}'}
+        for attempt in range(ORDER_NUMBER_CAS_ATTEMPTS):
+            if attempt:
+                # Lost a race with another worker; back off with jitter before re-reading
+                await asyncio.sleep(random.uniform(0, 0.02 * attempt))
+            rows = await supabase_request('GET', 'order_number_counters', params={**key, 'select': 'high_water,branch_id'})
+            if not rows:
+                start = await self._seed(business_date)
+                try:
+                    await supabase_request('POST', 'order_number_counters', data={
+                        'prefix': self.prefix,
+                        'business_date': business_date,
+                        'branch_id': self.branch_id,
+                        'high_water': start + self.block,
+                    })
+                except HTTPException as e:
+                    if e.status_code == 409:  # another worker created it first
+                        continue
+                    raise
+                return start + 1, start + self.block
+            
+            if rows[0].get('branch_id') != self.branch_id:
+                raise RuntimeError(f"Order number prefix {self.prefix} is already used by branch {rows[0].get('branch_id')}")
+            high_water = rows[0]['high_water']
+            updated = await supabase_request('PATCH', 'order_number_counters', data={
+                'high_water': high_water + self.block,
+                'updated_at': get_utc_time_iso(),
+            }, params={**key, 'high_water': f'eq.{high_water}'})
+            if updated:
+                return high_water + 1, high_water + self.block
+        raise RuntimeError(f"Could not reserve {self.prefix} order numbers for {business_date}")
+    
+    def _prefetch(self, business_date: str):
+        if self._refill is not None or (self.reserved and self.reserved[0] == business_date):
+            return
+        
+        async def refill():
+            try:
+                first, last = await self._reserve(business_date)
+                self.reserved = (business_date, first, last)
+            except Exception as e:
+                logging.warning(f"Order number prefetch failed: {e}")
+            finally:
+                self._refill = None
+        
+        self._refill = asyncio.create_task(refill())
+    
+    async def next(self) -> str:
+        if self.disabled:
+            raise RuntimeError("Order number allocator is disabled")
+        now = get_kuwait_time()
+        business_date = now.strftime('%Y-%m-%d')
+        async with self._lock:
+            block = self.current
+            if not block or block[0] != business_date or block[1] > block[2]:
+                if self._refill is not None:
+                    await self._refill
+                reserved, self.reserved = self.reserved, None
+                if reserved and reserved[0] == business_date:
+                    block = list(reserved)
+                else:
+                    block = [business_date, *await self._reserve(business_date)]
+                self.current = block
+            
+            sequence = block[1]
+            block[1] += 1
+            if block[2] - block[1] < self.block // 2:
+                self._prefetch(business_date)
+        return f"{self.prefix}-{now.strftime('%Y%m%d')}-{sequence:04d}"
+
+
+order_numbers = OrderNumberAllocator()
+
+
+async def generate_order_number() -> str:
+    if not order_numbers.disabled:
+        try:
+            return await order_numbers.next()
+        except Exception as e:
+            if not order_numbers.disabled:
+                logging.error(f"Order number allocation failed, using random suffix: {e}")
+    # Keep taking orders if the counter table is unavailable; R marks numbers outside the sequence
+    return f"{ORDER_NUMBER_PREFIX}-{get_kuwait_time().strftime('%Y%m%d')}-R{uuid.uuid4().int % 10**6:06d}"
 
 
-def generate_order_number():
-    now = get_kuwait_time()
-    date_str = now.strftime('%Y%m%d')
-    random_part = str(uuid.uuid4().int)[:4]
-    return f"WEB-{date_str}-{random_part}"
+# ==================== LIVE ORDER EVENTS ====================
+
+class OrderEventBroadcaster:
+    """In-process fan-out of order events to live feed subscribers.
+    
+    Each subscriber gets a bounded queue. A subscriber that falls a full
+    buffer behind is disconnected and resumes from the replay history with
+    Last-Event-ID. Event ids are prefixed with a per-process epoch so a
+    client resuming across a restart is told to resync instead.
+    """
+    
+    def __init__(self, history_size: int = 1000, subscriber_buffer: int = 256):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.subscriber_buffer = subscriber_buffer
+        self._sequence = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._listeners = []
+    
+    def add_listener(self, callback):
+        """Call callback(event) synchronously for every published event (in-process state such as the kitchen board)"""
+        self._listeners.append(callback)
+    
+    def publish(self, event_type: str, order: dict) -> dict:
+        self._sequence += 1
+        event = {
+            'id': f"{self.epoch}-{self._sequence}",
+            'seq': self._sequence,
+            'type': event_type,
+            'order': order,
+        }
+        self._history.append(event)
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"Order event listener failed: {str(e)}")
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(queue)
+        return event
+    
+    def publish_many(self, event_type: str, orders: list):
+        for order in orders:
+            self.publish(event_type, order)
+    
+    def subscribe(self, last_event_id: Optional[str] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.subscriber_buffer)
+        if last_event_id:
+            for event in self._replay(last_event_id):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    self._drop(queue)
+                    return queue
+        self._subscribers.add(queue)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+    
+    def _replay(self, last_event_id: str) -> list:
+        epoch, _, seq = last_event_id.partition('-')
+        oldest = self._history[0]['seq'] if self._history else self._sequence + 1
+        if epoch != self.epoch or not seq.isdigit() or int(seq) + 1 < oldest:
+            return [{'id': f"{self.epoch}-{self._sequence}", 'seq': self._sequence, 'type': 'resync', 'order': None}]
+        return [event for event in self._history if event['seq'] > int(seq)]
+    
+    def _drop(self, queue: asyncio.Queue):
+        """Disconnect a lagging subscriber; None tells its stream to close"""
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+order_events = OrderEventBroadcaster()
+
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def format_sse(event: dict) -> str:
+    data = json.dumps(event['order'], default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def order_event_payload(order_data: dict, items: list = None) -> dict:
+    """Order fields pushed to live feeds (no provider_response or other bulky columns)"""
+    payload = {key: order_data.get(key) for key in (
+        'id', 'order_number', 'order_type', 'status', 'payment_status', 'customer_name',
+        'customer_phone', 'total_amount', 'notes', 'created_at', 'updated_at',
+        'accepted_at', 'completed_at', 'estimated_ready_time',
+    ) if key in order_data}
+    if items is not None:
+        payload['items'] = items
+    return payload
 
 
 # ==================== HEALTH CHECK ====================
@@ -230,9 +740,91 @@ async def api_health_check():
 
 # ==================== ORDERS ====================
 
-async def create_order_in_db(request: CreateOrderRequest, payment_status: str = 'pending', transaction_id: str = None, provider_response: dict = None) -> dict:
+def order_item_modifier_row(order_item_id: str, mod) -> dict:
+    """A chosen modifier in ORDER_ITEM_MODIFIER_COLUMNS shape"""
+    return {
+        'order_item_id': order_item_id,
+        'modifier_id': mod.id if hasattr(mod, 'id') else mod.get('id', ''),
+        'modifier_name_en': mod.name_en if hasattr(mod, 'name_en') else mod.get('name_en', ''),
+        'modifier_name_ar': mod.name_ar if hasattr(mod, 'name_ar') else mod.get('name_ar', ''),
+        'quantity': 1,
+        'price': mod.price if hasattr(mod, 'price') else mod.get('price', 0),
+    }
+
+
+def order_item_select(columns: tuple) -> str:
+    """order_items select list, plus the modifiers column when modifiers are stored as JSON"""
+    if ORDER_ITEM_MODIFIERS_STORAGE == 'json':
+        return ','.join(columns + ('modifiers',))
+    return ','.join(columns)
+
+
+def expand_item_modifiers(items: list, legacy_rows: list = ()) -> list:
+    """order_item_modifiers-shaped rows for a set of items.
+    
+    Items carrying a modifiers JSON array use it; legacy_rows (from the
+    order_item_modifiers table) only count for items without one, so
+    backfilled items are not doubled.
+    """
+    rows, stored = [], set()
+    for item in items:
+        if isinstance(item.get('modifiers'), list):
+            stored.add(item['id'])
+            rows.extend({'order_item_id': item['id'], **modifier} for modifier in item['modifiers'])
+    rows.extend(row for row in legacy_rows if row.get('order_item_id') not in stored)
+    return rows
+
+
+async def attach_item_modifiers(items: list, select: str = None):
+    """Set item['modifiers'] to a list of modifier rows.
+    
+    Items stored with a modifiers JSON array use it as is; items without one
+    (written in 'rows' mode or before the backfill) are filled from
+    order_item_modifiers in one lookup per MAX_BULK_ORDERS items.
+    """
+    select = select or ','.join(ORDER_ITEM_MODIFIER_COLUMNS)
+    legacy_ids = []
+    for item in items:
+        if isinstance(item.get('modifiers'), list):
+            item['modifiers'] = [{'order_item_id': item['id'], **modifier} for modifier in item['modifiers']]
+        else:
+            legacy_ids.append(item['id'])
+    
+    modifiers = {}
+    for start in range(0, len(legacy_ids), MAX_BULK_ORDERS):
+        rows = await supabase_request('GET', 'order_item_modifiers', params={
+            'order_item_id': f'in.({",".join(legacy_ids[start:start + MAX_BULK_ORDERS])})',
+            'select': select,
+        })
+        for row in rows or []:
+            modifiers.setdefault(row['order_item_id'], []).append(row)
+    for item in items:
+        if not isinstance(item.get('modifiers'), list):
+            item['modifiers'] = modifiers.get(item['id'], [])
+
+
+ORDER_SUMMARY_NAMES = 3
+
+
+def order_summary_fields(items: list, payment_method: Optional[str] = None, payment_provider: Optional[str] = None) -> dict:
+    """ORDER_SUMMARY_COLUMNS values for an order's item rows and payment.
+    
+    item_count is the number of order lines, not the sum of their quantities.
+    """
+    return {
+        'item_count': len(items),
+        'item_names': [
+            {'name_en': item.get('item_name_en'), 'name_ar': item.get('item_name_ar'), 'quantity': item.get('quantity')}
+            for item in items[:ORDER_SUMMARY_NAMES]
+        ],
+        'payment_method': payment_method,
+        'payment_provider': payment_provider,
+    }
+
+
+async def create_order_in_db(request: CreateOrderRequest, payment_status: str = 'pending', transaction_id: str = None, provider_response: dict = None, estimated_ready_time: str = None) -> dict:
     """Create order in Supabase database"""
-    order_number = generate_order_number()
+    order_number = await generate_order_number()
     order_id = str(uuid.uuid4())
     
     address_json = request.delivery_address.dict() if request.delivery_address else None
@@ -258,8 +850,16 @@ async def create_order_in_db(request: CreateOrderRequest, payment_status: str =
         'service_charge': 0,
         'total_amount': request.total_amount,
         'payment_status': payment_status,
+        'transaction_id': transaction_id,
         'notes': request.notes,
     }
+    if ORDER_SUMMARY_FIELDS:
+        paid_online = payment_status == 'paid' and transaction_id
+        order_data.update(order_summary_fields(
+            [item.dict() for item in request.items],
+            payment_method='online' if paid_online else request.payment_method,
+            payment_provider='tap' if paid_online else None,
+        ))
     
     # Insert order
     await supabase_request('POST', 'orders', data=order_data)
@@ -282,19 +882,18 @@ async def create_order_in_db(request: CreateOrderRequest, payment_status: str =
                 'notes': item.notes,
                 'status': 'pending',
             }
+            if ORDER_ITEM_MODIFIERS_STORAGE == 'json':
+                # Modifiers ride along in the item row; no per-modifier inserts
+                item_data['modifiers'] = [
+                    {key: value for key, value in order_item_modifier_row(order_item_id, mod).items() if key != 'order_item_id'}
+                    for mod in (item.modifiers or [])
+                ]
             await supabase_request('POST', 'order_items', data=item_data)
             
             # Insert item modifiers
-            if item.modifiers:
+            if item.modifiers and ORDER_ITEM_MODIFIERS_STORAGE != 'json':
                 for mod in item.modifiers:
-                    modifier_data = {
-                        'order_item_id': order_item_id,
-                        'modifier_id': mod.id if hasattr(mod, 'id') else mod.get('id', ''),
-                        'modifier_name_en': mod.name_en if hasattr(mod, 'name_en') else mod.get('name_en', ''),
-                        'modifier_name_ar': mod.name_ar if hasattr(mod, 'name_ar') else mod.get('name_ar', ''),
-                        'quantity': 1,
-                        'price': mod.price if hasattr(mod, 'price') else mod.get('price', 0),
-                    }
+                    modifier_data = order_item_modifier_row(order_item_id, mod)
                     try:
                         await supabase_request('POST', 'order_item_modifiers', data=modifier_data)
                     except Exception as e:
@@ -372,27 +971,73 @@ async def create_order_in_db(request: CreateOrderRequest, payment_status: str =
         except Exception as e:
             logging.warning(f"Could not track coupon usage: {e}")
     
+    created_at = get_kuwait_time().isoformat()
+    # Online orders awaiting payment may never be paid (and are then deleted);
+    # verify_payment_new announces them with order_paid once the charge is captured
+    if payment_status != 'payment_pending':
+        order_events.publish('order_created', order_event_payload(
+            {**order_data, 'created_at': created_at, 'estimated_ready_time': estimated_ready_time},
+            items=[{
+                'item_id': item.item_id,
+                'item_name_en': item.item_name_en,
+                'item_name_ar': item.item_name_ar,
+                'quantity': item.quantity,
+                'notes': item.notes,
+                'modifiers': [mod.name_en for mod in (item.modifiers or [])],
+            } for item in request.items],
+        ))
+    
     return {
         'id': order_id,
         'order_number': order_number,
         'status': 'pending',
-        'created_at': get_kuwait_time().isoformat(),
+        'created_at': created_at,
     }
 
 
 @api_router.post("/orders", response_model=OrderResponse)
 async def create_order(request: CreateOrderRequest):
     """Create a new order - for cash orders, creates immediately. For online payment, initiates payment first."""
+    quote = None
+    if request.quote_token:
+        quote = verify_quote_token(request.quote_token)
+        apply_cart_quote(request, quote)
+    
+    kitchen_estimate = kitchen_board.estimate([{'item_id': item.item_id, 'quantity': item.quantity} for item in request.items])
+    if not kitchen_estimate['accepting']:
+        raise HTTPException(
+            status_code=503,
+            detail="The kitchen is at full capacity right now. Please try again in a few minutes.",
+            headers={'Retry-After': str(int(kitchen_estimate['queue_minutes'] - KITCHEN_MAX_QUEUE_MINUTES + 1) * 60)},
+        )
+    estimated_ready_time = kitchen_estimate['estimated_ready_time']
+    
+    if quote is not None:
+        # Claimed before the insert so two concurrent submits cannot both use it;
+        # released again below if the order is not placed
+        await quote_redemptions.claim(quote)
+    
+    try:
+        return await place_order(request, estimated_ready_time)
+    except BaseException:
+        if quote is not None:
+            await quote_redemptions.release(quote)
+        raise
+
+
+async def place_order(request: CreateOrderRequest, estimated_ready_time: str) -> OrderResponse:
+    """Insert the order and, for online payment, start the Tap charge"""
     try:
         # For cash payment, create order immediately
         if request.payment_method != 'tap':
-            result = await create_order_in_db(request, payment_status='pending')
+            result = await create_order_in_db(request, payment_status='pending', estimated_ready_time=estimated_ready_time)
             return OrderResponse(
                 id=result['id'],
                 order_number=result['order_number'],
                 status='pending',
                 created_at=result['created_at'],
-                requires_payment=False
+                requires_payment=False,
+                estimated_ready_time=estimated_ready_time
             )
         
         # For online payment, create order with payment_pending status first
@@ -400,7 +1045,7 @@ async def create_order(request: CreateOrderRequest):
         frontend_url = os.environ.get('FRONTEND_URL', 'https://bamburgers-fix.preview.emergentagent.com')
         
         # Create order with payment_pending status (won't show in admin until payment confirmed)
-        order_result = await create_order_in_db(request, payment_status='payment_pending')
+        order_result = await create_order_in_db(request, payment_status='payment_pending', estimated_ready_time=estimated_ready_time)
         order_id = order_result['id']
         order_number = order_result['order_number']
         
@@ -470,7 +1115,8 @@ async def create_order(request: CreateOrderRequest):
                     status='awaiting_payment',
                     created_at=order_result['created_at'],
                     payment_url=payment_url,
-                    requires_payment=True
+                    requires_payment=True,
+                    estimated_ready_time=estimated_ready_time
                 )
             else:
                 logging.error(f"Tap charge failed: {response.text}")
@@ -479,6 +1125,7 @@ async def create_order(request: CreateOrderRequest):
                     await supabase_request('DELETE', 'orders', params={'id': f'eq.{order_id}'})
                 except:
                     pass
+                kitchen_board.remove(order_id)
                 raise HTTPException(status_code=400, detail="Payment initiation failed")
                 
     except HTTPException:
@@ -548,10 +1195,13 @@ async def verify_payment_new(tap_id: Optional[str] = None, ref: Optional[str] =
                                 'payment_status': 'paid',
                                 'status': 'pending',  # Now it's a real pending order
                                 'transaction_id': transaction_id,
-                                'updated_at': get_kuwait_time().isoformat()
+                                'updated_at': get_utc_time_iso()
                             }
-                            await supabase_request('PATCH', 'orders', data=update_data, params={'id': f'eq.{charge_order_id}'})
+                            if ORDER_SUMMARY_FIELDS:
+                                update_data.update({'payment_method': 'online', 'payment_provider': 'tap'})
+                            updated = await supabase_request('PATCH', 'orders', data=update_data, params={'id': f'eq.{charge_order_id}'})
                             logging.info(f"Order {charge_order_id} updated to paid status")
+                            order_events.publish_many('order_paid', [order_event_payload(order) for order in (updated or [])])
                             
                             # Create payment record
                             payment_data = {
@@ -642,7 +1292,7 @@ async def verify_payment_new(tap_id: Optional[str] = None, ref: Optional[str] =
         # If we have order_id but no tap_id, we need to find the charge
         elif order_id:
             # The order exists - check its payment status
-            orders = await supabase_request('GET', 'orders', params={'id': f'eq.{order_id}', 'select': '*'})
+            orders = await supabase_request('GET', 'orders', params={'id': f'eq.{order_id}', 'select': 'id,order_number,payment_status,transaction_id'})
             if orders:
                 order = orders[0]
                 if order.get('payment_status') == 'paid':
@@ -685,32 +1335,105 @@ async def verify_payment_new(tap_id: Optional[str] = None, ref: Optional[str] =
         }
 
 
+MAX_WAIT_SECONDS = 60
+MAX_WAIT_ORDERS = 20
+
+
+@api_router.get("/orders/{order_ids}/wait")
+async def wait_for_order_status(order_ids: str, known_status: Optional[str] = None, timeout: float = 25):
+    """Long-poll until an order's status differs from known_status or timeout expires.
+    
+    order_ids may list several comma-separated orders; known_status is then
+    either one status for all of them or a comma-separated list in the same
+    order. Without known_status the current statuses are returned at once.
+    Costs one Supabase query per call (plus one each time the wait falls
+    behind the live order events, which otherwise wake it in-process).
+    """
+    ids = [order_id for order_id in order_ids.split(',') if order_id]
+    if not ids or len(ids) > MAX_WAIT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_WAIT_ORDERS} order IDs")
+    
+    statuses = known_status.split(',') if known_status else []
+    if len(statuses) == 1:
+        statuses = statuses * len(ids)
+    if statuses and len(statuses) != len(ids):
+        raise HTTPException(status_code=400, detail="known_status must have one value or one per order")
+    known = dict(zip(ids, statuses))
+    timeout = max(0, min(timeout, MAX_WAIT_SECONDS))
+    
+    # Subscribe before reading so a change between the read and the wait is not missed
+    queue = order_events.subscribe()
+    current = {order_id: {'id': order_id, 'status': None} for order_id in ids}
+    
+    async def read():
+        rows = await supabase_request('GET', 'orders', params={
+            'id': f'in.({",".join(ids)})',
+            'tenant_id': f'eq.{TENANT_ID}',
+            'select': 'id,status,payment_status,updated_at'
+        })
+        for row in (rows or []):
+            current[row['id']] = row
+    
+    try:
+        await read()
+        
+        def changed():
+            # Nothing known yet: the current status is news to the caller
+            return not known or any(current[order_id]['status'] != known.get(order_id) for order_id in ids)
+        
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not changed():
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if event is None:
+                # Fell behind the broadcaster; re-subscribe, then re-read what the dropped events carried
+                order_events.unsubscribe(queue)
+                queue = order_events.subscribe()
+                await read()
+                continue
+            order = event.get('order') or {}
+            if order.get('id') in current:
+                current[order['id']] = {**current[order['id']], **{
+                    key: order[key] for key in ('status', 'payment_status', 'updated_at') if key in order
+                }}
+        
+        return {"changed": bool(changed()), "orders": [current[order_id] for order_id in ids]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error waiting for order status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        order_events.unsubscribe(queue)
+
+
 @api_router.get("/orders/{order_id}")
-async def get_order(order_id: str):
+async def get_order(order_id: str, fields: Optional[str] = None):
     """Get order by ID with items, modifiers, and payment info"""
     try:
-        orders = await supabase_request('GET', 'orders', params={'id': f'eq.{order_id}', 'select': '*'})
+        orders = await supabase_request('GET', 'orders', params={'id': f'eq.{order_id}', 'select': select_columns(ORDER_COLUMNS, fields)})
         if not orders:
+            archived = await order_archive.get_order(order_id=order_id, fields=fields)
+            if archived:
+                return archived
             raise HTTPException(status_code=404, detail="Order not found")
         
         order = orders[0]
         
         # Get items with modifiers
-        items = await supabase_request('GET', 'order_items', params={'order_id': f'eq.{order_id}', 'select': '*'})
-        items_with_modifiers = []
-        for item in (items or []):
-            modifiers = await supabase_request('GET', 'order_item_modifiers', params={
-                'order_item_id': f'eq.{item["id"]}',
-                'select': '*'
-            })
-            item['modifiers'] = modifiers or []
-            items_with_modifiers.append(item)
-        order['items'] = items_with_modifiers
+        items = await supabase_request('GET', 'order_items', params={'order_id': f'eq.{order_id}', 'select': order_item_select(ORDER_ITEM_COLUMNS)}) or []
+        await attach_item_modifiers(items)
+        order['items'] = items
         
         # Get payment info
         payments = await supabase_request('GET', 'payments', params={
             'order_id': f'eq.{order_id}',
-            'select': '*'
+            'select': select_columns(PAYMENT_COLUMNS)
         })
         if payments:
             order['payment'] = payments[0]
@@ -724,21 +1447,26 @@ async def get_order(order_id: str):
 
 
 @api_router.get("/orders/number/{order_number}")
-async def get_order_by_number(order_number: str):
+async def get_order_by_number(order_number: str, fields: Optional[str] = None):
     """Get order by order number"""
     try:
-        orders = await supabase_request('GET', 'orders', params={'order_number': f'eq.{order_number}', 'select': '*'})
+        orders = await supabase_request('GET', 'orders', params={'order_number': f'eq.{order_number}', 'select': select_columns(ORDER_COLUMNS, fields)})
         if not orders:
+            archived = await order_archive.get_order(order_number=order_number, fields=fields)
+            if archived:
+                for item in archived['items']:
+                    item.pop('modifiers', None)
+                return archived
             raise HTTPException(status_code=404, detail="Order not found")
         
         order = orders[0]
-        items = await supabase_request('GET', 'order_items', params={'order_id': f'eq.{order["id"]}', 'select': '*'})
+        items = await supabase_request('GET', 'order_items', params={'order_id': f'eq.{order["id"]}', 'select': select_columns(ORDER_ITEM_COLUMNS)})
         order['items'] = items or []
         
         # Get payment info
         payments = await supabase_request('GET', 'payments', params={
             'order_id': f'eq.{order["id"]}',
-            'select': '*'
+            'select': select_columns(PAYMENT_COLUMNS)
         })
         if payments:
             order['payment'] = payments[0]
@@ -751,103 +1479,671 @@ async def get_order_by_number(order_number: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+ORDER_STATUSES = ['pending', 'accepted', 'preparing', 'ready', 'out_for_delivery', 'delivered', 'completed', 'cancelled']
+
+# Allowed moves for bulk transitions; terminal statuses cannot be left
+ORDER_STATUS_TRANSITIONS = {
+    'pending': {'accepted', 'preparing', 'cancelled'},
+    'accepted': {'preparing', 'ready', 'cancelled'},
+    'preparing': {'ready', 'cancelled'},
+    'ready': {'out_for_delivery', 'delivered', 'completed', 'cancelled'},
+    'out_for_delivery': {'delivered', 'completed', 'cancelled'},
+    'delivered': {'completed'},
+    'completed': set(),
+    'cancelled': set(),
+}
+
+MAX_BULK_ORDERS = 200
+
+
+def status_update_data(status: str) -> dict:
+    """Columns written when an order moves to status"""
+    update_data = {'status': status, 'updated_at': get_utc_time_iso()}
+    
+    if status == 'accepted':
+        update_data['accepted_at'] = get_kuwait_time().isoformat()
+    elif status in ['delivered', 'completed', 'cancelled']:
+        update_data['completed_at'] = get_kuwait_time().isoformat()
+    
+    return update_data
+
+
 @api_router.patch("/orders/{order_id}/status")
 async def update_order_status(order_id: str, request: UpdateStatusRequest):
     """Update order status"""
-    valid_statuses = ['pending', 'accepted', 'preparing', 'ready', 'out_for_delivery', 'delivered', 'completed', 'cancelled']
-    
-    if request.status not in valid_statuses:
+    if request.status not in ORDER_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
     
     try:
-        update_data = {'status': request.status}
-        
-        if request.status == 'accepted':
-            update_data['accepted_at'] = get_kuwait_time().isoformat()
-        elif request.status in ['delivered', 'completed', 'cancelled']:
-            update_data['completed_at'] = get_kuwait_time().isoformat()
-        
-        await supabase_request('PATCH', 'orders', data=update_data, params={'id': f'eq.{order_id}'})
+        update_data = status_update_data(request.status)
+        updated = await supabase_request('PATCH', 'orders', data=update_data, params={'id': f'eq.{order_id}'})
+        order_events.publish_many('order_status_changed', [order_event_payload(order) for order in (updated or [])])
         return {"success": True, "status": request.status}
     except Exception as e:
         logging.error(f"Error updating order status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.get("/admin/orders")
-async def get_all_orders(status: Optional[str] = None, limit: int = 100):
-    """Get all orders for admin panel with payment info"""
+@api_router.patch("/admin/orders/status")
+async def bulk_update_order_status(request: BulkUpdateStatusRequest):
+    """Move several orders to one status with a single update.
+    
+    Each order's current status is checked against ORDER_STATUS_TRANSITIONS;
+    the update is also filtered on those statuses, so an order changed by
+    someone else in the meantime is reported as a conflict, not overwritten.
+    """
+    if request.status not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    order_ids = list(dict.fromkeys(request.order_ids))
+    if not order_ids or len(order_ids) > MAX_BULK_ORDERS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_BULK_ORDERS} order IDs")
+    
     try:
-        params = {
-            'select': '*',
-            'order': 'created_at.desc',
-            'limit': str(limit),
-            'tenant_id': f'eq.{TENANT_ID}'
-        }
+        rows = await supabase_request('GET', 'orders', params={
+            'id': f'in.({",".join(order_ids)})',
+            'tenant_id': f'eq.{TENANT_ID}',
+            'select': 'id,status'
+        })
+        current = {row['id']: row['status'] for row in (rows or [])}
         
-        if status and status != 'all':
-            params['status'] = f'eq.{status}'
+        results = {}
+        allowed = []
+        for order_id in order_ids:
+            from_status = current.get(order_id)
+            if from_status is None:
+                results[order_id] = {"id": order_id, "success": False, "error": "Order not found"}
+            elif request.status not in ORDER_STATUS_TRANSITIONS.get(from_status, set()):
+                results[order_id] = {"id": order_id, "success": False, "error": f"Cannot change status from {from_status} to {request.status}"}
+            else:
+                allowed.append(order_id)
         
-        orders = await supabase_request('GET', 'orders', params=params)
+        updated = []
+        if allowed:
+            from_statuses = sorted({current[order_id] for order_id in allowed})
+            updated = await supabase_request('PATCH', 'orders', data=status_update_data(request.status), params={
+                'id': f'in.({",".join(allowed)})',
+                'status': f'in.({",".join(from_statuses)})'
+            }) or []
         
-        # Get payment info for each order
-        for order in (orders or []):
-            payments = await supabase_request('GET', 'payments', params={
-                'order_id': f'eq.{order["id"]}',
-                'select': '*'
-            })
-            if payments:
-                order['payment'] = payments[0]
+        updated_ids = {order['id'] for order in updated}
+        for order_id in allowed:
+            if order_id in updated_ids:
+                results[order_id] = {"id": order_id, "success": True, "status": request.status}
+            else:
+                results[order_id] = {"id": order_id, "success": False, "error": "Order status changed concurrently"}
         
-        return orders or []
+        order_events.publish_many('order_status_changed', [order_event_payload(order) for order in updated])
+        
+        return {
+            "success": len(updated_ids) == len(order_ids),
+            "status": request.status,
+            "updated": len(updated_ids),
+            "results": [results[order_id] for order_id in order_ids],
+        }
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error getting orders: {str(e)}")
+        logging.error(f"Error bulk updating order status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.post("/tap/webhook")
-async def tap_webhook(request: Request):
-    """Handle Tap payment webhook"""
+MAX_ORDER_PAGE_SIZE = 500
+ORDER_COUNT_MODES = ('exact', 'planned', 'estimated')
+
+
+async def attach_payments(orders: list):
+    """Attach the first payment record to each order with a single lookup"""
+    if not orders:
+        return
+    order_ids = ",".join(order['id'] for order in orders)
+    payments = await supabase_request('GET', 'payments', params={
+        'order_id': f'in.({order_ids})',
+        'select': select_columns(PAYMENT_COLUMNS)
+    })
+    payments_by_order = {}
+    for payment in (payments or []):
+        payments_by_order.setdefault(payment['order_id'], payment)
+    for order in orders:
+        if order['id'] in payments_by_order:
+            order['payment'] = payments_by_order[order['id']]
+
+
+ORDER_ITEM_BACKFILL_PAGE = 500
+ORDER_ITEM_BACKFILL_CONCURRENCY = 8
+
+
+@api_router.post("/admin/migrations/order-item-modifiers")
+async def backfill_order_item_modifiers(max_items: int = Query(50000, ge=1, le=1000000), dry_run: bool = False):
+    """Backfill order_items.modifiers from order_item_modifiers rows.
+    
+    Requires the column first:
+        ALTER TABLE order_items ADD COLUMN IF NOT EXISTS modifiers jsonb;
+    Items with a NULL column get their modifier rows as a JSON array ([] when
+    they have none). Only the modifiers column is written, and only while it
+    is still NULL: one PATCH per item with modifiers, one per page for the
+    rest. The old rows are left in place, and reads prefer the column once it
+    is set. Safe to re-run; pass max_items to work in slices.
+    """
+    last_id = NIL_UUID
+    scanned = updated = with_modifiers = 0
+    semaphore = asyncio.Semaphore(ORDER_ITEM_BACKFILL_CONCURRENCY)
+    
+    async def patch(item_ids: list, modifiers: list):
+        async with semaphore:
+            await supabase_send('PATCH', 'order_items', data={'modifiers': modifiers}, params={
+                'id': f'in.({",".join(item_ids)})',
+                'modifiers': 'is.null',
+            }, headers={'Prefer': 'return=minimal'})
+    
     try:
-        data = await request.json()
-        
-        charge_id = data.get('id')
-        status = data.get('status', '').upper()
-        charge_ref = data.get('reference', {}).get('order') or data.get('metadata', {}).get('charge_ref')
-        
-        logging.info(f"Tap webhook received: charge={charge_id}, status={status}, ref={charge_ref}")
-        
-        if charge_ref and status == 'CAPTURED':
-            pending = pending_payments.get(charge_ref)
-            if pending and 'order_data' in pending:
-                # Create order
-                order_request = CreateOrderRequest(**pending['order_data'])
-                await create_order_in_db(
-                    order_request, 
-                    payment_status='paid',
-                    transaction_id=charge_id
-                )
-                del pending_payments[charge_ref]
-                logging.info(f"Order created via webhook for ref {charge_ref}")
-        
-        return {"received": True}
+        while scanned < max_items:
+            items = await supabase_request('GET', 'order_items', params={
+                'select': 'id',
+                'modifiers': 'is.null',
+                'id': f'gt.{last_id}',
+                'order': 'id.asc',
+                'limit': str(min(ORDER_ITEM_BACKFILL_PAGE, max_items - scanned)),
+            }) or []
+            if not items:
+                break
+            scanned += len(items)
+            last_id = items[-1]['id']
+            
+            rows = {}
+            item_ids = [item['id'] for item in items]
+            for start in range(0, len(item_ids), MAX_BULK_ORDERS):
+                for row in await supabase_request('GET', 'order_item_modifiers', params={
+                    'order_item_id': f'in.({",".join(item_ids[start:start + MAX_BULK_ORDERS])})',
+                    'select': ','.join(ORDER_ITEM_MODIFIER_COLUMNS),
+                }) or []:
+                    rows.setdefault(row.pop('order_item_id'), []).append(row)
+            for item in items:
+                item['modifiers'] = rows.get(item['id'], [])
+            with_modifiers += sum(1 for item in items if item['modifiers'])
+            
+            if not dry_run:
+                bare = [item['id'] for item in items if not item['modifiers']]
+                writes = [patch([item['id']], item['modifiers']) for item in items if item['modifiers']]
+                for start in range(0, len(bare), MAX_BULK_ORDERS):
+                    writes.append(patch(bare[start:start + MAX_BULK_ORDERS], []))
+                await asyncio.gather(*writes)
+                updated += len(items)
+            if len(items) < ORDER_ITEM_BACKFILL_PAGE:
+                break
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Webhook error: {str(e)}")
-        return {"received": True}
+        logging.error(f"Error backfilling order item modifiers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logging.info(f"Order item modifier backfill: {scanned} scanned, {updated} updated")
+    return {"dry_run": dry_run, "scanned": scanned, "updated": updated, "with_modifiers": with_modifiers, "last_id": last_id}
 
 
-# ==================== COUPONS ====================
+def order_list_columns() -> tuple:
+    """Columns the admin order lists select, including the summary columns when they are maintained"""
+    return ORDER_COLUMNS + ORDER_SUMMARY_COLUMNS if ORDER_SUMMARY_FIELDS else ORDER_COLUMNS
 
-@api_router.post("/coupons/validate")
-async def validate_coupon(code: str, subtotal: float, customer_id: Optional[str] = None):
-    """Validate a coupon code with comprehensive checks"""
+
+async def attach_list_payments(orders: list):
+    """Payment info for admin lists, read from the summary columns when they are maintained"""
+    if not ORDER_SUMMARY_FIELDS:
+        await attach_payments(orders)
+        return
+    for order in orders:
+        if order.get('payment_method') or order.get('payment_provider') or order.get('transaction_id'):
+            # Same keys as a payments row; the ones the order row does not carry are None
+            order['payment'] = {
+                **dict.fromkeys(PAYMENT_COLUMNS),
+                'order_id': order['id'],
+                'payment_method': order.get('payment_method'),
+                'provider': order.get('payment_provider'),
+                'transaction_id': order.get('transaction_id'),
+            }
+
+
+ORDER_SUMMARY_BACKFILL_PAGE = 500
+ORDER_SUMMARY_BACKFILL_CONCURRENCY = 8
+
+
+@api_router.post("/admin/migrations/order-summaries")
+async def backfill_order_summaries(max_orders: int = Query(50000, ge=1, le=1000000), dry_run: bool = False):
+    """Backfill ORDER_SUMMARY_COLUMNS on orders that predate them.
+    
+    Requires the columns first:
+        ALTER TABLE orders ADD COLUMN IF NOT EXISTS item_count integer,
+            ADD COLUMN IF NOT EXISTS item_names jsonb,
+            ADD COLUMN IF NOT EXISTS payment_method text,
+            ADD COLUMN IF NOT EXISTS payment_provider text;
+    Orders with a NULL item_count are summarized from their items and first
+    payment record (or, without one, from transaction_id), and a missing
+    transaction_id is copied from that payment. Each order gets a
+    PATCH of the summary columns only, so concurrent status updates are not
+    overwritten. Safe to re-run; pass max_orders to work in slices.
+    """
+    last_id = NIL_UUID
+    scanned = updated = 0
+    semaphore = asyncio.Semaphore(ORDER_SUMMARY_BACKFILL_CONCURRENCY)
+    
+    async def patch(order_id: str, summary: dict):
+        async with semaphore:
+            await supabase_send('PATCH', 'orders', data=summary, params={'id': f'eq.{order_id}'}, headers={'Prefer': 'return=minimal'})
+    
+    try:
+        while scanned < max_orders:
+            orders = await supabase_request('GET', 'orders', params={
+                'select': 'id,transaction_id',
+                'tenant_id': f'eq.{TENANT_ID}',
+                'item_count': 'is.null',
+                'id': f'gt.{last_id}',
+                'order': 'id.asc',
+                'limit': str(min(ORDER_SUMMARY_BACKFILL_PAGE, max_orders - scanned)),
+            }) or []
+            if not orders:
+                break
+            scanned += len(orders)
+            last_id = orders[-1]['id']
+            
+            items, payments = {}, {}
+            order_ids = [order['id'] for order in orders]
+            for start in range(0, len(order_ids), MAX_BULK_ORDERS):
+                chunk = ",".join(order_ids[start:start + MAX_BULK_ORDERS])
+                for item in await supabase_request('GET', 'order_items', params={
+                    'order_id': f'in.({chunk})',
+                    'select': 'order_id,item_name_en,item_name_ar,quantity',
+                }) or []:
+                    items.setdefault(item['order_id'], []).append(item)
+                for payment in await supabase_request('GET', 'payments', params={
+                    'order_id': f'in.({chunk})',
+                    'select': 'order_id,payment_method,provider,transaction_id',
+                }) or []:
+                    payments.setdefault(payment['order_id'], payment)
+            
+            summaries = {}
+            for order in orders:
+                payment = payments.get(order['id'])
+                if payment:
+                    method, provider = payment.get('payment_method'), payment.get('provider')
+                elif order.get('transaction_id'):
+                    method, provider = 'online', 'tap'
+                else:
+                    method, provider = 'cash', None
+                summaries[order['id']] = order_summary_fields(items.get(order['id'], []), method, provider)
+                if payment and payment.get('transaction_id') and not order.get('transaction_id'):
+                    summaries[order['id']]['transaction_id'] = payment['transaction_id']
+            
+            if not dry_run:
+                await asyncio.gather(*(patch(order_id, summary) for order_id, summary in summaries.items()))
+                updated += len(summaries)
+            if len(orders) < ORDER_SUMMARY_BACKFILL_PAGE:
+                break
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error backfilling order summaries: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    logging.info(f"Order summary backfill: {scanned} scanned, {updated} updated")
+    return {"dry_run": dry_run, "scanned": scanned, "updated": updated, "last_id": last_id}
+
+
+@api_router.get("/admin/orders")
+async def get_all_orders(
+    response: Response,
+    status: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+    count: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get orders for admin panel with payment info, newest first.
+    
+    With ORDER_SUMMARY_FIELDS on, this reads only the orders table: item
+    count, first item names and payment details come from summary columns.
+    
+    Pages are keyed on (created_at, id): pass the X-Next-Cursor header of a
+    response as ?cursor= to fetch the next page. from/to bound created_at,
+    and ?count=exact|planned|estimated returns the total in X-Total-Count.
+    The first page also carries X-Changes-Cursor for /admin/orders/changes.
+    fields= narrows the returned columns to a subset of ORDER_COLUMNS (plus
+    ORDER_SUMMARY_COLUMNS when enabled).
+    """
+    if count and count not in ORDER_COUNT_MODES:
+        raise HTTPException(status_code=400, detail="count must be one of: exact, planned, estimated")
+    
+    try:
+        limit = max(1, min(limit, MAX_ORDER_PAGE_SIZE))
+        params = {
+            'select': select_columns(order_list_columns(), fields, required=('id', 'created_at')),
+            'order': 'created_at.desc,id.desc',
+            'limit': str(limit + 1),
+            'tenant_id': f'eq.{TENANT_ID}'
+        }
+        
+        if status and status != 'all':
+            params['status'] = f'eq.{status}'
+        
+        range_filter = date_range_filter('created_at', date_from, date_to)
+        if range_filter:
+            params['and'] = range_filter
+        
+        if cursor:
+            position = decode_cursor(cursor, ('created_at', 'id'))
+            params['or'] = keyset_filter('created_at', position['created_at'], position['id'])
+        else:
+            response.headers['X-Changes-Cursor'] = encode_cursor(changes_settle_position())
+        
+        if count:
+            orders, total = await supabase_request_with_count('orders', params, count=count)
+            if total is not None:
+                response.headers['X-Total-Count'] = str(total)
+        else:
+            orders = await supabase_request('GET', 'orders', params=params)
+        orders = orders or []
+        
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            response.headers['X-Next-Cursor'] = encode_cursor({'created_at': last['created_at'], 'id': last['id']})
+        
+        await attach_list_payments(orders)
+        
+        return orders
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting orders: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.get("/admin/orders/stream")
+async def stream_orders(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias='Last-Event-ID'),
+    resume_from: Optional[str] = Query(None, alias='last_event_id'),
+):
+    """Server-Sent Events feed of order_created, order_paid and order_status_changed.
+    
+    Browsers resume automatically through the Last-Event-ID header; ?last_event_id=
+    does the same for clients that cannot set headers. A resync event means
+    the gap could not be replayed and the client should reload the order list.
+    """
+    queue = order_events.subscribe(last_event_id or resume_from)
+    
+    async def event_stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            order_events.unsubscribe(queue)
+    
+    return StreamingResponse(event_stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+# Rows updated within this window may still belong to uncommitted transactions,
+# so change cursors never advance past it and such rows are re-sent next poll.
+ORDER_CHANGES_SETTLE_SECONDS = 5
+NIL_UUID = '00000000-0000-0000-0000-000000000000'
+
+
+def changes_settle_position() -> dict:
+    """Cursor position just before the settle window (sorts ahead of any id at that time)"""
+    settle_point = datetime.now(timezone.utc) - timedelta(seconds=ORDER_CHANGES_SETTLE_SECONDS)
+    return {'updated_at': settle_point.isoformat(), 'id': NIL_UUID}
+
+
+def _position_key(position: dict):
+    return (datetime.fromisoformat(position['updated_at'].replace('Z', '+00:00')), position['id'])
+
+
+async def follow_order_changes(position: dict, params: dict, apply) -> dict:
+    """Page through orders changed after position, awaiting apply(rows) for each page.
+    
+    params holds the select and filters. Returns the new position, which
+    stays behind the settle window so late commits are re-read next time;
+    apply must therefore tolerate seeing a row again.
+    """
+    while True:
+        settle = changes_settle_position()
+        rows = await supabase_request('GET', 'orders', params={
+            **params,
+            'order': 'updated_at.asc,id.asc',
+            'limit': str(MAX_ORDER_PAGE_SIZE),
+            'or': keyset_filter('updated_at', position['updated_at'], position['id'], descending=False),
+        }) or []
+        await apply(rows)
+        if len(rows) < MAX_ORDER_PAGE_SIZE:
+            if rows:
+                last = {'updated_at': rows[-1]['updated_at'], 'id': rows[-1]['id']}
+                position = max(position, min(last, settle, key=_position_key), key=_position_key)
+            return position
+        position = {'updated_at': rows[-1]['updated_at'], 'id': rows[-1]['id']}
+
+
+@api_router.get("/admin/orders/changes")
+async def get_order_changes(since: Optional[str] = None, limit: int = 200, fields: Optional[str] = None):
+    """Get orders created or updated after a changes cursor, oldest change first.
+    
+    Start from the X-Changes-Cursor header of /admin/orders (or omit since to
+    start from now) and pass back the returned cursor on each poll. Orders can
+    be re-sent when they change again or fall inside the settle window, so
+    clients should upsert by id. has_more means another page is ready now.
+    """
+    settle = changes_settle_position()
+    position = decode_cursor(since, ('updated_at', 'id')) if since else settle
+    
+    try:
+        limit = max(1, min(limit, MAX_ORDER_PAGE_SIZE))
+        orders = await supabase_request('GET', 'orders', params={
+            'select': select_columns(order_list_columns(), fields, required=('id', 'updated_at')),
+            'order': 'updated_at.asc,id.asc',
+            'limit': str(limit + 1),
+            'tenant_id': f'eq.{TENANT_ID}',
+            'or': keyset_filter('updated_at', position['updated_at'], position['id'], descending=False),
+        })
+        orders = orders or []
+        
+        has_more = len(orders) > limit
+        if has_more:
+            orders = orders[:limit]
+        
+        next_position = position
+        if orders:
+            last = {'updated_at': orders[-1]['updated_at'], 'id': orders[-1]['id']}
+            next_position = last if has_more else min(last, settle, key=_position_key)
+            if _position_key(next_position) < _position_key(position):
+                next_position = position
+        
+        await attach_list_payments(orders)
+        
+        return {
+            "orders": orders,
+            "cursor": encode_cursor(next_position),
+            "has_more": has_more,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting order changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+EXPORT_PAGE_SIZE = 500
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_FILENAME_UNSAFE = re.compile(r'[^0-9A-Za-z_-]')  # stripped from range bounds in the download filename
+
+
+async def export_order_pages(params: dict, with_payments: bool):
+    """Yield pages of orders oldest first, fetching the next page while the current one is written"""
+    position = None
+    
+    async def fetch(position):
+        page_params = dict(params)
+        if position:
+            page_params['or'] = keyset_filter('created_at', position['created_at'], position['id'], descending=False)
+        rows = await supabase_request('GET', 'orders', params=page_params) or []
+        if with_payments:
+            await attach_payments(rows)
+        return rows
+    
+    pending = asyncio.create_task(fetch(position))
+    try:
+        while True:
+            rows = await pending
+            if len(rows) == EXPORT_PAGE_SIZE:
+                pending = asyncio.create_task(fetch({'created_at': rows[-1]['created_at'], 'id': rows[-1]['id']}))
+            else:
+                pending = None
+            if rows:
+                yield rows
+            if pending is None:
+                return
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+
+def export_csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+@api_router.get("/admin/orders/export")
+async def export_orders(
+    request: Request,
+    format: str = 'ndjson',
+    date_from: Optional[str] = Query(None, alias='from'),
+    date_to: Optional[str] = Query(None, alias='to'),
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+    payments: bool = False,
+    gzip: bool = False,
+):
+    """Stream orders in a created_at range as NDJSON or CSV, oldest first.
+    
+    Orders are read from Supabase in keyset pages and written as they
+    arrive, so memory use does not depend on the size of the range.
+    Output is gzip-compressed on the fly when the client sends
+    Accept-Encoding: gzip, or saved as a .gz file with ?gzip=true.
+    payments=true adds each order's payment record (as JSON text in CSV).
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    if status and status not in ORDER_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    select = select_columns(ORDER_COLUMNS, fields, required=('id', 'created_at'))
+    params = {
+        'select': select,
+        'order': 'created_at.asc,id.asc',
+        'limit': str(EXPORT_PAGE_SIZE),
+        'tenant_id': f'eq.{TENANT_ID}',
+    }
+    if status:
+        params['status'] = f'eq.{status}'
+    range_filter = date_range_filter('created_at', date_from, date_to)
+    if range_filter:
+        params['and'] = range_filter
+    
+    columns = select.split(',') + (['payment'] if payments else [])
+    transfer_gzip = not gzip and 'gzip' in request.headers.get('accept-encoding', '')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip or transfer_gzip else None
+    
+    async def body():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+        if format == 'csv':
+            writer.writeheader()
+        try:
+            async for rows in export_order_pages(params, payments):
+                for row in rows:
+                    if format == 'csv':
+                        writer.writerow({key: export_csv_value(value) for key, value in row.items()})
+                    else:
+                        buffer.write(json.dumps(row, ensure_ascii=False, default=str))
+                        buffer.write('\n')
+                chunk = buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+                yield compressor.compress(chunk) if compressor else chunk
+        except Exception as e:
+            # Headers are already sent. NDJSON ends with an error record; CSV has no room
+            # for one, so the connection is aborted and the client sees a truncated transfer
+            logging.error(f"Order export failed: {str(e)}")
+            if format == 'csv':
+                raise
+            error = (json.dumps({'error': 'Export interrupted'}) + '\n').encode('utf-8')
+            yield compressor.compress(error) if compressor else error
+        if compressor:
+            yield compressor.flush()
+    
+    range_label = '-'.join(EXPORT_FILENAME_UNSAFE.sub('', bound) for bound in (date_from or 'all', date_to or 'now'))
+    filename = f"orders-{range_label}.{format}" + ('.gz' if gzip else '')
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-cache'}
+    if transfer_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    media_type = 'application/gzip' if gzip else EXPORT_FORMATS[format]
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+@api_router.post("/tap/webhook")
+async def tap_webhook(request: Request):
+    """Handle Tap payment webhook"""
+    try:
+        data = await request.json()
+        
+        charge_id = data.get('id')
+        status = data.get('status', '').upper()
+        charge_ref = data.get('reference', {}).get('order') or data.get('metadata', {}).get('charge_ref')
+        
+        logging.info(f"Tap webhook received: charge={charge_id}, status={status}, ref={charge_ref}")
+        
+        if charge_ref and status == 'CAPTURED':
+            pending = pending_payments.get(charge_ref)
+            if pending and 'order_data' in pending:
+                # Create order
+                order_request = CreateOrderRequest(**pending['order_data'])
+                await create_order_in_db(
+                    order_request, 
+                    payment_status='paid',
+                    transaction_id=charge_id
+                )
+                del pending_payments[charge_ref]
+                logging.info(f"Order created via webhook for ref {charge_ref}")
+        
+        return {"received": True}
+    except Exception as e:
+        logging.error(f"Webhook error: {str(e)}")
+        return {"received": True}
+
+
+# ==================== COUPONS ====================
+
+async def evaluate_coupon(code: str, subtotal: float, customer_id: Optional[str] = None) -> dict:
+    """Check a coupon against a subtotal and compute its discount; raises HTTPException if unusable"""
     try:
         # Fetch coupon
         coupons = await supabase_request('GET', 'coupons', params={
             'code': f'eq.{code.upper()}',
             'tenant_id': f'eq.{TENANT_ID}',
             'status': 'eq.active',
-            'select': '*'
+            'select': select_columns(COUPON_COLUMNS)
         })
         
         if not coupons:
@@ -876,29 +2172,33 @@ async def validate_coupon(code: str, subtotal: float, customer_id: Optional[str]
         if subtotal < min_basket:
             raise HTTPException(status_code=400, detail=f"Minimum order amount is {min_basket:.3f} KWD")
         
-        # Check global usage limit
+        # Check global and per-customer usage limits (both lookups run in parallel)
         usage_limit = coupon.get('usage_limit')
-        if usage_limit is not None and usage_limit > 0:
-            usage_count = await supabase_request('GET', 'coupon_usage', params={
+        check_global = usage_limit is not None and usage_limit > 0
+        per_customer_limit = coupon.get('per_customer_limit', 1) or 1
+        check_customer = bool(customer_id) and per_customer_limit > 0
+        
+        usage_count, customer_usage = await asyncio.gather(
+            supabase_request('GET', 'coupon_usage', params={
                 'coupon_id': f'eq.{coupon_id}',
                 'select': 'id'
-            })
+            }) if check_global else asyncio.sleep(0, result=[]),
+            supabase_request('GET', 'coupon_usage', params={
+                'coupon_id': f'eq.{coupon_id}',
+                'customer_id': f'eq.{customer_id}',
+                'select': 'id'
+            }) if check_customer else asyncio.sleep(0, result=[]),
+        )
+        
+        if check_global:
             current_usage = len(usage_count) if usage_count else 0
             if current_usage >= usage_limit:
                 raise HTTPException(status_code=400, detail="Coupon usage limit reached")
         
-        # Check per-customer usage limit
-        if customer_id:
-            per_customer_limit = coupon.get('per_customer_limit', 1) or 1
-            if per_customer_limit > 0:
-                customer_usage = await supabase_request('GET', 'coupon_usage', params={
-                    'coupon_id': f'eq.{coupon_id}',
-                    'customer_id': f'eq.{customer_id}',
-                    'select': 'id'
-                })
-                customer_usage_count = len(customer_usage) if customer_usage else 0
-                if customer_usage_count >= per_customer_limit:
-                    raise HTTPException(status_code=400, detail=f"You have already used this coupon {per_customer_limit} time(s)")
+        if check_customer:
+            customer_usage_count = len(customer_usage) if customer_usage else 0
+            if customer_usage_count >= per_customer_limit:
+                raise HTTPException(status_code=400, detail=f"You have already used this coupon {per_customer_limit} time(s)")
         
         # Calculate discount
         discount_type = coupon.get('discount_type', 'percent')
@@ -933,13 +2233,20 @@ async def validate_coupon(code: str, subtotal: float, customer_id: Optional[str]
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.post("/coupons/validate")
+async def validate_coupon(code: str, subtotal: float, customer_id: Optional[str] = None):
+    """Validate a coupon code with comprehensive checks"""
+    return await evaluate_coupon(code, subtotal, customer_id)
+
+
 @api_router.get("/admin/coupons")
-async def get_coupons():
+async def get_coupons(fields: Optional[str] = None):
     """Get all coupons"""
+    select = select_columns(COUPON_COLUMNS, fields)
     try:
         coupons = await supabase_request('GET', 'coupons', params={
             'tenant_id': f'eq.{TENANT_ID}',
-            'select': '*',
+            'select': select,
             'order': 'created_at.desc'
         })
         return coupons or []
@@ -1016,12 +2323,13 @@ async def delete_coupon(coupon_id: str):
 # ==================== LOYALTY ====================
 
 @api_router.get("/loyalty/settings")
-async def get_loyalty_settings():
+async def get_loyalty_settings(fields: Optional[str] = None):
     """Get loyalty settings"""
+    select = select_columns(LOYALTY_SETTINGS_COLUMNS, fields)
     try:
         settings = await supabase_request('GET', 'loyalty_settings', params={
             'tenant_id': f'eq.{TENANT_ID}',
-            'select': '*'
+            'select': select
         })
         
         if settings and len(settings) > 0:
@@ -1068,31 +2376,298 @@ async def save_loyalty_settings(settings: LoyaltySettings):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== MENU CACHE ====================
+
+MENU_LANGUAGES = ('en', 'ar')
+LOCALIZED_FIELDS = ('name', 'description')
+# Menu rows are also edited directly in Supabase by the admin panel, so
+# cached responses expire even without an invalidate() from this API.
+MENU_CACHE_TTL_SECONDS = 300
+
+
+class MenuCache:
+    """Serialized public menu responses, precomputed for every language.
+    
+    Entries are keyed by (endpoint, query) and hold one body + ETag per
+    language (None = the bilingual payload). invalidate() bumps the menu
+    version, dropping all entries; loads that started under an older
+    version are not stored.
+    """
+    
+    def __init__(self, ttl: float = MENU_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.version = 1
+        self._entries = {}
+    
+    def get(self, key: tuple, lang: Optional[str]):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry['loaded_at'] > self.ttl:
+            return None
+        return entry['responses'][lang]
+    
+    def put(self, key: tuple, rows: list, version: int, lang: Optional[str]):
+        responses = {}
+        for language in (None,) + MENU_LANGUAGES:
+            body = json.dumps(localize_menu_rows(rows, language), default=str, ensure_ascii=False, separators=(',', ':')).encode()
+            etag = f'"{language or "all"}-{self.version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+            responses[language] = (body, etag)
+        if version == self.version:
+            self._entries[key] = {'loaded_at': time.monotonic(), 'responses': responses}
+        return responses[lang]
+    
+    def invalidate(self):
+        self.version += 1
+        self._entries.clear()
+
+
+menu_cache = MenuCache()
+
+
+def localize_menu_rows(rows: list, lang: Optional[str]) -> list:
+    """Replace name_en/name_ar style pairs with a single field in lang (falling back to English)"""
+    if lang is None:
+        return rows
+    localized = []
+    for row in rows:
+        row = dict(row)
+        for field in LOCALIZED_FIELDS:
+            en_key, ar_key = f'{field}_en', f'{field}_ar'
+            if en_key in row or ar_key in row:
+                value_en = row.pop(en_key, None)
+                value_ar = row.pop(ar_key, None)
+                row[field] = (value_ar or value_en) if lang == 'ar' else value_en
+        if isinstance(row.get('modifiers'), list):
+            row['modifiers'] = localize_menu_rows(row['modifiers'], lang)
+        localized.append(row)
+    return localized
+
+
+def menu_language(lang: Optional[str]) -> Optional[str]:
+    if lang is not None and lang not in MENU_LANGUAGES:
+        raise HTTPException(status_code=400, detail="lang must be 'en' or 'ar'")
+    return lang
+
+
+async def cached_menu_response(request: Request, key: tuple, lang: Optional[str], load) -> Response:
+    """Serve a menu response from menu_cache, calling load() for the rows on a miss"""
+    cached = menu_cache.get(key, lang)
+    if cached is None:
+        version = menu_cache.version
+        rows = await load()
+        cached = menu_cache.put(key, rows or [], version, lang)
+    body, etag = cached
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=60', 'Vary': 'Accept-Encoding'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+def tenant_modifier_params(select: str, **filters) -> dict:
+    """Params for a modifiers / item_modifier_groups read limited to this tenant's groups.
+    
+    Neither table carries tenant_id, so the rows are joined to their
+    modifier group with an inner embed and filtered on the group's tenant.
+    """
+    return {
+        **filters,
+        'modifier_groups.tenant_id': f'eq.{TENANT_ID}',
+        'select': f'{select},modifier_groups!inner(tenant_id)'
+    }
+
+
+# ==================== MENU SEARCH ====================
+
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+})
+SEARCH_TOKEN = re.compile(r'\w+')
+# Attached Arabic article forms ("the", "with the", "and the", ...), longest first
+ARABIC_ARTICLE_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+SEARCH_ITEM_COLUMNS = ('id', 'category_id', 'name_en', 'name_ar', 'description_en', 'description_ar', 'image_url', 'base_price')
+SEARCH_MODIFIER_COLUMNS = ('id', 'modifier_group_id', 'name_en', 'name_ar', 'price')
+# Field weights: a name match outranks a description match
+SEARCH_FIELD_WEIGHTS = {'name_en': 3.0, 'name_ar': 3.0, 'description_en': 1.0, 'description_ar': 1.0}
+
+
+def normalize_search_text(text: str) -> str:
+    """Casefold and fold Arabic spelling variants (hamza/alef, ya, ta marbuta, diacritics)"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = ARABIC_DIACRITICS.sub('', text)
+    return text.translate(ARABIC_LETTER_MAP)
+
+
+def strip_arabic_article(token: str) -> str:
+    for prefix in ARABIC_ARTICLE_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def search_tokens(text: str) -> list:
+    return [strip_arabic_article(token) for token in SEARCH_TOKEN.findall(normalize_search_text(text))]
+
+
+class MenuSearchIndex:
+    """In-memory inverted index over active items and modifiers in English and Arabic.
+    
+    Postings map each normalized token to {doc key: field weight}; a sorted
+    token list serves prefix matches with bisect. Admin item/modifier
+    endpoints update documents in place, and a full rebuild from Supabase
+    runs in the background once the index is older than the menu cache TTL.
+    """
+    
+    def __init__(self, ttl: float = MENU_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.loaded_at = None
+        self._docs = {}
+        self._doc_tokens = {}
+        self._postings = {}
+        self._sorted_tokens = []
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+    
+    def rebuild(self, items: list, modifiers: list):
+        self._docs, self._doc_tokens, self._postings, self._sorted_tokens = {}, {}, {}, []
+        for item in items:
+            self._add('item', item)
+        for modifier in modifiers:
+            self._add('modifier', modifier)
+        self._sorted_tokens = sorted(self._postings)
+        self.loaded_at = time.monotonic()
+    
+    def upsert(self, kind: str, row: dict):
+        self.remove(kind, row['id'])
+        if row.get('status', 'active') == 'active':
+            for token in self._add(kind, row):
+                index = bisect.bisect_left(self._sorted_tokens, token)
+                if index == len(self._sorted_tokens) or self._sorted_tokens[index] != token:
+                    self._sorted_tokens.insert(index, token)
+    
+    def remove(self, kind: str, doc_id: str):
+        key = (kind, doc_id)
+        self._docs.pop(key, None)
+        for token in self._doc_tokens.pop(key, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                index = bisect.bisect_left(self._sorted_tokens, token)
+                if index < len(self._sorted_tokens) and self._sorted_tokens[index] == token:
+                    del self._sorted_tokens[index]
+    
+    def _add(self, kind: str, row: dict) -> set:
+        key = (kind, row['id'])
+        columns = SEARCH_ITEM_COLUMNS if kind == 'item' else SEARCH_MODIFIER_COLUMNS
+        self._docs[key] = {'type': kind, **{column: row.get(column) for column in columns}}
+        tokens = set()
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            for token in search_tokens(row.get(field) or ''):
+                postings = self._postings.setdefault(token, {})
+                postings[key] = max(postings.get(key, 0), weight)
+                tokens.add(token)
+        self._doc_tokens[key] = tokens
+        return tokens
+    
+    def _prefix_tokens(self, prefix: str) -> list:
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        end = bisect.bisect_left(self._sorted_tokens, prefix + '\uffff')
+        return self._sorted_tokens[start:end]
+    
+    def search(self, query: str, limit: int = 20) -> list:
+        """Rank docs matching every query token exactly or by prefix"""
+        scores = None
+        for query_token in search_tokens(query):
+            token_scores = {}
+            for token in self._prefix_tokens(query_token):
+                # Exact matches score the full field weight, prefixes in proportion to coverage
+                factor = 2.0 if token == query_token else len(query_token) / len(token)
+                for key, weight in self._postings[token].items():
+                    token_scores[key] = max(token_scores.get(key, 0), weight * factor)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+            if not scores:
+                return []
+        if not scores:
+            return []
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda entry: (-entry[1], entry[0][0] != 'item', self._docs[entry[0]].get('name_en') or ''))
+        return [{**self._docs[key], 'score': round(score, 3)} for key, score in ranked]
+    
+    async def ensure_loaded(self):
+        """Load on first use; afterwards refresh in the background when stale"""
+        if self.loaded_at is None:
+            async with self._lock:
+                if self.loaded_at is None:
+                    await self.refresh()
+        elif time.monotonic() - self.loaded_at > self.ttl and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+    
+    async def refresh(self):
+        try:
+            items, modifiers = await asyncio.gather(
+                supabase_request('GET', 'items', params={
+                    'tenant_id': f'eq.{TENANT_ID}',
+                    'status': 'eq.active',
+                    'select': ','.join(SEARCH_ITEM_COLUMNS)
+                }),
+                supabase_request('GET', 'modifiers', params=tenant_modifier_params(
+                    ','.join(SEARCH_MODIFIER_COLUMNS), status='eq.active'
+                )),
+            )
+            self.rebuild(items or [], modifiers or [])
+            logging.info(f"Menu search index rebuilt: {len(self._docs)} docs, {len(self._postings)} tokens")
+        except Exception as e:
+            logging.error(f"Error rebuilding menu search index: {str(e)}")
+
+
+menu_search_index = MenuSearchIndex()
+
+
+@api_router.get("/menu/search")
+async def search_menu(q: str, limit: int = 20, lang: Optional[str] = None):
+    """Search items and modifiers by English or Arabic name/description, with prefix matching"""
+    lang = menu_language(lang)
+    await menu_search_index.ensure_loaded()
+    results = menu_search_index.search(q, limit=max(1, min(limit, 100)))
+    return localize_menu_rows(results, lang)
+
+
 # ==================== MENU ====================
 
 @api_router.get("/menu/categories")
-async def get_categories():
-    """Get menu categories"""
-    try:
-        categories = await supabase_request('GET', 'categories', params={
+async def get_categories(request: Request, fields: Optional[str] = None, lang: Optional[str] = None):
+    """Get menu categories (?lang=en|ar returns a single name/description)"""
+    select = select_columns(MENU_CATEGORY_COLUMNS, fields)
+    lang = menu_language(lang)
+    
+    async def load():
+        return await supabase_request('GET', 'categories', params={
             'tenant_id': f'eq.{TENANT_ID}',
             'status': 'eq.active',
-            'select': '*',
+            'select': select,
             'order': 'sort_order.asc'
         })
-        return categories or []
+    
+    try:
+        return await cached_menu_response(request, ('categories', select), lang, load)
     except Exception as e:
         logging.error(f"Error getting categories: {str(e)}")
         return []
 
 
 @api_router.get("/admin/categories")
-async def get_all_categories():
+async def get_all_categories(fields: Optional[str] = None):
     """Get all categories for admin"""
+    select = select_columns(ADMIN_MENU_CATEGORY_COLUMNS, fields)
     try:
         categories = await supabase_request('GET', 'categories', params={
             'tenant_id': f'eq.{TENANT_ID}',
-            'select': '*',
+            'select': select,
             'order': 'sort_order.asc'
         })
         return categories or []
@@ -1111,6 +2686,7 @@ async def create_category(category: CategoryCreate):
             **category.dict()
         }
         result = await supabase_request('POST', 'categories', data=category_data)
+        menu_cache.invalidate()
         return result[0] if result else category_data
     except Exception as e:
         logging.error(f"Error creating category: {str(e)}")
@@ -1122,6 +2698,7 @@ async def update_category(category_id: str, category: CategoryCreate):
     """Update a category"""
     try:
         await supabase_request('PATCH', 'categories', data=category.dict(), params={'id': f'eq.{category_id}'})
+        menu_cache.invalidate()
         return {"success": True}
     except Exception as e:
         logging.error(f"Error updating category: {str(e)}")
@@ -1133,6 +2710,7 @@ async def delete_category(category_id: str):
     """Delete a category"""
     try:
         await supabase_request('DELETE', 'categories', params={'id': f'eq.{category_id}'})
+        menu_cache.invalidate()
         return {"success": True}
     except Exception as e:
         logging.error(f"Error deleting category: {str(e)}")
@@ -1140,33 +2718,39 @@ async def delete_category(category_id: str):
 
 
 @api_router.get("/menu/items")
-async def get_menu_items(category_id: Optional[str] = None):
-    """Get menu items"""
-    try:
+async def get_menu_items(request: Request, category_id: Optional[str] = None, fields: Optional[str] = None, lang: Optional[str] = None):
+    """Get menu items (?lang=en|ar returns a single name/description)"""
+    select = select_columns(MENU_ITEM_COLUMNS, fields)
+    lang = menu_language(lang)
+    
+    async def load():
         params = {
             'tenant_id': f'eq.{TENANT_ID}',
             'status': 'eq.active',
-            'select': '*',
+            'select': select,
             'order': 'sort_order.asc'
         }
         
         if category_id and category_id != 'all':
             params['category_id'] = f'eq.{category_id}'
         
-        items = await supabase_request('GET', 'items', params=params)
-        return items or []
+        return await supabase_request('GET', 'items', params=params)
+    
+    try:
+        return await cached_menu_response(request, ('items', select, category_id or 'all'), lang, load)
     except Exception as e:
         logging.error(f"Error getting menu items: {str(e)}")
         return []
 
 
 @api_router.get("/admin/items")
-async def get_all_items():
+async def get_all_items(fields: Optional[str] = None):
     """Get all items for admin"""
+    select = select_columns(ADMIN_MENU_ITEM_COLUMNS, fields)
     try:
         items = await supabase_request('GET', 'items', params={
             'tenant_id': f'eq.{TENANT_ID}',
-            'select': '*',
+            'select': select,
             'order': 'sort_order.asc'
         })
         return items or []
@@ -1185,6 +2769,8 @@ async def create_item(item: ItemCreate):
             **item.dict()
         }
         result = await supabase_request('POST', 'items', data=item_data)
+        menu_cache.invalidate()
+        menu_search_index.upsert('item', result[0] if result else item_data)
         return result[0] if result else item_data
     except Exception as e:
         logging.error(f"Error creating item: {str(e)}")
@@ -1195,7 +2781,10 @@ async def create_item(item: ItemCreate):
 async def update_item(item_id: str, item: ItemCreate):
     """Update an item"""
     try:
-        await supabase_request('PATCH', 'items', data=item.dict(), params={'id': f'eq.{item_id}'})
+        updated = await supabase_request('PATCH', 'items', data=item.dict(), params={'id': f'eq.{item_id}'})
+        menu_cache.invalidate()
+        for row in (updated or []):
+            menu_search_index.upsert('item', row)
         return {"success": True}
     except Exception as e:
         logging.error(f"Error updating item: {str(e)}")
@@ -1207,6 +2796,8 @@ async def delete_item(item_id: str):
     """Delete an item"""
     try:
         await supabase_request('DELETE', 'items', params={'id': f'eq.{item_id}'})
+        menu_cache.invalidate()
+        menu_search_index.remove('item', item_id)
         return {"success": True}
     except Exception as e:
         logging.error(f"Error deleting item: {str(e)}")
@@ -1216,12 +2807,13 @@ async def delete_item(item_id: str):
 # ==================== MODIFIERS ====================
 
 @api_router.get("/admin/modifier-groups")
-async def get_modifier_groups():
+async def get_modifier_groups(fields: Optional[str] = None):
     """Get all modifier groups"""
+    select = select_columns(ADMIN_MODIFIER_GROUP_COLUMNS, fields)
     try:
         groups = await supabase_request('GET', 'modifier_groups', params={
             'tenant_id': f'eq.{TENANT_ID}',
-            'select': '*',
+            'select': select,
             'order': 'sort_order.asc'
         })
         return groups or []
@@ -1240,6 +2832,7 @@ async def create_modifier_group(group: ModifierGroupCreate):
             **group.dict()
         }
         result = await supabase_request('POST', 'modifier_groups', data=group_data)
+        menu_cache.invalidate()
         return result[0] if result else group_data
     except Exception as e:
         logging.error(f"Error creating modifier group: {str(e)}")
@@ -1251,6 +2844,7 @@ async def update_modifier_group(group_id: str, group: ModifierGroupCreate):
     """Update a modifier group"""
     try:
         await supabase_request('PATCH', 'modifier_groups', data=group.dict(), params={'id': f'eq.{group_id}'})
+        menu_cache.invalidate()
         return {"success": True}
     except Exception as e:
         logging.error(f"Error updating modifier group: {str(e)}")
@@ -1262,6 +2856,7 @@ async def delete_modifier_group(group_id: str):
     """Delete a modifier group"""
     try:
         await supabase_request('DELETE', 'modifier_groups', params={'id': f'eq.{group_id}'})
+        menu_cache.invalidate()
         return {"success": True}
     except Exception as e:
         logging.error(f"Error deleting modifier group: {str(e)}")
@@ -1269,10 +2864,11 @@ async def delete_modifier_group(group_id: str):
 
 
 @api_router.get("/admin/modifiers")
-async def get_modifiers(group_id: Optional[str] = None):
+async def get_modifiers(group_id: Optional[str] = None, fields: Optional[str] = None):
     """Get modifiers"""
+    select = select_columns(ADMIN_MODIFIER_COLUMNS, fields)
     try:
-        params = {'select': '*', 'order': 'sort_order.asc'}
+        params = {'select': select, 'order': 'sort_order.asc'}
         if group_id:
             params['modifier_group_id'] = f'eq.{group_id}'
         
@@ -1292,6 +2888,8 @@ async def create_modifier(modifier: ModifierCreate):
             **modifier.dict()
         }
         result = await supabase_request('POST', 'modifiers', data=modifier_data)
+        menu_cache.invalidate()
+        menu_search_index.upsert('modifier', result[0] if result else modifier_data)
         return result[0] if result else modifier_data
     except Exception as e:
         logging.error(f"Error creating modifier: {str(e)}")
@@ -1302,7 +2900,10 @@ async def create_modifier(modifier: ModifierCreate):
 async def update_modifier(modifier_id: str, modifier: ModifierCreate):
     """Update a modifier"""
     try:
-        await supabase_request('PATCH', 'modifiers', data=modifier.dict(), params={'id': f'eq.{modifier_id}'})
+        updated = await supabase_request('PATCH', 'modifiers', data=modifier.dict(), params={'id': f'eq.{modifier_id}'})
+        menu_cache.invalidate()
+        for row in (updated or []):
+            menu_search_index.upsert('modifier', row)
         return {"success": True}
     except Exception as e:
         logging.error(f"Error updating modifier: {str(e)}")
@@ -1314,6 +2915,8 @@ async def delete_modifier(modifier_id: str):
     """Delete a modifier"""
     try:
         await supabase_request('DELETE', 'modifiers', params={'id': f'eq.{modifier_id}'})
+        menu_cache.invalidate()
+        menu_search_index.remove('modifier', modifier_id)
         return {"success": True}
     except Exception as e:
         logging.error(f"Error deleting modifier: {str(e)}")
@@ -1321,12 +2924,15 @@ async def delete_modifier(modifier_id: str):
 
 
 @api_router.get("/menu/items/{item_id}/modifiers")
-async def get_item_modifiers(item_id: str):
-    """Get all modifier groups and modifiers for an item"""
-    try:
+async def get_item_modifiers(request: Request, item_id: str, fields: Optional[str] = None, lang: Optional[str] = None):
+    """Get all modifier groups and modifiers for an item (fields= narrows the modifier columns, ?lang=en|ar localizes)"""
+    modifier_select = select_columns(MODIFIER_COLUMNS, fields)
+    lang = menu_language(lang)
+    
+    async def load():
         links = await supabase_request('GET', 'item_modifier_groups', params={
             'item_id': f'eq.{item_id}',
-            'select': '*',
+            'select': 'modifier_group_id',
             'order': 'sort_order.asc'
         })
         
@@ -1338,7 +2944,7 @@ async def get_item_modifiers(item_id: str):
         groups = await supabase_request('GET', 'modifier_groups', params={
             'id': f'in.({",".join(group_ids)})',
             'status': 'eq.active',
-            'select': '*'
+            'select': select_columns(MODIFIER_GROUP_COLUMNS)
         })
         
         result = []
@@ -1346,7 +2952,7 @@ async def get_item_modifiers(item_id: str):
             modifiers = await supabase_request('GET', 'modifiers', params={
                 'modifier_group_id': f'eq.{group["id"]}',
                 'status': 'eq.active',
-                'select': '*',
+                'select': modifier_select,
                 'order': 'sort_order.asc'
             })
             
@@ -1356,40 +2962,2721 @@ async def get_item_modifiers(item_id: str):
             })
         
         return result
+    
+    try:
+        return await cached_menu_response(request, ('item_modifiers', item_id, modifier_select), lang, load)
     except Exception as e:
         logging.error(f"Error getting item modifiers: {str(e)}")
         return []
 
 
-# ==================== DELIVERY ZONES ====================
+# ==================== MENU IMPORT ====================
 
-@api_router.get("/delivery-zones")
-async def get_delivery_zones():
-    """Get all delivery zones"""
-    try:
-        zones = await supabase_request('GET', 'delivery_zones', params={
-            'branch_id': f'eq.{BRANCH_ID}',
-            'status': 'eq.active',
-            'select': '*'
-        })
-        return zones or []
-    except Exception as e:
-        logging.error(f"Error getting delivery zones: {str(e)}")
-        return []
+# Sections in write order (parents before the rows that reference them)
+MENU_IMPORT_SECTIONS = {
+    'categories': CategoryCreate,
+    'modifier_groups': ModifierGroupCreate,
+    'items': ItemCreate,
+    'modifiers': ModifierCreate,
+}
+MENU_IMPORT_CSV_TYPES = {'category': 'categories', 'modifier_group': 'modifier_groups', 'item': 'items', 'modifier': 'modifiers'}
+# Columns that name a parent instead of giving its id, per section
+MENU_IMPORT_REFERENCES = {
+    'items': {'category': ('category_id', 'categories'), 'modifier_groups': (None, 'modifier_groups')},
+    'modifiers': {'modifier_group': ('modifier_group_id', 'modifier_groups')},
+}
+# Read-only columns tolerated (and ignored) so admin list exports can be re-imported
+MENU_IMPORT_IGNORED = ('tenant_id', 'created_at', 'updated_at')
+MENU_IMPORT_MAX_ROWS = 5000
+MENU_IMPORT_CHUNK = 500
+MENU_REORDER_CONCURRENCY = 8
 
 
-@api_router.get("/admin/delivery-zones")
-async def get_all_delivery_zones():
-    """Get all delivery zones for admin"""
-    try:
-        zones = await supabase_request('GET', 'delivery_zones', params={
-            'branch_id': f'eq.{BRANCH_ID}',
-            'select': '*'
-        })
-        return zones or []
-    except Exception as e:
-        logging.error(f"Error getting delivery zones: {str(e)}")
-        return []
+def menu_name_key(name) -> str:
+    return ' '.join(str(name or '').split()).casefold()
+
+
+def menu_natural_key(section: str, row: dict) -> tuple:
+    """How an imported row without an id is matched to an existing one"""
+    if section == 'items':
+        return (row.get('category_id'), menu_name_key(row.get('name_en')))
+    if section == 'modifiers':
+        return (row.get('modifier_group_id'), menu_name_key(row.get('name_en')))
+    return (menu_name_key(row.get('name_en')),)
+
+
+async def load_menu_for_import() -> dict:
+    """Existing menu rows by section, including inactive ones"""
+    params = {'tenant_id': f'eq.{TENANT_ID}', 'select': '*'}
+    categories, groups, items = await asyncio.gather(
+        supabase_request('GET', 'categories', params=params),
+        supabase_request('GET', 'modifier_groups', params=params),
+        supabase_request('GET', 'items', params=params),
+    )
+    group_ids = [group['id'] for group in groups or []]
+    modifiers = []
+    for start in range(0, len(group_ids), MAX_BULK_ORDERS):
+        modifiers.extend(await supabase_request('GET', 'modifiers', params={
+            'modifier_group_id': f'in.({",".join(group_ids[start:start + MAX_BULK_ORDERS])})',
+            'select': '*',
+        }) or [])
+    return {'categories': categories or [], 'modifier_groups': groups or [], 'items': items or [], 'modifiers': modifiers}
+
+
+def parse_menu_csv(text: str) -> dict:
+    """Sections from a CSV with a type column (category, item, modifier_group, modifier).
+    
+    Rows are tagged with their line number; empty cells are left out so they
+    keep the existing value on update.
+    """
+    sections = {section: [] for section in MENU_IMPORT_SECTIONS}
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'type' not in reader.fieldnames:
+        raise HTTPException(status_code=400, detail="CSV needs a header row with a type column")
+    for record in reader:
+        row = {key.strip(): value.strip() for key, value in record.items() if key and value not in (None, '') and value.strip()}
+        row_type = row.pop('type', '')
+        row['_row'] = reader.line_num
+        if row_type not in MENU_IMPORT_CSV_TYPES:
+            sections.setdefault('_invalid', []).append(row)
+            continue
+        if 'modifier_groups' in row:
+            row['modifier_groups'] = [name.strip() for name in row['modifier_groups'].split('|') if name.strip()]
+        sections[MENU_IMPORT_CSV_TYPES[row_type]].append(row)
+    return sections
+
+
+async def import_menu(sections: dict, dry_run: bool = False) -> dict:
+    """Validate and upsert menu rows in bulk.
+    
+    sections maps section name to rows. A row updates the existing row with
+    its id, or else the one with the same natural key (name_en, within its
+    category / modifier group for items and modifiers), or is created.
+    Parents can be referenced by id or by name_en (category, modifier_group,
+    and modifier_groups on items, which replaces the item's group links); a
+    name shared by several rows is an error, as is an id this tenant does
+    not have. Every row is validated before anything is written; any error
+    rejects the whole import with a 422 listing the failing rows.
+    """
+    errors = []
+    for row in sections.pop('_invalid', []):
+        errors.append({'section': None, 'row': row['_row'], 'error': f"type must be one of: {', '.join(MENU_IMPORT_CSV_TYPES)}"})
+    total = sum(len(rows) for rows in sections.values())
+    if total > MENU_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {MENU_IMPORT_MAX_ROWS} rows per import")
+    
+    existing = await load_menu_for_import()
+    ids = {section: {row['id'] for row in rows} for section, rows in existing.items()}
+    names = {section: {} for section in existing}  # name key -> ids with that name_en
+    for section, rows in existing.items():
+        for row in rows:
+            names[section].setdefault(menu_name_key(row.get('name_en')), set()).add(row['id'])
+    resolved = {section: [] for section in MENU_IMPORT_SECTIONS}
+    created = {section: 0 for section in MENU_IMPORT_SECTIONS}
+    links = {}
+    
+    for section, model in MENU_IMPORT_SECTIONS.items():
+        by_id = {row['id']: row for row in existing[section]}
+        by_key = {menu_natural_key(section, row): row for row in existing[section]}
+        seen, seen_ids = set(), set()
+        references = MENU_IMPORT_REFERENCES.get(section, {})
+        
+        for index, raw in enumerate(sections.get(section) or []):
+            raw = {key: value for key, value in raw.items() if key not in MENU_IMPORT_IGNORED}
+            row_number = raw.pop('_row', index)
+            
+            def fail(message, row_number=row_number, section=section):
+                errors.append({'section': section, 'row': row_number, 'error': message})
+            
+            unknown = [key for key in raw if key != 'id' and key not in model.model_fields and key not in references]
+            if unknown:
+                fail(f"Unknown fields: {', '.join(sorted(unknown))}")
+                continue
+            
+            fields = {key: value for key, value in raw.items() if value is not None}
+            group_links = None
+            failed = False
+            for column, (target, parent) in references.items():
+                if column not in fields:
+                    continue
+                value = fields.pop(column)
+                label = 'modifier group' if target is None else column.replace('_', ' ')
+                values = value if isinstance(value, list) else [value]
+                parent_ids = []
+                for ref in values:
+                    matches = {ref} if target is None and ref in ids[parent] else names[parent].get(menu_name_key(ref), set())
+                    if len(matches) > 1:
+                        fail(f"Ambiguous {label}: {len(matches)} rows are named {ref}; reference it by id")
+                        failed = True
+                    elif not matches:
+                        fail(f"Unknown {label}: {ref}")
+                        failed = True
+                    parent_ids.append(next(iter(matches), None))
+                if target is None:
+                    group_links = parent_ids
+                else:
+                    fields[target] = parent_ids[0]
+            for column, (target, parent) in references.items():
+                if target and fields.get(target) and fields[target] not in ids[parent]:
+                    fail(f"Unknown {target}: {fields[target]}")
+                    failed = True
+            if failed:
+                continue
+            
+            row_id = fields.pop('id', None)
+            current = by_id.get(row_id) if row_id else None
+            if row_id and not current:
+                # Never upsert onto an id outside this tenant's menu
+                fail(f"Unknown id: {row_id}")
+                continue
+            base = {key: current[key] for key in model.model_fields if current and key in current}
+            if not current and not row_id:
+                # Match on the natural key once parent references are resolved
+                match = by_key.get(menu_natural_key(section, fields))
+                if match:
+                    current = match
+                    base = {key: match[key] for key in model.model_fields if key in match}
+            try:
+                validated = model(**{**base, **fields}).dict()
+            except ValidationError as e:
+                for error in e.errors():
+                    fail(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}")
+                continue
+            
+            row = {'id': row_id or (current['id'] if current else str(uuid.uuid4())), **validated}
+            key = menu_natural_key(section, validated)
+            if key in seen or row['id'] in seen_ids:
+                fail(f"Duplicate row for {validated['name_en']}")
+                continue
+            seen.add(key)
+            seen_ids.add(row['id'])
+
+            if section != 'modifiers':
+                row['tenant_id'] = TENANT_ID
+            if not current:
+                created[section] += 1
+            resolved[section].append(row)
+            ids[section].add(row['id'])
+            names[section].setdefault(menu_name_key(row['name_en']), set()).add(row['id'])
+            if group_links is not None:
+                links[row['id']] = group_links
+    
+    if errors:
+        raise HTTPException(status_code=422, detail={"errors": errors})
+    
+    summary = {
+        "dry_run": dry_run,
+        "created": created,
+        "updated": {section: len(rows) - created[section] for section, rows in resolved.items()},
+        "links": sum(len(group_ids) for group_ids in links.values()),
+    }
+    if dry_run:
+        return summary
+    
+    written = False
+    try:
+        for section, rows in resolved.items():
+            for start in range(0, len(rows), MENU_IMPORT_CHUNK):
+                await supabase_send('POST', section, data=rows[start:start + MENU_IMPORT_CHUNK], params={'on_conflict': 'id'}, headers={
+                    'Prefer': 'resolution=merge-duplicates,return=minimal',
+                })
+                written = True
+        
+        item_ids = list(links)
+        for start in range(0, len(item_ids), MAX_BULK_ORDERS):
+            await supabase_send('DELETE', 'item_modifier_groups', params={
+                'item_id': f'in.({",".join(item_ids[start:start + MAX_BULK_ORDERS])})',
+            }, headers={'Prefer': 'return=minimal'})
+        link_rows = [
+            {'item_id': item_id, 'modifier_group_id': group_id, 'sort_order': position}
+            for item_id, group_ids in links.items()
+            for position, group_id in enumerate(group_ids)
+        ]
+        for start in range(0, len(link_rows), MENU_IMPORT_CHUNK):
+            await supabase_send('POST', 'item_modifier_groups', data=link_rows[start:start + MENU_IMPORT_CHUNK], headers={'Prefer': 'return=minimal'})
+    finally:
+        if written or links:
+            menu_cache.invalidate()
+            for row in resolved['items']:
+                menu_search_index.upsert('item', row)
+            for row in resolved['modifiers']:
+                menu_search_index.upsert('modifier', row)
+    
+    logging.info(f"Menu import: {summary}")
+    return {"success": True, **summary}
+
+
+@api_router.post("/admin/menu/import")
+async def import_menu_endpoint(request: Request, dry_run: bool = False):
+    """Import a menu from JSON (MenuImportRequest) or CSV (Content-Type: text/csv).
+    
+    CSV rows carry a type column (category, item, modifier_group, modifier)
+    plus that type's fields; items name their category in a category column
+    and their modifier groups as a |-separated modifier_groups column.
+    Row numbers in errors are CSV line numbers or list indexes.
+    """
+    content_type = request.headers.get('content-type', '')
+    if 'csv' in content_type:
+        sections = parse_menu_csv((await request.body()).decode('utf-8-sig'))
+    else:
+        try:
+            sections = MenuImportRequest(**await request.json()).dict()
+        except (ValueError, TypeError, ValidationError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid import body: {e}")
+    
+    try:
+        return await import_menu(sections, dry_run=dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error importing menu: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def bulk_upsert_section(section: str, rows: List[dict], dry_run: bool) -> dict:
+    try:
+        return await import_menu({section: rows}, dry_run=dry_run)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error bulk upserting {section}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/admin/categories/bulk")
+async def bulk_upsert_categories(rows: List[dict], dry_run: bool = False):
+    """Create or update categories in one request (see import_menu)"""
+    return await bulk_upsert_section('categories', rows, dry_run)
+
+
+@api_router.post("/admin/items/bulk")
+async def bulk_upsert_items(rows: List[dict], dry_run: bool = False):
+    """Create or update items in one request (see import_menu)"""
+    return await bulk_upsert_section('items', rows, dry_run)
+
+
+@api_router.post("/admin/modifier-groups/bulk")
+async def bulk_upsert_modifier_groups(rows: List[dict], dry_run: bool = False):
+    """Create or update modifier groups in one request (see import_menu)"""
+    return await bulk_upsert_section('modifier_groups', rows, dry_run)
+
+
+@api_router.post("/admin/modifiers/bulk")
+async def bulk_upsert_modifiers(rows: List[dict], dry_run: bool = False):
+    """Create or update modifiers in one request (see import_menu)"""
+    return await bulk_upsert_section('modifiers', rows, dry_run)
+
+
+async def reorder_menu_rows(table: str, ids: List[str]) -> dict:
+    """Set sort_order to each id's position in ids, writing only rows whose value changes.
+    
+    Each changed row gets a PATCH of sort_order alone, a few at a time, so
+    concurrent edits to other columns are never overwritten.
+    """
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="ids must not repeat")
+    if len(ids) > MENU_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"At most {MENU_IMPORT_MAX_ROWS} ids per request")
+    
+    try:
+        rows = []
+        for start in range(0, len(ids), MAX_BULK_ORDERS):
+            chunk = f'in.({",".join(ids[start:start + MAX_BULK_ORDERS])})'
+            if table == 'modifiers':
+                params = tenant_modifier_params('id,sort_order', id=chunk)
+            else:
+                params = {'id': chunk, 'tenant_id': f'eq.{TENANT_ID}', 'select': 'id,sort_order'}
+            rows.extend(await supabase_request('GET', table, params=params) or [])
+        by_id = {row['id']: row for row in rows}
+        missing = [row_id for row_id in ids if row_id not in by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Unknown ids: {', '.join(missing)}")
+        
+        changed = [(row_id, position) for position, row_id in enumerate(ids) if by_id[row_id].get('sort_order') != position]
+        semaphore = asyncio.Semaphore(MENU_REORDER_CONCURRENCY)
+        
+        async def patch(row_id: str, position: int):
+            async with semaphore:
+                await supabase_send('PATCH', table, data={'sort_order': position}, params={'id': f'eq.{row_id}'}, headers={
+                    'Prefer': 'return=minimal',
+                })
+        
+        try:
+            await asyncio.gather(*(patch(row_id, position) for row_id, position in changed))
+        finally:
+            if changed:
+                menu_cache.invalidate()
+        return {"success": True, "changed": len(changed), "unchanged": len(ids) - len(changed)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error reordering {table}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/admin/categories/reorder")
+async def reorder_categories(request: ReorderRequest):
+    """Apply a new category order given as an ordered id list"""
+    return await reorder_menu_rows('categories', request.ids)
+
+
+@api_router.post("/admin/items/reorder")
+async def reorder_items(request: ReorderRequest):
+    """Apply a new item order (typically one category's items) given as an ordered id list"""
+    return await reorder_menu_rows('items', request.ids)
+
+
+@api_router.post("/admin/modifiers/reorder")
+async def reorder_modifiers(request: ReorderRequest):
+    """Apply a new modifier order (typically one group's modifiers) given as an ordered id list"""
+    return await reorder_menu_rows('modifiers', request.ids)
+
+
+# ==================== DELIVERY ZONES ====================
+
+@api_router.get("/delivery-zones")
+async def get_delivery_zones(fields: Optional[str] = None):
+    """Get all delivery zones"""
+    select = select_columns(DELIVERY_ZONE_COLUMNS, fields)
+    try:
+        zones = await supabase_request('GET', 'delivery_zones', params={
+            'branch_id': f'eq.{BRANCH_ID}',
+            'status': 'eq.active',
+            'select': select
+        })
+        return zones or []
+    except Exception as e:
+        logging.error(f"Error getting delivery zones: {str(e)}")
+        return []
+
+
+@api_router.get("/admin/delivery-zones")
+async def get_all_delivery_zones(fields: Optional[str] = None):
+    """Get all delivery zones for admin"""
+    select = select_columns(DELIVERY_ZONE_COLUMNS, fields)
+    try:
+        zones = await supabase_request('GET', 'delivery_zones', params={
+            'branch_id': f'eq.{BRANCH_ID}',
+            'select': select
+        })
+        return zones or []
+    except Exception as e:
+        logging.error(f"Error getting delivery zones: {str(e)}")
+        return []
+
+
+def parse_zone_polygon(coordinates) -> list:
+    """Zone coordinates as a list of (lat, lng) tuples; admin-entered JSON may arrive as a string"""
+    if isinstance(coordinates, str):
+        try:
+            coordinates = json.loads(coordinates)
+        except ValueError:
+            return []
+    if not isinstance(coordinates, list):
+        return []
+    polygon = []
+    for point in coordinates:
+        if isinstance(point, (list, tuple)) and len(point) >= 2:
+            polygon.append((float(point[0]), float(point[1])))
+    return polygon
+
+
+def point_in_polygon(lat: float, lng: float, polygon: list) -> bool:
+    """Ray casting test, same convention as the frontend geocoding utility ([lat, lng] vertices)"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lng_i > lng) != (lng_j > lng) and lat < (lat_j - lat_i) * (lng - lng_i) / (lng_j - lng_i) + lat_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def polygon_area(polygon: list) -> float:
+    return abs(sum(
+        polygon[i - 1][0] * polygon[i][1] - polygon[i][0] * polygon[i - 1][1]
+        for i in range(len(polygon))
+    )) / 2
+
+
+class DeliveryZoneIndex:
+    """Uniform grid over active zone polygons for point lookups.
+    
+    Each grid cell lists the zones whose bounding box overlaps it; a lookup
+    checks only those candidates' boxes and then runs point-in-polygon.
+    Where zones overlap, the smallest one wins.
+    """
+    
+    CELL_DEGREES = 0.02  # about 2 km at Kuwait's latitude
+    
+    def __init__(self, zones: list, fingerprint: str = ''):
+        self.fingerprint = fingerprint
+        self.loaded_at = time.monotonic()
+        self.by_id = {zone['id']: zone for zone in zones}
+        self.zones = []
+        self.cells = {}
+        for zone in zones:
+            polygon = parse_zone_polygon(zone.get('coordinates'))
+            if len(polygon) < 3:
+                continue
+            lats = [lat for lat, _ in polygon]
+            lngs = [lng for _, lng in polygon]
+            bbox = (min(lats), min(lngs), max(lats), max(lngs))
+            self.zones.append((zone, polygon, bbox, polygon_area(polygon)))
+            slot = len(self.zones) - 1
+            for row in range(self._cell(bbox[0]), self._cell(bbox[2]) + 1):
+                for col in range(self._cell(bbox[1]), self._cell(bbox[3]) + 1):
+                    self.cells.setdefault((row, col), []).append(slot)
+    
+    def _cell(self, degrees: float) -> int:
+        return math.floor(degrees / self.CELL_DEGREES)
+    
+    def resolve(self, lat: float, lng: float) -> Optional[dict]:
+        best = None
+        for slot in self.cells.get((self._cell(lat), self._cell(lng)), ()):
+            zone, polygon, (min_lat, min_lng, max_lat, max_lng), area = self.zones[slot]
+            if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng and point_in_polygon(lat, lng, polygon):
+                if best is None or area < best[1]:
+                    best = (zone, area)
+        return best[0] if best else None
+
+
+class DeliveryZoneCache:
+    """Holds the current DeliveryZoneIndex.
+    
+    Zones are edited directly in Supabase by the admin panel, so the rows
+    are re-read after ttl seconds (in the background once loaded) and the
+    grid is rebuilt only when their content actually changed.
+    """
+    
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self.index = None
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+    
+    async def get(self) -> DeliveryZoneIndex:
+        if self.index is None:
+            async with self._lock:
+                if self.index is None:
+                    await self.refresh()
+        elif time.monotonic() - self.index.loaded_at > self.ttl and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self.index
+    
+    async def refresh(self):
+        try:
+            zones = await supabase_request('GET', 'delivery_zones', params={
+                'branch_id': f'eq.{BRANCH_ID}',
+                'status': 'eq.active',
+                'select': select_columns(DELIVERY_ZONE_COLUMNS)
+            }) or []
+            fingerprint = hashlib.sha1(json.dumps(zones, sort_keys=True, default=str).encode()).hexdigest()
+            if self.index is not None and self.index.fingerprint == fingerprint:
+                self.index.loaded_at = time.monotonic()
+                return
+            self.index = DeliveryZoneIndex(zones, fingerprint)
+            logging.info(f"Delivery zone index rebuilt: {len(self.index.zones)} zones, {len(self.index.cells)} cells")
+        except Exception as e:
+            logging.error(f"Error loading delivery zones: {str(e)}")
+            if self.index is None:
+                raise
+            self.index.loaded_at = time.monotonic()
+
+
+delivery_zone_cache = DeliveryZoneCache()
+
+
+def zone_summary(zone: dict) -> dict:
+    return {
+        'id': zone['id'],
+        'zone_name': zone.get('zone_name'),
+        'delivery_fee': float(zone.get('delivery_fee') or 0),
+        'min_order_amount': float(zone.get('min_order_amount') or 0),
+        'estimated_time_minutes': zone.get('estimated_time_minutes'),
+    }
+
+
+async def locate_delivery_zone(zone_id: Optional[str], lat: Optional[float] = None, lng: Optional[float] = None) -> tuple:
+    """(deliverable, zone) for an active zone id, or else for the point (lat, lng).
+    
+    As in the storefront's address check, with no active zones configured
+    every address is deliverable, with no zone and so no zone fee.
+    """
+    index = await delivery_zone_cache.get()
+    if not index.by_id:
+        return True, None
+    zone = index.by_id.get(zone_id) if zone_id else index.resolve(lat, lng)
+    return zone is not None, zone
+
+
+@api_router.get("/delivery-zones/resolve")
+async def resolve_delivery_zone(lat: float, lng: float):
+    """Find the active delivery zone containing a point, with its fee and minimum order"""
+    try:
+        deliverable, zone = await locate_delivery_zone(None, lat, lng)
+    except Exception as e:
+        logging.error(f"Error loading delivery zones: {str(e)}")
+        raise HTTPException(status_code=503, detail="Delivery zones unavailable")
+    
+    if not deliverable:
+        return {"deliverable": False, "zone": None, "message": "Sorry, we do not deliver to this area."}
+    return {"deliverable": True, "zone": zone_summary(zone) if zone else None}
+
+
+# ==================== GEOCODING ====================
+
+GEOCODE_COORDINATE_DECIMALS = 4  # about 11 m; map pins closer than that share a lookup
+GEOCODE_MISS_TTL_SECONDS = 24 * 3600
+GEOCODE_SAVE_DELAY_SECONDS = 5
+
+
+class NominatimGeocoder:
+    """Upstream OpenStreetMap geocoder, as used by the frontend.
+    
+    Requests are spaced at least min_interval apart to respect the public
+    service's usage policy. Any object with the same search/reverse
+    coroutines can replace it on GeocodeCache.upstream.
+    """
+    
+    def __init__(self, base_url: str = NOMINATIM_URL, min_interval: float = 1.0):
+        self.base_url = base_url.rstrip('/')
+        self.min_interval = min_interval
+        self._last_request = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def _get(self, path: str, params: dict):
+        async with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.get(
+                f"{self.base_url}/{path}",
+                params={**params, 'format': 'json'},
+                headers={'User-Agent': 'BamBurgers-App/1.0', 'Accept-Language': 'en'}
+            )
+        response.raise_for_status()
+        return response.json()
+    
+    async def search(self, query: str) -> Optional[dict]:
+        data = await self._get('search', {'q': query, 'countrycodes': 'kw', 'limit': 1})
+        if not data:
+            return None
+        return {'lat': float(data[0]['lat']), 'lng': float(data[0]['lon'])}
+    
+    async def reverse(self, lat: float, lng: float) -> Optional[dict]:
+        data = await self._get('reverse', {'lat': lat, 'lon': lng, 'zoom': 18, 'addressdetails': 1})
+        if not data or 'error' in data:
+            return None
+        address = data.get('address') or {}
+        # Same field mapping as the checkout map
+        return {
+            'area': address.get('suburb') or address.get('neighbourhood') or address.get('city_district')
+                    or address.get('town') or address.get('city') or '',
+            'street': address.get('road') or address.get('street') or '',
+            'block': address.get('quarter') or '',
+            'building': address.get('house_number') or '',
+            'display_name': data.get('display_name', ''),
+        }
+
+
+ARABIC_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹', '01234567890123456789')
+
+
+def normalize_address_part(value: Optional[str]) -> str:
+    value = ' '.join(normalize_search_text(value or '').translate(ARABIC_DIGITS).split())
+    return re.sub(r'^(block|blk|قطعه)\s*', '', value)
+
+
+def geocode_query(area: str, block: Optional[str], street: Optional[str], building: Optional[str]) -> str:
+    """Query string in the same shape the frontend sends to Nominatim"""
+    parts = [area]
+    if block:
+        parts.append(f"Block {block}")
+    if street:
+        parts.append(street)
+    if building:
+        parts.append(f"Building {building}")
+    parts.append('Kuwait')
+    return ', '.join(parts)
+
+
+class GeocodeCache:
+    """LRU cache in front of the geocoder, persisted to a local JSON file.
+    
+    Forward lookups are keyed on the normalized address parts, reverse
+    lookups on coordinates rounded to GEOCODE_COORDINATE_DECIMALS.
+    Concurrent requests for the same key share one upstream call.
+    "Not found" answers are remembered for GEOCODE_MISS_TTL_SECONDS; upstream
+    errors are not cached. The file is rewritten a few seconds after new
+    entries arrive, so every worker also survives restarts warm.
+    """
+    
+    def __init__(self, path: Path = GEOCODE_CACHE_PATH, max_entries: int = GEOCODE_CACHE_SIZE, upstream=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.upstream = upstream or NominatimGeocoder()
+        self._entries = None
+        self._inflight = {}
+        self._save_task = None
+        self.hits = 0
+        self.misses = 0
+    
+    def _load(self):
+        self._entries = OrderedDict()
+        try:
+            with open(self.path) as f:
+                for key, entry in json.load(f):
+                    self._entries[key] = entry
+            logging.info(f"Geocode cache loaded: {len(self._entries)} entries")
+        except FileNotFoundError:
+            pass
+        except (ValueError, TypeError, OSError) as e:
+            logging.error(f"Ignoring unreadable geocode cache {self.path}: {str(e)}")
+    
+    def _write(self, snapshot: list):
+        # Other workers save to the same file: keep their entries (the newer copy of a
+        # shared key wins), and write through a private temp file so saves never collide
+        merged = OrderedDict()
+        try:
+            with open(self.path) as f:
+                for key, entry in json.load(f):
+                    merged[key] = entry
+        except (FileNotFoundError, ValueError, TypeError):
+            pass
+        for key, entry in snapshot:
+            on_disk = merged.pop(key, None)
+            merged[key] = on_disk if on_disk and on_disk['cached_at'] > entry['cached_at'] else entry
+        while len(merged) > self.max_entries:
+            merged.popitem(last=False)
+        
+        with tempfile.NamedTemporaryFile('w', dir=self.path.parent, prefix=self.path.name + '.', suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            json.dump(list(merged.items()), f, ensure_ascii=False)
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+    
+    async def _save_later(self):
+        await asyncio.sleep(GEOCODE_SAVE_DELAY_SECONDS)
+        try:
+            await asyncio.to_thread(self._write, list(self._entries.items()))
+        except OSError as e:
+            logging.error(f"Error saving geocode cache: {str(e)}")
+    
+    def _lookup(self, key: str):
+        if self._entries is None:
+            self._load()
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry['result'] is None and time.time() - entry['cached_at'] > GEOCODE_MISS_TTL_SECONDS:
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry['result']
+    
+    def _store(self, key: str, result: Optional[dict]):
+        self._entries[key] = {'result': result, 'cached_at': int(time.time())}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._save_later())
+    
+    async def get(self, key: str, fetch):
+        """Return (result, cached); fetch is a zero-argument coroutine factory for a miss"""
+        found, result = self._lookup(key)
+        if found:
+            self.hits += 1
+            return result, True
+        
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending), True
+        
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            result = await fetch()
+        except Exception as e:
+            pending.set_exception(e)
+            # Waiters see the exception; mark it retrieved so an unshared failure is not logged twice
+            pending.exception()
+            raise
+        else:
+            self._store(key, result)
+            pending.set_result(result)
+            return result, False
+        finally:
+            if not pending.done():
+                pending.cancel()
+            del self._inflight[key]
+    
+    async def geocode(self, area: str, block: Optional[str] = None, street: Optional[str] = None, building: Optional[str] = None):
+        key = 'fwd:' + '|'.join(normalize_address_part(part) for part in (area, block, street, building))
+        query = geocode_query(area, block, street, building)
+        return await self.get(key, lambda: self.upstream.search(query))
+    
+    async def reverse(self, lat: float, lng: float):
+        lat = round(lat, GEOCODE_COORDINATE_DECIMALS)
+        lng = round(lng, GEOCODE_COORDINATE_DECIMALS)
+        key = f"rev:{lat:.{GEOCODE_COORDINATE_DECIMALS}f},{lng:.{GEOCODE_COORDINATE_DECIMALS}f}"
+        return await self.get(key, lambda: self.upstream.reverse(lat, lng))
+
+
+geocode_cache = GeocodeCache()
+
+
+@api_router.get("/geocode")
+async def geocode_address(area: str, block: Optional[str] = None, street: Optional[str] = None, building: Optional[str] = None):
+    """Geocode a Kuwaiti address (area/block/street/building) through the local cache"""
+    if not area.strip():
+        raise HTTPException(status_code=400, detail="area is required")
+    try:
+        result, cached = await geocode_cache.geocode(area, block, street, building)
+    except Exception as e:
+        logging.error(f"Geocoding error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Geocoding service unavailable")
+    if result is None:
+        return {"found": False, "cached": cached}
+    return {"found": True, "cached": cached, **result}
+
+
+@api_router.get("/geocode/reverse")
+async def reverse_geocode(lat: float, lng: float):
+    """Address fields for a map position, through the local cache"""
+    try:
+        result, cached = await geocode_cache.reverse(lat, lng)
+    except Exception as e:
+        logging.error(f"Reverse geocoding error: {str(e)}")
+        raise HTTPException(status_code=502, detail="Geocoding service unavailable")
+    if result is None:
+        return {"found": False, "cached": cached}
+    return {"found": True, "cached": cached, **result}
+
+
+# ==================== CART QUOTES ====================
+
+QUOTE_TTL_SECONDS = 900
+MAX_QUOTE_LINE_QUANTITY = 99
+
+
+def to_fils(amount) -> int:
+    """KWD amount as integer fils (1 KWD = 1000 fils)"""
+    return int(round(float(amount or 0) * 1000))
+
+
+def from_fils(fils: int) -> float:
+    return fils / 1000
+
+
+class MenuPriceIndex:
+    """Immutable price table for active items and modifiers.
+    
+    UUIDs map to dense integer slots; prices are stored as fils in typed
+    arrays and the item -> modifier group relation is a flat
+    items x groups bytearray mask, so pricing a line is a few array
+    lookups. A new index is built per menu version and swapped in whole.
+    """
+    
+    def __init__(self, items: list, modifiers: list, links: list, version: int):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        
+        self.item_slots = {row['id']: slot for slot, row in enumerate(items)}
+        self.item_prices = array('q', (to_fils(row.get('base_price')) for row in items))
+        self.item_names = [(row.get('name_en'), row.get('name_ar') or row.get('name_en')) for row in items]
+        self.item_prep_minutes = array('h', (int(row.get('prep_time_minutes') or 0) for row in items))
+        
+        group_ids = {row.get('modifier_group_id') for row in modifiers} | {link['modifier_group_id'] for link in links}
+        group_slots = {group_id: slot for slot, group_id in enumerate(sorted(group_ids, key=str))}
+        self.group_count = len(group_slots)
+        
+        self.modifier_slots = {row['id']: slot for slot, row in enumerate(modifiers)}
+        self.modifier_prices = array('q', (to_fils(row.get('price')) for row in modifiers))
+        self.modifier_groups = array('l', (group_slots[row.get('modifier_group_id')] for row in modifiers))
+        self.modifier_names = [(row.get('name_en'), row.get('name_ar')) for row in modifiers]
+        
+        self.group_mask = bytearray(len(items) * self.group_count)
+        for link in links:
+            item_slot = self.item_slots.get(link['item_id'])
+            if item_slot is not None:
+                self.group_mask[item_slot * self.group_count + group_slots[link['modifier_group_id']]] = 1
+    
+    def prep_minutes(self, item_id: str) -> Optional[int]:
+        slot = self.item_slots.get(item_id)
+        if slot is None or not self.item_prep_minutes[slot]:
+            return None
+        return self.item_prep_minutes[slot]
+    
+    def price_line(self, line: QuoteItem) -> tuple:
+        """Price one cart line as (line dict, line total in fils); raises ValueError for unknown items or modifiers"""
+        item_slot = self.item_slots.get(line.item_id)
+        if item_slot is None:
+            raise ValueError(f"Item {line.item_id} is not available")
+        name_en, name_ar = self.item_names[item_slot]
+        if not 1 <= line.quantity <= MAX_QUOTE_LINE_QUANTITY:
+            raise ValueError(f"Quantity for {name_en} must be between 1 and {MAX_QUOTE_LINE_QUANTITY}")
+        
+        unit_fils = self.item_prices[item_slot]
+        mask_offset = item_slot * self.group_count
+        modifiers = []
+        for modifier_id in line.modifier_ids:
+            modifier_slot = self.modifier_slots.get(modifier_id)
+            if modifier_slot is None or not self.group_mask[mask_offset + self.modifier_groups[modifier_slot]]:
+                raise ValueError(f"Modifier {modifier_id} is not available for {name_en}")
+            price_fils = self.modifier_prices[modifier_slot]
+            unit_fils += price_fils
+            modifier_en, modifier_ar = self.modifier_names[modifier_slot]
+            modifiers.append({'id': modifier_id, 'name_en': modifier_en, 'name_ar': modifier_ar, 'price': from_fils(price_fils)})
+        
+        total_fils = unit_fils * line.quantity
+        return {
+            'item_id': line.item_id,
+            'item_name_en': name_en,
+            'item_name_ar': name_ar,
+            'quantity': line.quantity,
+            'unit_price': from_fils(unit_fils),
+            'total_price': from_fils(total_fils),
+            'notes': line.notes,
+            'modifiers': modifiers,
+        }, total_fils
+
+
+_price_index = None
+_price_index_lock = asyncio.Lock()
+
+
+async def get_price_index() -> MenuPriceIndex:
+    """Current price index, reloaded when the menu version changes or the cache TTL passes"""
+    global _price_index
+    
+    def fresh(index):
+        return index is not None and index.version == menu_cache.version and time.monotonic() - index.loaded_at <= MENU_CACHE_TTL_SECONDS
+    
+    if fresh(_price_index):
+        return _price_index
+    async with _price_index_lock:
+        if not fresh(_price_index):
+            version = menu_cache.version
+            items, modifiers, links = await asyncio.gather(
+                supabase_request('GET', 'items', params={
+                    'tenant_id': f'eq.{TENANT_ID}',
+                    'status': 'eq.active',
+                    'select': 'id,name_en,name_ar,base_price,prep_time_minutes'
+                }),
+                supabase_request('GET', 'modifiers', params=tenant_modifier_params(
+                    'id,modifier_group_id,name_en,name_ar,price', status='eq.active'
+                )),
+                supabase_request('GET', 'item_modifier_groups', params=tenant_modifier_params(
+                    'item_id,modifier_group_id'
+                )),
+            )
+            _price_index = MenuPriceIndex(items or [], modifiers or [], links or [], version)
+    return _price_index
+
+
+def loyalty_terms(settings: dict) -> dict:
+    """Normalize loyalty settings; the admin panel and this API use different column names"""
+    return {
+        'enabled': settings.get('enabled', settings.get('is_active', False)),
+        'points_per_kwd': float(settings.get('points_per_kwd') or 0),
+        'point_value': float(settings.get('redemption_rate') or settings.get('kwd_per_point') or 0.01),
+        'min_points': int(settings.get('min_points_to_redeem') or settings.get('min_points_redeem') or 0),
+        'max_percent': float(settings.get('max_redemption_percent') or 100),
+    }
+
+
+async def fetch_customer_points(customer_id: str) -> int:
+    customers = await supabase_request('GET', 'customers', params={'id': f'eq.{customer_id}', 'select': 'loyalty_points'})
+    return int(customers[0].get('loyalty_points') or 0) if customers else 0
+
+
+def hkdf_sha256(key_material: bytes, info: bytes, length: int = 32) -> bytes:
+    """HKDF (RFC 5869) with SHA-256 and an all-zero salt"""
+    prk = hmac.new(b'\0' * hashlib.sha256().digest_size, key_material, hashlib.sha256).digest()
+    okm, block = b'', b''
+    for counter in range(1, -(-length // hashlib.sha256().digest_size) + 1):
+        block = hmac.new(prk, block + info + bytes([counter]), hashlib.sha256).digest()
+        okm += block
+    return okm[:length]
+
+
+def quote_signing_key() -> bytes:
+    if QUOTE_SIGNING_KEY:
+        return QUOTE_SIGNING_KEY.encode()
+    if SUPABASE_SERVICE_KEY:
+        return hkdf_sha256(SUPABASE_SERVICE_KEY.encode(), QUOTE_KEY_LABEL)
+    logging.warning("Neither QUOTE_SIGNING_KEY nor SUPABASE_SERVICE_KEY is set; cart quotes only verify on this worker")
+    return os.urandom(32)
+
+
+_quote_key = quote_signing_key()
+
+
+def sign_quote(payload: dict) -> str:
+    body = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()).decode().rstrip('=')
+    signature = hmac.new(_quote_key, body.encode(), hashlib.sha256).hexdigest()
+    return f"{body}.{signature}"
+
+
+def verify_quote_token(token: str) -> dict:
+    """Return the quote signed into token; raises HTTPException if tampered with or expired"""
+    try:
+        body, _, signature = token.encode('ascii').partition(b'.')
+        expected = hmac.new(_quote_key, body, hashlib.sha256).hexdigest().encode()
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError("bad signature")
+        quote = json.loads(base64.urlsafe_b64decode(body + b'=' * (-len(body) % 4)))
+        expires_at = quote['expires_at']
+        if not quote.get('nonce'):
+            raise ValueError("quote has no nonce")
+    except (ValueError, KeyError, TypeError):
+        # UnicodeError, binascii.Error and JSONDecodeError are all ValueErrors
+        raise HTTPException(status_code=400, detail="Invalid quote")
+    if expires_at < time.time():
+        raise HTTPException(status_code=400, detail="Quote has expired, please review your cart")
+    return quote
+
+
+class QuoteRedemptions:
+    """Single-use check for quote nonces.
+    
+    Each nonce is claimed in the quote_redemptions table (nonce is the
+    primary key, so a second claim from any worker gets a 409). Claims are
+    also remembered locally until the quote expires, which answers repeats
+    on this worker without a round trip. If the table does not exist the
+    check falls back to the local memory and says so once.
+    """
+    
+    def __init__(self):
+        self._claimed = {}  # nonce -> expires_at
+        self._table_available = True
+    
+    def _prune(self, now: float):
+        for nonce in [nonce for nonce, expires_at in self._claimed.items() if expires_at < now]:
+            del self._claimed[nonce]
+    
+    async def claim(self, quote: dict):
+        """Mark the quote as used; raises HTTPException if it already was"""
+        nonce, expires_at = quote['nonce'], quote['expires_at']
+        self._prune(time.time())
+        if nonce in self._claimed:
+            raise HTTPException(status_code=400, detail="Quote has already been used, please review your cart")
+        self._claimed[nonce] = expires_at
+        if not self._table_available:
+            return
+        try:
+            await supabase_send('POST', 'quote_redemptions', data={
+                'nonce': nonce,
+                'expires_at': datetime.fromtimestamp(expires_at, timezone.utc).isoformat(),
+            }, headers={'Prefer': 'return=minimal'})
+        except HTTPException as e:
+            if e.status_code == 409:
+                raise HTTPException(status_code=400, detail="Quote has already been used, please review your cart")
+            if e.status_code == 404:
+                self._table_available = False
+                logging.warning("quote_redemptions table is missing; quote reuse is only caught per worker")
+                return
+            self._claimed.pop(nonce, None)
+            raise
+    
+    async def release(self, quote: dict):
+        """Give back a claim whose order was never placed, so the quote can be retried"""
+        nonce = quote['nonce']
+        self._claimed.pop(nonce, None)
+        if not self._table_available:
+            return
+        try:
+            await supabase_send('DELETE', 'quote_redemptions', params={'nonce': f'eq.{nonce}'}, headers={'Prefer': 'return=minimal'})
+        except Exception as e:
+            logging.warning(f"Could not release quote {nonce}: {e}")
+
+
+quote_redemptions = QuoteRedemptions()
+
+
+def apply_cart_quote(request: CreateOrderRequest, quote: dict):
+    """Replace client-supplied prices on an order with the ones from a verified quote"""
+    if (request.customer_id or None) != quote['customer_id']:
+        raise HTTPException(status_code=400, detail="Quote was issued for a different customer")
+    if request.order_type != quote['order_type']:
+        raise HTTPException(status_code=400, detail="Quote was issued for a different order type")
+    request.items = [OrderItem(**line) for line in quote['lines']]
+    request.subtotal = quote['subtotal']
+    request.discount_amount = from_fils(to_fils(quote['discount_amount']) + to_fils(quote['loyalty_discount']))
+    request.delivery_fee = quote['delivery_fee']
+    request.total_amount = quote['total_amount']
+    request.coupon_code = quote['coupon_code']
+    request.loyalty_points_used = quote['loyalty_points_used']
+    request.loyalty_points_earned = quote['loyalty_points_earned']
+
+
+@api_router.post("/cart/quote")
+async def quote_cart(request: CartQuoteRequest):
+    """Price a cart server-side and return a signed quote that POST /orders accepts as quote_token.
+    
+    Items and modifiers are priced from the cached price index; the coupon,
+    delivery zone and loyalty lookups run concurrently. Problems are listed
+    in errors and leave the quote unsigned.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    
+    try:
+        price_index = await get_price_index()
+        errors = []
+        lines = []
+        subtotal_fils = 0
+        for line in request.items:
+            try:
+                priced, total_fils = price_index.price_line(line)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            lines.append(priced)
+            subtotal_fils += total_fils
+        subtotal = from_fils(subtotal_fils)
+        
+        is_delivery = request.order_type == 'delivery'
+        has_location = request.geo_lat is not None and request.geo_lng is not None
+        locate_zone = is_delivery and (request.delivery_zone_id or has_location)
+        if is_delivery and not locate_zone:
+            errors.append("delivery_zone_id or geo_lat/geo_lng is required for delivery orders")
+        
+        async def no_lookup():
+            return None
+        
+        coupon, located, settings, customer_points = await asyncio.gather(
+            evaluate_coupon(request.coupon_code, subtotal, request.customer_id) if request.coupon_code else no_lookup(),
+            locate_delivery_zone(request.delivery_zone_id, request.geo_lat, request.geo_lng) if locate_zone else no_lookup(),
+            get_loyalty_settings() if request.customer_id else no_lookup(),
+            fetch_customer_points(request.customer_id) if request.customer_id and request.loyalty_points > 0 else no_lookup(),
+            return_exceptions=True,
+        )
+        
+        discount_fils = 0
+        if isinstance(coupon, HTTPException):
+            errors.append(f"Coupon: {coupon.detail}")
+        elif isinstance(coupon, Exception):
+            raise coupon
+        elif coupon:
+            discount_fils = to_fils(coupon['discount_amount'])
+        
+        delivery_fils = 0
+        if isinstance(located, Exception):
+            raise located
+        deliverable, zone = located or (True, None)
+        if locate_zone:
+            if not deliverable:
+                errors.append("Delivery zone is not available")
+            elif zone is not None:
+                delivery_fils = to_fils(zone.get('delivery_fee'))
+                min_order = float(zone.get('min_order_amount') or 0)
+                if subtotal_fils < to_fils(min_order):
+                    errors.append(f"Minimum order for {zone.get('zone_name')} is {min_order:.3f} KWD")
+        
+        for result in (settings, customer_points):
+            if isinstance(result, Exception):
+                raise result
+        terms = loyalty_terms(settings or {})
+        
+        order_total_fils = subtotal_fils - discount_fils + delivery_fils
+        points_used = 0
+        loyalty_fils = 0
+        if request.loyalty_points > 0:
+            if not request.customer_id or not terms['enabled']:
+                errors.append("Loyalty points cannot be redeemed")
+            elif request.loyalty_points > (customer_points or 0):
+                errors.append("Not enough loyalty points")
+            elif request.loyalty_points < terms['min_points']:
+                errors.append(f"You need at least {terms['min_points']} points to redeem")
+            else:
+                max_discount_fils = order_total_fils * terms['max_percent'] // 100
+                loyalty_fils = int(min(to_fils(request.loyalty_points * terms['point_value']), max_discount_fils))
+                points_used = request.loyalty_points
+        
+        total_fils = order_total_fils - loyalty_fils
+        total_amount = from_fils(total_fils)
+        points_earned = math.floor(total_fils * terms['points_per_kwd'] / 1000) if request.customer_id and terms['enabled'] else 0
+        
+        quote = {
+            'order_type': request.order_type,
+            'customer_id': request.customer_id,
+            'lines': lines,
+            'subtotal': subtotal,
+            'coupon_code': coupon['code'] if isinstance(coupon, dict) else None,
+            'discount_amount': from_fils(discount_fils),
+            'delivery_zone_id': zone['id'] if isinstance(zone, dict) else None,
+            'delivery_fee': from_fils(delivery_fils),
+            'loyalty_discount': from_fils(loyalty_fils),
+            'loyalty_points_used': points_used,
+            'loyalty_points_earned': points_earned,
+            'total_amount': total_amount,
+            'expires_at': int(time.time()) + QUOTE_TTL_SECONDS,
+            'nonce': uuid.uuid4().hex,
+        }
+        
+        return {
+            **quote,
+            'valid': not errors,
+            'errors': errors,
+            'quote_token': sign_quote(quote) if not errors else None,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error quoting cart: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ==================== DISPATCH ====================
+
+EARTH_RADIUS_KM = 6371.0088
+OPEN_DELIVERY_STATUSES = ('pending', 'accepted', 'preparing', 'ready', 'out_for_delivery')
+DISPATCH_ORDER_COLUMNS = ('id', 'order_number', 'status', 'payment_status', 'customer_name', 'delivery_address', 'created_at', 'updated_at')
+DISPATCH_SYNC_SECONDS = 2
+DISPATCH_RELOAD_SECONDS = 300  # full reload, dropping orders deleted since (failed charges)
+
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points"""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def travel_minutes(distance_km: np.ndarray) -> np.ndarray:
+    """Driving time estimate: straight-line distance stretched by the road factor, plus handoff"""
+    return distance_km * DELIVERY_ROAD_FACTOR / DELIVERY_SPEED_KMH * 60 + DELIVERY_HANDOFF_MINUTES
+
+
+def order_address(order: dict) -> dict:
+    address = order.get('delivery_address')
+    if isinstance(address, str):
+        try:
+            address = json.loads(address)
+        except ValueError:
+            return {}
+    return address if isinstance(address, dict) else {}
+
+
+def order_location(order: dict) -> Optional[tuple]:
+    address = order_address(order)
+    try:
+        lat, lng = float(address['geo_lat']), float(address['geo_lng'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+async def fetch_branch_location() -> Optional[tuple]:
+    if BRANCH_LAT and BRANCH_LNG:
+        return float(BRANCH_LAT), float(BRANCH_LNG)
+    branches = await supabase_request('GET', 'branches', params={
+        'id': f'eq.{BRANCH_ID}',
+        'select': 'latitude,longitude'
+    })
+    if branches and branches[0].get('latitude') is not None and branches[0].get('longitude') is not None:
+        return float(branches[0]['latitude']), float(branches[0]['longitude'])
+    return None
+
+
+def compact_dispatch_order(row: dict) -> dict:
+    return {
+        'id': row['id'],
+        'order_number': row.get('order_number'),
+        'status': row.get('status'),
+        'customer_name': row.get('customer_name'),
+        'area': order_address(row).get('area'),
+        'created_at': row.get('created_at'),
+        'updated_at': row.get('updated_at'),
+    }
+
+
+class DeliveryBoard:
+    """Open delivery orders with coordinates, held as parallel NumPy arrays.
+    
+    The first read loads every open delivery order; later reads apply only
+    the orders changed since the previous sync (the same updated_at/id
+    cursor as /admin/orders/changes), so each sync costs one small query.
+    Distances from the branch are computed in one vectorized pass for each
+    batch of new or moved orders; removed orders are dropped with a mask.
+    Unpaid online orders are left off the board. Deleted rows never show up
+    in the changes feed, so the board is reloaded every DISPATCH_RELOAD_SECONDS.
+    """
+    
+    def __init__(self):
+        self.origin = None
+        self.position = None
+        self.synced_at = 0.0
+        self.loaded_at = 0.0
+        self._reset()
+        self._lock = asyncio.Lock()
+    
+    def _reset(self):
+        self.ids = []
+        self.slots = {}
+        self.orders = []
+        self.lat = np.empty(0)
+        self.lng = np.empty(0)
+        self.distance_km = np.empty(0)
+    
+    def apply(self, rows: list):
+        """Upsert open, located, paid-or-offline delivery orders and drop everything else in rows"""
+        removed = set()
+        added = []
+        moved = []
+        for row in rows:
+            listed = row.get('status') in OPEN_DELIVERY_STATUSES and row.get('payment_status') not in UNPAID_PAYMENT_STATUSES
+            location = order_location(row) if listed else None
+            slot = self.slots.get(row['id'])
+            if location is None:
+                if slot is not None:
+                    removed.add(slot)
+            elif slot is None:
+                added.append((row, location))
+            else:
+                self.orders[slot] = compact_dispatch_order(row)
+                if (self.lat[slot], self.lng[slot]) != location:
+                    self.lat[slot], self.lng[slot] = location
+                    moved.append(slot)
+        
+        if moved:
+            moved = np.array(moved)
+            self.distance_km[moved] = haversine_km(*self.origin, self.lat[moved], self.lng[moved])
+        
+        if removed:
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[list(removed)] = False
+            self.ids = [order_id for order_id, kept in zip(self.ids, keep) if kept]
+            self.orders = [order for order, kept in zip(self.orders, keep) if kept]
+            self.lat, self.lng, self.distance_km = self.lat[keep], self.lng[keep], self.distance_km[keep]
+        
+        if added:
+            lat = np.array([location[0] for _, location in added])
+            lng = np.array([location[1] for _, location in added])
+            self.ids.extend(row['id'] for row, _ in added)
+            self.orders.extend(compact_dispatch_order(row) for row, _ in added)
+            self.lat = np.concatenate([self.lat, lat])
+            self.lng = np.concatenate([self.lng, lng])
+            self.distance_km = np.concatenate([self.distance_km, haversine_km(*self.origin, lat, lng)])
+        
+        if removed or added:
+            self.slots = {order_id: slot for slot, order_id in enumerate(self.ids)}
+    
+    async def sync(self):
+        async with self._lock:
+            if time.monotonic() - self.synced_at < DISPATCH_SYNC_SECONDS:
+                return
+            if self.origin is None:
+                self.origin = await fetch_branch_location()
+                if self.origin is None:
+                    raise HTTPException(status_code=503, detail="Branch location is not configured")
+            
+            base_params = {
+                'select': ','.join(DISPATCH_ORDER_COLUMNS),
+                'tenant_id': f'eq.{TENANT_ID}',
+                'branch_id': f'eq.{BRANCH_ID}',
+                'order_type': 'eq.delivery',
+            }
+            if self.position is None or time.monotonic() - self.loaded_at > DISPATCH_RELOAD_SECONDS:
+                self._reset()
+                settle = changes_settle_position()
+                last_id = NIL_UUID
+                while True:
+                    rows = await supabase_request('GET', 'orders', params={
+                        **base_params,
+                        'status': f'in.({",".join(OPEN_DELIVERY_STATUSES)})',
+                        'payment_status': f'not.in.({",".join(UNPAID_PAYMENT_STATUSES)})',
+                        'id': f'gt.{last_id}',
+                        'order': 'id.asc',
+                        'limit': str(MAX_ORDER_PAGE_SIZE),
+                    }) or []
+                    self.apply(rows)
+                    if len(rows) < MAX_ORDER_PAGE_SIZE:
+                        break
+                    last_id = rows[-1]['id']
+                self.position = settle
+                self.loaded_at = time.monotonic()
+            else:
+                async def apply(rows):
+                    self.apply(rows)
+                self.position = await follow_order_changes(self.position, base_params, apply)
+            self.synced_at = time.monotonic()
+
+
+delivery_board = DeliveryBoard()
+
+
+@api_router.get("/admin/dispatch/deliveries")
+async def get_dispatch_deliveries(status: Optional[str] = None, sort: str = 'distance'):
+    """Open delivery orders with distance from the branch and a travel time estimate"""
+    if status and status not in OPEN_DELIVERY_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    if sort not in ('distance', 'created_at'):
+        raise HTTPException(status_code=400, detail="sort must be distance or created_at")
+    
+    try:
+        await delivery_board.sync()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error syncing delivery board: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    board = delivery_board
+    distance = board.distance_km
+    minutes = travel_minutes(distance)
+    order = np.argsort(distance, kind='stable') if sort == 'distance' else np.arange(len(board.ids))
+    if sort == 'created_at':
+        order = sorted(order, key=lambda slot: board.orders[slot]['created_at'] or '')
+    
+    distance_list = np.round(distance, 2).tolist()
+    minutes_list = np.rint(minutes).astype(int).tolist()
+    lat_list, lng_list = board.lat.tolist(), board.lng.tolist()
+    deliveries = []
+    for slot in order:
+        slot = int(slot)
+        entry = board.orders[slot]
+        if status and entry['status'] != status:
+            continue
+        deliveries.append({
+            **entry,
+            'lat': lat_list[slot],
+            'lng': lng_list[slot],
+            'distance_km': distance_list[slot],
+            'travel_minutes': minutes_list[slot],
+        })
+    
+    return {
+        "origin": {"lat": board.origin[0], "lng": board.origin[1]},
+        "count": len(deliveries),
+        "deliveries": deliveries,
+    }
+
+
+def leg_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Scalar haversine for single route legs, where NumPy call overhead dominates"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def leg_minutes(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    return leg_km(lat1, lng1, lat2, lng2) * DELIVERY_ROAD_FACTOR / DELIVERY_SPEED_KMH * 60
+
+
+def plan_run(origin: tuple, stops: list, lat: np.ndarray, lng: np.ndarray, ready_at: np.ndarray, solo_minutes: np.ndarray):
+    """Visit stops nearest-first from the branch once the last order is ready.
+    
+    Returns (ordered stops, per-stop extra minutes versus a solo delivery
+    dispatched the moment that order was ready, route minutes).
+    """
+    remaining = list(stops)
+    route = []
+    here = origin
+    clock = 0.0
+    arrivals = []
+    while remaining:
+        next_stop = min(remaining, key=lambda s: (lat[s] - here[0]) ** 2 + (lng[s] - here[1]) ** 2)
+        remaining.remove(next_stop)
+        clock += leg_minutes(here[0], here[1], lat[next_stop], lng[next_stop]) + DELIVERY_HANDOFF_MINUTES
+        arrivals.append(clock)
+        route.append(next_stop)
+        here = (lat[next_stop], lng[next_stop])
+    depart = max(ready_at[s] for s in route)
+    extra = [(depart - ready_at[s]) / 60 + arrival - solo_minutes[s] for s, arrival in zip(route, arrivals)]
+    return route, extra, clock
+
+
+def suggest_delivery_batches(origin: tuple, lat: np.ndarray, lng: np.ndarray, ready_at: np.ndarray,
+                             capacity: int, radius_km: float, ready_window_minutes: float, max_extra_minutes: float) -> list:
+    """Group ready deliveries into runs of up to capacity orders.
+    
+    Orders are taken oldest-ready first as seeds. Candidates for a seed are
+    the unassigned orders within radius_km and ready_window_minutes of it,
+    found with one vectorized distance pass; the nearest are added while
+    no order in the run would arrive more than max_extra_minutes later
+    than if it had left alone when it was ready. Returns a list of
+    (stops in route order, extra minutes per stop, route minutes).
+    """
+    count = len(lat)
+    solo_minutes = travel_minutes(haversine_km(origin[0], origin[1], lat, lng))
+    unassigned = np.ones(count, dtype=bool)
+    runs = []
+    for seed in np.argsort(ready_at, kind='stable'):
+        if not unassigned[seed]:
+            continue
+        unassigned[seed] = False
+        nearby = haversine_km(lat[seed], lng[seed], lat, lng)
+        candidates = np.flatnonzero(
+            unassigned & (nearby <= radius_km) & (np.abs(ready_at - ready_at[seed]) <= ready_window_minutes * 60)
+        )
+        run = [int(seed)]
+        plan = plan_run(origin, run, lat, lng, ready_at, solo_minutes)
+        # Only the nearest few are worth trying; farther ones fail the detour limit first
+        for candidate in candidates[np.argsort(nearby[candidates], kind='stable')][:capacity * 4]:
+            if len(run) >= capacity:
+                break
+            trial = plan_run(origin, run + [int(candidate)], lat, lng, ready_at, solo_minutes)
+            if max(trial[1]) <= max_extra_minutes:
+                run.append(int(candidate))
+                unassigned[candidate] = False
+                plan = trial
+        runs.append(plan)
+    return runs
+
+
+def format_kuwait_time(ts: float) -> str:
+    """Epoch seconds as naive Kuwait local ISO time, like get_kuwait_time_iso()"""
+    return datetime.fromtimestamp(ts, KUWAIT_TZ).replace(tzinfo=None, microsecond=0).isoformat()
+
+
+def timestamp_seconds(value: Optional[str]) -> float:
+    try:
+        parsed = datetime.fromisoformat((value or '').replace('Z', '+00:00'))
+    except ValueError:
+        return time.time()
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=KUWAIT_TZ)
+    return parsed.timestamp()
+
+
+@api_router.get("/admin/dispatch/batches")
+async def get_dispatch_batches(
+    capacity: int = Query(3, ge=1, le=10),
+    radius_km: float = Query(2.5, gt=0),
+    ready_window_minutes: float = Query(10, ge=0),
+    max_extra_minutes: float = Query(12, ge=0),
+):
+    """Suggested driver runs grouping nearby 'ready' delivery orders.
+    
+    An order's ready time is its last update while in 'ready' status.
+    Orders that cannot share a run are returned as single-order runs.
+    """
+    try:
+        await delivery_board.sync()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error syncing delivery board: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    board = delivery_board
+    slots = [slot for slot, order in enumerate(board.orders) if order['status'] == 'ready']
+    if not slots:
+        return {"runs": [], "orders": 0, "saved_km": 0}
+    
+    slot_array = np.array(slots)
+    lat, lng = board.lat[slot_array], board.lng[slot_array]
+    ready_at = np.array([timestamp_seconds(board.orders[slot]['updated_at']) for slot in slots])
+    runs = suggest_delivery_batches(board.origin, lat, lng, ready_at, capacity, radius_km, ready_window_minutes, max_extra_minutes)
+    
+    solo_km = board.distance_km[slot_array]
+    saved_km = 0.0
+    suggestions = []
+    for route, extra, route_minutes in runs:
+        # Round trips: each solo order goes out and back; a run returns from its last stop
+        path = [board.origin] + [(lat[s], lng[s]) for s in route] + [board.origin]
+        run_km = sum(leg_km(a[0], a[1], b[0], b[1]) for a, b in zip(path, path[1:]))
+        saved = float(2 * solo_km[route].sum()) - run_km
+        saved_km += saved
+        suggestions.append({
+            'orders': [
+                {
+                    'id': board.orders[slots[s]]['id'],
+                    'order_number': board.orders[slots[s]]['order_number'],
+                    'area': board.orders[slots[s]]['area'],
+                    'extra_minutes': round(max(minutes, 0), 1),
+                }
+                for s, minutes in zip(route, extra)
+            ],
+            'route_km': round(run_km, 2),
+            'route_minutes': round(route_minutes),
+            'saved_km': round(saved, 2),
+        })
+    
+    suggestions.sort(key=lambda run: -len(run['orders']))
+    return {"runs": suggestions, "orders": len(slots), "saved_km": round(saved_km, 2)}
+
+
+# ==================== KITCHEN ====================
+
+KITCHEN_STATUSES = ('pending', 'accepted', 'preparing', 'ready')
+KITCHEN_WORK_STATUSES = ('pending', 'accepted', 'preparing')
+KITCHEN_UNPAID_STATUSES = UNPAID_PAYMENT_STATUSES  # online orders the kitchen must not start yet
+KITCHEN_ORDER_COLUMNS = ('id', 'order_number', 'order_type', 'status', 'payment_status', 'customer_name', 'notes', 'created_at', 'updated_at')
+KITCHEN_ITEM_COLUMNS = ('id', 'order_id', 'item_id', 'item_name_en', 'item_name_ar', 'quantity', 'notes')
+KITCHEN_TYPE_PRIORITY = {'dine_in': 0, 'pickup': 1, 'delivery': 2}  # tie-break for equal promised times
+KITCHEN_DEFAULT_PREP_MINUTES = 10
+KITCHEN_EXTRA_ITEM_MINUTES = 1
+KITCHEN_SYNC_SECONDS = 5
+# The background sync pauses when no checkout or kitchen screen has used the board for this long
+KITCHEN_IDLE_SECONDS = 600
+KITCHEN_UNPAID_TTL_SECONDS = 3600
+
+
+def kitchen_cook_minutes(items: list) -> float:
+    """Time to cook one order: its slowest item, plus a little for each further item.
+    
+    Uses items.prep_time_minutes from the price index when it is loaded.
+    """
+    if not items:
+        return KITCHEN_DEFAULT_PREP_MINUTES
+    longest = 0
+    quantity = 0
+    for item in items:
+        prep = _price_index.prep_minutes(item.get('item_id')) if _price_index is not None else None
+        longest = max(longest, prep or KITCHEN_DEFAULT_PREP_MINUTES)
+        quantity += int(item.get('quantity') or 1)
+    return longest + KITCHEN_EXTRA_ITEM_MINUTES * max(quantity - 1, 0)
+
+
+class KitchenBoard:
+    """Active kitchen orders held in memory, with a capacity-aware schedule.
+    
+    Kept current from this process's order events (creation, status
+    changes, payment confirmation) and, for changes made by other workers
+    or directly in Supabase, a background sync over the orders changes
+    cursor every KITCHEN_SYNC_SECONDS. The sync task runs for the app's
+    lifespan but only queries Supabase while the board is in use; after
+    KITCHEN_IDLE_SECONDS without an estimate or queue read it stops, and
+    the next use reloads the board on the following tick.
+    
+    The schedule assigns working orders to KITCHEN_STATIONS parallel
+    stations, orders already being prepared first and then oldest first,
+    giving each a projected ready time and the queue a new order would join.
+    
+    The display queue is a sorted list of (promised time, order type
+    priority, created time, id) keys maintained with bisect on every
+    change; unpaid online orders are kept out of it. An order's promised
+    time is fixed when it is first seen: the time quoted at checkout, or
+    else its projected ready time at that moment.
+    """
+    
+    def __init__(self):
+        self.orders = {}
+        self.loaded = False
+        self.position = None
+        self.version = 0
+        self._queue = []
+        self._queue_keys = {}
+        self._schedule = None
+        self._task = None
+        self.used_at = time.monotonic()
+    
+    def _counts(self, order: dict) -> bool:
+        return order['status'] in KITCHEN_WORK_STATUSES and order.get('payment_status') not in KITCHEN_UNPAID_STATUSES
+    
+    def upsert(self, row: dict, items: Optional[list] = None):
+        """Add or update an order from a Supabase row or event payload; items are required for new orders"""
+        order = self.orders.get(row['id'])
+        if row.get('status', order and order['status']) not in KITCHEN_STATUSES:
+            self.remove(row['id'])
+            return
+        if order is None:
+            if items is None:
+                return
+            order = {
+                'id': row['id'],
+                'created_ts': timestamp_seconds(row.get('created_at')),
+                'status_ts': timestamp_seconds(row.get('updated_at') or row.get('created_at')),
+                'items': items,
+                'cook_minutes': kitchen_cook_minutes(items),
+                'promised_ts': timestamp_seconds(row['estimated_ready_time']) if row.get('estimated_ready_time') else None,
+            }
+            self.orders[row['id']] = order
+        else:
+            # Syncs re-read recent rows; leave the queue version alone when nothing changed
+            if all(row[key] == order.get(key) for key in KITCHEN_ORDER_COLUMNS if key in row and key not in ('id', 'updated_at')):
+                return
+            if row.get('status') and row['status'] != order['status']:
+                order['status_ts'] = timestamp_seconds(row.get('updated_at')) if row.get('updated_at') else time.time()
+        for key in KITCHEN_ORDER_COLUMNS:
+            if key in row and key not in ('id', 'updated_at'):
+                order[key] = row[key]
+        self._schedule = None
+        if order['promised_ts'] is None:
+            order['promised_ts'] = self.schedule()['ready'].get(order['id'], order['status_ts'])
+        self._requeue(order)
+    
+    def remove(self, order_id: str):
+        if self.orders.pop(order_id, None) is not None:
+            self._schedule = None
+            self._unqueue(order_id)
+            self.version += 1
+    
+    def _unqueue(self, order_id: str):
+        key = self._queue_keys.pop(order_id, None)
+        if key is not None:
+            del self._queue[bisect.bisect_left(self._queue, key)]
+    
+    def _requeue(self, order: dict):
+        self._unqueue(order['id'])
+        if order.get('payment_status') not in KITCHEN_UNPAID_STATUSES:
+            key = (order['promised_ts'], KITCHEN_TYPE_PRIORITY.get(order.get('order_type'), 1), order['created_ts'], order['id'])
+            bisect.insort(self._queue, key)
+            self._queue_keys[order['id']] = key
+        self.version += 1
+    
+    def queue(self) -> list:
+        """Displayable orders, most urgent first"""
+        self.used_at = time.monotonic()
+        return [self.orders[key[-1]] for key in self._queue]
+    
+    def on_event(self, event: dict):
+        order = event.get('order')
+        if not order or not order.get('id'):
+            return
+        if event['type'] == 'order_created':
+            self.upsert(order, order.get('items') or [])
+        elif event['type'] == 'order_paid' and order['id'] not in self.orders:
+            # Online orders first appear when paid; fetch their items now rather than on the next sync
+            asyncio.get_running_loop().create_task(self._apply_rows([order]))
+        else:
+            # Orders this process has not seen yet arrive with their items on the next sync
+            self.upsert(order)
+    
+    def schedule(self) -> dict:
+        """Projected ready times (epoch seconds) and station free times (minutes from now)"""
+        now = time.time()
+        if self._schedule is not None and now - self._schedule['at'] < 30:
+            return self._schedule
+        working = sorted(
+            (order for order in self.orders.values() if self._counts(order)),
+            key=lambda order: (order['status'] != 'preparing', order['created_ts']),
+        )
+        stations = [0.0] * max(KITCHEN_STATIONS, 1)
+        ready = {}
+        backlog = 0.0
+        for order in working:
+            remaining = order['cook_minutes']
+            if order['status'] == 'preparing':
+                remaining = max(remaining - (now - order['status_ts']) / 60, 1)
+            start = heapq.heappop(stations)
+            heapq.heappush(stations, start + remaining)
+            ready[order['id']] = now + (start + remaining) * 60
+            backlog += remaining
+        self._schedule = {'at': now, 'ready': ready, 'stations': stations, 'working': len(working), 'backlog': backlog}
+        return self._schedule
+    
+    def estimate(self, items: list) -> dict:
+        """Projected ready time for a new order with these items"""
+        self.used_at = time.monotonic()
+        schedule = self.schedule()
+        elapsed = (time.time() - schedule['at']) / 60
+        queue_minutes = max(schedule['stations'][0] - elapsed, 0)
+        cook_minutes = kitchen_cook_minutes(items)
+        ready_at = datetime.now(KUWAIT_TZ) + timedelta(minutes=queue_minutes + cook_minutes)
+        over_capacity = queue_minutes > KITCHEN_MAX_QUEUE_MINUTES
+        return {
+            'estimated_ready_time': ready_at.replace(tzinfo=None, microsecond=0).isoformat(),
+            'prep_minutes': round(cook_minutes),
+            'queue_minutes': round(queue_minutes),
+            'active_orders': schedule['working'],
+            'backlog_minutes': round(schedule['backlog'] / max(KITCHEN_STATIONS, 1)),
+            'load': 'over_capacity' if over_capacity else ('busy' if queue_minutes > KITCHEN_MAX_QUEUE_MINUTES / 2 else 'normal'),
+            'accepting': not (over_capacity and KITCHEN_OVERLOAD_MODE == 'reject'),
+        }
+    
+    async def _fetch_items(self, order_ids: list) -> dict:
+        """Order items with modifier names, in the same shape as order_created events"""
+        items = {order_id: [] for order_id in order_ids}
+        for start in range(0, len(order_ids), MAX_BULK_ORDERS):
+            chunk = order_ids[start:start + MAX_BULK_ORDERS]
+            rows = await supabase_request('GET', 'order_items', params={
+                'order_id': f'in.({",".join(chunk)})',
+                'select': order_item_select(KITCHEN_ITEM_COLUMNS),
+            }) or []
+            await attach_item_modifiers(rows, select='order_item_id,modifier_name_en')
+            for row in rows:
+                row['modifiers'] = [modifier.get('modifier_name_en') for modifier in row['modifiers']]
+                items[row['order_id']].append(row)
+        return items
+    
+    async def _apply_rows(self, rows: list):
+        # Unpaid online orders are not tracked; many are never paid
+        new_ids = [
+            row['id'] for row in rows
+            if row['id'] not in self.orders and row.get('status') in KITCHEN_STATUSES
+            and row.get('payment_status') not in KITCHEN_UNPAID_STATUSES
+        ]
+        items = await self._fetch_items(new_ids) if new_ids else {}
+        for row in rows:
+            self.upsert(row, items.get(row['id']))
+    
+    async def load(self):
+        """Rebuild from every active order in Supabase"""
+        await get_price_index()
+        settle = changes_settle_position()
+        rows = await supabase_request('GET', 'orders', params={
+            'select': ','.join(KITCHEN_ORDER_COLUMNS),
+            'tenant_id': f'eq.{TENANT_ID}',
+            'branch_id': f'eq.{BRANCH_ID}',
+            'status': f'in.({",".join(KITCHEN_STATUSES)})',
+            'payment_status': f'not.in.({",".join(KITCHEN_UNPAID_STATUSES)})',
+            'order': 'created_at.asc',
+        }) or []
+        self.orders, self._queue, self._queue_keys = {}, [], {}
+        await self._apply_rows(rows)
+        self.position = settle
+        self.loaded = True
+        self._schedule = None
+        logging.info(f"Kitchen board loaded: {len(self.orders)} active orders")
+    
+    async def sync(self):
+        """Apply orders changed since the last sync (other workers, admin panel edits)"""
+        if self.position is None:
+            await self.load()
+            return
+        abandoned = time.time() - KITCHEN_UNPAID_TTL_SECONDS
+        for order in list(self.orders.values()):
+            if order.get('payment_status') in KITCHEN_UNPAID_STATUSES and order['created_ts'] < abandoned:
+                self.remove(order['id'])
+        self.position = await follow_order_changes(self.position, {
+            'select': ','.join(KITCHEN_ORDER_COLUMNS),
+            'tenant_id': f'eq.{TENANT_ID}',
+            'branch_id': f'eq.{BRANCH_ID}',
+        }, self._apply_rows)
+    
+    async def run(self):
+        while True:
+            if time.monotonic() - self.used_at < KITCHEN_IDLE_SECONDS:
+                try:
+                    await self.sync()
+                except Exception as e:
+                    logging.error(f"Kitchen board sync failed: {str(e)}")
+            elif self.loaded:
+                # Nobody is reading the board; stop polling and reload from scratch on next use
+                self.position = None
+                self.loaded = False
+                logging.info("Kitchen board idle; sync paused")
+            await asyncio.sleep(KITCHEN_SYNC_SECONDS)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+
+kitchen_board = KitchenBoard()
+order_events.add_listener(kitchen_board.on_event)
+
+
+def parse_eta_items(items: Optional[str]) -> list:
+    """items query value: comma-separated item_id or item_id:quantity"""
+    parsed = []
+    for part in (items or '').split(','):
+        item_id, _, quantity = part.strip().partition(':')
+        if not item_id:
+            continue
+        try:
+            quantity = int(quantity) if quantity else 1
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid quantity for {item_id}")
+        parsed.append({'item_id': item_id, 'quantity': max(quantity, 1)})
+    return parsed
+
+
+@api_router.get("/kitchen/eta")
+async def get_kitchen_eta(items: Optional[str] = None):
+    """Projected ready time for a cart (items=id:qty,...) given the current kitchen load"""
+    return kitchen_board.estimate(parse_eta_items(items))
+
+
+@api_router.get("/kitchen/queue")
+async def get_kitchen_queue(request: Request, status: Optional[str] = None):
+    """Kitchen display queue, most urgent first, served from memory.
+    
+    Items are [quantity, name_en, name_ar, notes, modifiers]. The ETag
+    changes with the queue and once a minute (for the late flags), so
+    screens can poll with If-None-Match.
+    """
+    if status and status not in KITCHEN_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    now = time.time()
+    etag = f'"kq-{order_events.epoch}-{kitchen_board.version}-{int(now // 60)}-{status or ""}"'
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    orders = []
+    for order in kitchen_board.queue():
+        if status and order['status'] != status:
+            continue
+        orders.append({
+            'id': order['id'],
+            'number': order.get('order_number'),
+            'type': order.get('order_type'),
+            'status': order['status'],
+            'customer': order.get('customer_name'),
+            'notes': order.get('notes'),
+            'promised_at': format_kuwait_time(order['promised_ts']),
+            'late': order['status'] != 'ready' and order['promised_ts'] < now,
+            'items': [
+                [item.get('quantity'), item.get('item_name_en'), item.get('item_name_ar'), item.get('notes'), item.get('modifiers') or []]
+                for item in order['items']
+            ],
+        })
+    
+    return Response(
+        content=json.dumps({'loaded': kitchen_board.loaded, 'orders': orders}, ensure_ascii=False, separators=(',', ':')),
+        media_type='application/json',
+        headers={'ETag': etag, 'Cache-Control': 'no-cache'},
+    )
+
+
+# ==================== SALES STATS ====================
+
+STATS_ORDER_COLUMNS = ('id', 'created_at', 'updated_at', 'channel', 'order_type', 'status', 'payment_status', 'total_amount', 'discount_amount', 'delivery_fee', 'transaction_id')
+STATS_METRICS = ('orders', 'revenue', 'discount', 'delivery_fees', 'cancelled')
+STATS_SYNC_SECONDS = 5
+STATS_REBUILD_SECONDS = 6 * 3600
+STATS_MUTABLE_DAYS = 3  # orders older than this are assumed settled until the next full rebuild
+KUWAIT_OFFSET_SECONDS = 3 * 3600
+
+
+def stats_segment(row: dict) -> tuple:
+    """(channel, order type, payment) an order is rolled up under; Tap orders carry a transaction id"""
+    return (row.get('channel') or 'website', row.get('order_type') or 'unknown', 'online' if row.get('transaction_id') else 'cash')
+
+
+def stats_contribution(row: dict) -> np.ndarray:
+    """Metrics one order adds; online orders count only once paid"""
+    amounts = np.zeros(len(STATS_METRICS))
+    if row.get('payment_status') in UNPAID_PAYMENT_STATUSES:
+        return amounts
+    if row.get('status') == 'cancelled':
+        amounts[4] = 1
+    else:
+        amounts[0] = 1
+        amounts[1] = float(row.get('total_amount') or 0)
+        amounts[2] = float(row.get('discount_amount') or 0)
+        amounts[3] = float(row.get('delivery_fee') or 0)
+    return amounts
+
+
+class SalesRollups:
+    """Hourly order rollups by (channel, order type, payment) segment.
+    
+    cells[hour - base, segment] holds STATS_METRICS for each Kuwait-local
+    hour, so a range query is a slice sum and per-day figures are a
+    reshape. A full rebuild pages through all orders and aggregates each
+    page with pandas; afterwards reads apply only orders changed since the
+    last sync (orders changes cursor), subtracting an order's previous
+    contribution when it is recent enough to still be tracked. Unpaid
+    online orders contribute nothing, but recent ones are tracked so they
+    are counted when the payment lands.
+    """
+    
+    def __init__(self):
+        self.base = None
+        self.cells = np.zeros((0, 0, len(STATS_METRICS)))
+        self.segments = {}
+        self.contributions = {}
+        self.position = None
+        self.built_from = 0.0
+        self.built_at = 0.0
+        self.synced_at = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _segment_slot(self, segment: tuple) -> int:
+        slot = self.segments.get(segment)
+        if slot is None:
+            slot = self.segments[segment] = len(self.segments)
+            if slot >= self.cells.shape[1]:
+                self.cells = np.pad(self.cells, ((0, 0), (0, max(4, slot + 1 - self.cells.shape[1])), (0, 0)))
+        return slot
+    
+    def _hour_row(self, hour: int) -> int:
+        if self.base is None:
+            self.base = hour
+        if hour < self.base:
+            self.cells = np.pad(self.cells, ((self.base - hour, 0), (0, 0), (0, 0)))
+            self.base = hour
+        row = hour - self.base
+        if row >= self.cells.shape[0]:
+            # Grow by at least a month of hours at a time
+            self.cells = np.pad(self.cells, ((0, max(row + 1 - self.cells.shape[0], 24 * 31)), (0, 0), (0, 0)))
+        return row
+    
+    def add(self, hours: np.ndarray, segments: list, amounts: np.ndarray):
+        """Accumulate amounts (n x metrics) into their hour/segment cells"""
+        if not len(hours):
+            return
+        self._hour_row(int(hours.min()))
+        self._hour_row(int(hours.max()))
+        slots = np.array([self._segment_slot(segment) for segment in segments])
+        np.add.at(self.cells, (hours - self.base, slots), amounts)
+    
+    def apply(self, row: dict, mutable_after: float):
+        """Apply one created or changed order"""
+        created = timestamp_seconds(row.get('created_at'))
+        hour = int((created + KUWAIT_OFFSET_SECONDS) // 3600)
+        previous = self.contributions.pop(row['id'], None)
+        if previous is None and created < self.built_from:
+            return  # already counted by the last rebuild and too old to track
+        contribution = (hour, stats_segment(row), stats_contribution(row))
+        if previous is not None:
+            self.add(np.array([previous[0]]), [previous[1]], -previous[2][None, :])
+        self.add(np.array([hour]), [contribution[1]], contribution[2][None, :])
+        if created >= mutable_after:
+            self.contributions[row['id']] = contribution
+    
+    async def rebuild(self):
+        settle = changes_settle_position()
+        mutable_after = time.time() - STATS_MUTABLE_DAYS * 86400
+        self.base, self.cells, self.segments, self.contributions = None, np.zeros((0, 0, len(STATS_METRICS))), {}, {}
+        position = {'created_at': '1970-01-01T00:00:00+00:00', 'id': NIL_UUID}
+        total = 0
+        while True:
+            rows = await supabase_request('GET', 'orders', params={
+                'select': ','.join(STATS_ORDER_COLUMNS),
+                'tenant_id': f'eq.{TENANT_ID}',
+                'order': 'created_at.asc,id.asc',
+                'limit': '1000',
+                'or': keyset_filter('created_at', position['created_at'], position['id'], descending=False),
+            }) or []
+            if not rows:
+                break
+            total += len(rows)
+            self._add_history(rows, mutable_after)
+            position = {'created_at': rows[-1]['created_at'], 'id': rows[-1]['id']}
+            if len(rows) < 1000:
+                break
+        
+        async for _, rows in order_archive.pages(columns=STATS_ORDER_COLUMNS):
+            total += len(rows)
+            self._add_history(rows, mutable_after)
+        
+        self.built_from = timestamp_seconds(settle['updated_at'])
+        self.position = settle
+        self.built_at = self.synced_at = time.monotonic()
+        logging.info(f"Sales rollups rebuilt from {total} orders, {len(self.segments)} segments")
+    
+    def _add_history(self, rows: list, mutable_after: float):
+        """Aggregate a page of orders with pandas and add it to the cells"""
+        frame = pd.DataFrame(rows, columns=STATS_ORDER_COLUMNS)
+        created = (pd.to_datetime(frame['created_at'], utc=True, format='ISO8601') - pd.Timestamp(0, tz='UTC')).dt.total_seconds()
+        frame['hour'] = ((created + KUWAIT_OFFSET_SECONDS) // 3600).astype('int64')
+        counted = ~frame['payment_status'].isin(UNPAID_PAYMENT_STATUSES)
+        cancelled = frame['status'].eq('cancelled') & counted
+        placed = counted & ~cancelled
+        frame['orders'] = placed.astype(float)
+        frame['cancelled'] = cancelled.astype(float)
+        frame['revenue'] = pd.to_numeric(frame['total_amount']).fillna(0).where(placed, 0)
+        frame['discount'] = pd.to_numeric(frame['discount_amount']).fillna(0).where(placed, 0)
+        frame['delivery_fees'] = pd.to_numeric(frame['delivery_fee']).fillna(0).where(placed, 0)
+        frame['channel'] = frame['channel'].fillna('website')
+        frame['order_type'] = frame['order_type'].fillna('unknown')
+        frame['payment'] = np.where(frame['transaction_id'].notna() & frame['transaction_id'].ne(''), 'online', 'cash')
+        
+        grouped = frame.groupby(['hour', 'channel', 'order_type', 'payment'], sort=False)[list(STATS_METRICS)].sum()
+        self.add(
+            grouped.index.get_level_values('hour').to_numpy(dtype='int64'),
+            [tuple(key[1:]) for key in grouped.index],
+            grouped.to_numpy(),
+        )
+        
+        recent = frame[created >= mutable_after]
+        for order_id, hour, channel, order_type, payment, amounts in zip(
+            recent['id'], recent['hour'], recent['channel'], recent['order_type'], recent['payment'],
+            recent[list(STATS_METRICS)].to_numpy(),
+        ):
+            self.contributions[order_id] = (int(hour), (channel, order_type, payment), amounts)
+
+    async def sync(self):
+        mutable_after = time.time() - STATS_MUTABLE_DAYS * 86400
+        
+        async def apply(rows):
+            for row in rows:
+                self.apply(row, mutable_after)
+        
+        self.position = await follow_order_changes(self.position, {
+            'select': ','.join(STATS_ORDER_COLUMNS),
+            'tenant_id': f'eq.{TENANT_ID}',
+        }, apply)
+        self.contributions = {
+            order_id: contribution for order_id, contribution in self.contributions.items()
+            if contribution[0] * 3600 - KUWAIT_OFFSET_SECONDS >= mutable_after - 3600
+        }
+        self.synced_at = time.monotonic()
+    
+    @asynccontextmanager
+    async def paused(self):
+        """Hold off rebuilds and syncs until the block exits"""
+        async with self._lock:
+            yield
+    
+    async def ensure_fresh(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self.position is None or now - self.built_at > STATS_REBUILD_SECONDS:
+                await self.rebuild()
+            elif now - self.synced_at > STATS_SYNC_SECONDS:
+                await self.sync()
+    
+    def totals(self, start_hour: int, end_hour: int) -> np.ndarray:
+        """Metrics per segment summed over [start_hour, end_hour)"""
+        if self.base is None:
+            return np.zeros((len(self.segments), len(STATS_METRICS)))
+        lo = min(max(start_hour - self.base, 0), self.cells.shape[0])
+        hi = min(max(end_hour - self.base, 0), self.cells.shape[0])
+        return self.cells[lo:hi, :len(self.segments)].sum(axis=0)
+    
+    def series(self, start_hour: int, end_hour: int, step: int) -> np.ndarray:
+        """Metrics per bucket of step hours (all segments) over [start_hour, end_hour)"""
+        buckets = max((end_hour - start_hour + step - 1) // step, 0)
+        result = np.zeros((buckets * step, len(STATS_METRICS)))
+        if self.base is not None and buckets:
+            lo = max(start_hour, self.base)
+            hi = min(end_hour, self.base + self.cells.shape[0])
+            if lo < hi:
+                result[lo - start_hour:hi - start_hour] = self.cells[lo - self.base:hi - self.base].sum(axis=1)
+        return result.reshape(buckets, step, len(STATS_METRICS)).sum(axis=1)
+
+
+sales_rollups = SalesRollups()
+
+
+def summarize_metrics(values: np.ndarray) -> dict:
+    orders, revenue, discount, delivery_fees, cancelled = (float(v) for v in values)
+    return {
+        'orders': int(orders),
+        'revenue': round(revenue, 3),
+        'average_ticket': round(revenue / orders, 3) if orders else 0,
+        'discount': round(discount, 3),
+        'delivery_fees': round(delivery_fees, 3),
+        'cancelled': int(cancelled),
+    }
+
+
+@api_router.get("/admin/stats")
+async def get_admin_stats(date_from: Optional[str] = Query(None, alias="from"), date_to: Optional[str] = Query(None, alias="to"), group: str = 'day'):
+    """Dashboard KPIs for a date range (default: today, Kuwait time) from the hourly rollups.
+    
+    Returns totals, breakdowns by channel, order type and payment, and a
+    per-day or per-hour series. Boundaries are rounded down to the hour.
+    """
+    if group not in ('day', 'hour'):
+        raise HTTPException(status_code=400, detail="group must be day or hour")
+    today = get_kuwait_time().strftime('%Y-%m-%d')
+    start = timestamp_seconds(parse_range_bound(date_from or today))
+    end = timestamp_seconds(parse_range_bound(date_to or today, end=True))
+    start_hour = int((start + KUWAIT_OFFSET_SECONDS) // 3600)
+    end_hour = int((end + KUWAIT_OFFSET_SECONDS) // 3600)
+    if end_hour <= start_hour:
+        raise HTTPException(status_code=400, detail="to must be after from")
+    if group == 'hour' and end_hour - start_hour > 24 * 31:
+        raise HTTPException(status_code=400, detail="Hourly series are limited to 31 days")
+    
+    try:
+        await sales_rollups.ensure_fresh()
+    except Exception as e:
+        logging.error(f"Error refreshing sales rollups: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    per_segment = sales_rollups.totals(start_hour, end_hour)
+    breakdowns = {'channel': {}, 'order_type': {}, 'payment': {}}
+    for segment, slot in sales_rollups.segments.items():
+        for name, value in zip(('channel', 'order_type', 'payment'), segment):
+            breakdowns[name][value] = breakdowns[name].get(value, 0) + per_segment[slot]
+    
+    if group == 'day':
+        # Align day buckets to Kuwait midnight
+        series_start = start_hour - start_hour % 24
+        step = 24
+    else:
+        series_start = start_hour
+        step = 1
+    series = sales_rollups.series(series_start, end_hour, step)
+    
+    return {
+        'from': format_kuwait_time(start_hour * 3600 - KUWAIT_OFFSET_SECONDS),
+        'to': format_kuwait_time(end_hour * 3600 - KUWAIT_OFFSET_SECONDS),
+        'totals': summarize_metrics(per_segment.sum(axis=0) if len(per_segment) else np.zeros(len(STATS_METRICS))),
+        'by_channel': {key: summarize_metrics(value) for key, value in breakdowns['channel'].items()},
+        'by_order_type': {key: summarize_metrics(value) for key, value in breakdowns['order_type'].items()},
+        'payment_mix': {key: summarize_metrics(value) for key, value in breakdowns['payment'].items()},
+        'series': [
+            {'start': format_kuwait_time((series_start + i * step) * 3600 - KUWAIT_OFFSET_SECONDS), **summarize_metrics(values)}
+            for i, values in enumerate(series)
+        ],
+    }
+
+
+# ==================== REPORTS ====================
+
+REPORT_PAGE_ORDERS = 200  # orders per streamed page; bounds memory regardless of range
+REPORT_CACHE_SIZE = 32
+REPORT_CACHE_SECONDS = 60  # ranges that include the present; closed ranges keep for a day
+
+
+class ItemSalesAccumulator:
+    """Running item x hour-of-day quantities and item/modifier line counts.
+    
+    Memory grows with the number of distinct items and modifiers, not with
+    the number of orders: each page is folded in with a pandas group-by
+    and then discarded.
+    """
+    
+    def __init__(self):
+        self.item_slots = {}
+        self.item_names = []
+        self.item_hours = np.zeros((0, 24))
+        self.item_lines = np.zeros(0)
+        self.modifier_lines = {}
+        self.modifier_names = {}
+        self.orders = 0
+    
+    def _slots(self, item_ids) -> np.ndarray:
+        slots = []
+        for item_id in item_ids:
+            slot = self.item_slots.get(item_id)
+            if slot is None:
+                slot = self.item_slots[item_id] = len(self.item_slots)
+                self.item_names.append(None)
+            slots.append(slot)
+        if len(self.item_slots) > len(self.item_lines):
+            grow = max(len(self.item_slots) - len(self.item_lines), 16)
+            self.item_hours = np.pad(self.item_hours, ((0, grow), (0, 0)))
+            self.item_lines = np.pad(self.item_lines, (0, grow))
+        return np.array(slots, dtype=np.int64)
+    
+    def add_page(self, orders: list, items: list, modifiers: list):
+        self.orders += len(orders)
+        if not items:
+            return
+        hours = pd.Series({
+            order['id']: int((timestamp_seconds(order['created_at']) + KUWAIT_OFFSET_SECONDS) // 3600 % 24)
+            for order in orders
+        })
+        lines = pd.DataFrame(items, columns=('id', 'order_id', 'item_id', 'item_name_en', 'item_name_ar', 'quantity'))
+        lines['item_id'] = lines['item_id'].fillna(lines['item_name_en'])
+        lines['hour'] = lines['order_id'].map(hours)
+        lines['quantity'] = pd.to_numeric(lines['quantity']).fillna(1)
+        
+        by_hour = lines.groupby(['item_id', 'hour'], sort=False)['quantity'].sum()
+        slots = self._slots(by_hour.index.get_level_values('item_id'))
+        np.add.at(self.item_hours, (slots, by_hour.index.get_level_values('hour').to_numpy(dtype=np.int64)), by_hour.to_numpy())
+        
+        line_counts = lines.groupby('item_id', sort=False).size()
+        np.add.at(self.item_lines, self._slots(line_counts.index), line_counts.to_numpy())
+        for item_id, name_en, name_ar in lines.drop_duplicates('item_id')[['item_id', 'item_name_en', 'item_name_ar']].itertuples(index=False):
+            self.item_names[self.item_slots[item_id]] = (name_en, name_ar)
+        
+        if modifiers:
+            attached = pd.DataFrame(modifiers, columns=('order_item_id', 'modifier_id', 'modifier_name_en', 'modifier_name_ar'))
+            attached['modifier_id'] = attached['modifier_id'].fillna(attached['modifier_name_en'])
+            attached = attached.merge(lines[['id', 'item_id']], left_on='order_item_id', right_on='id')
+            # A line counts once per modifier even if the modifier repeats on it
+            pairs = attached.drop_duplicates(['order_item_id', 'modifier_id']).groupby(['item_id', 'modifier_id'], sort=False).size()
+            for key, count in pairs.items():
+                self.modifier_lines[key] = self.modifier_lines.get(key, 0) + int(count)
+            for modifier_id, name_en, name_ar in attached.drop_duplicates('modifier_id')[['modifier_id', 'modifier_name_en', 'modifier_name_ar']].itertuples(index=False):
+                self.modifier_names[modifier_id] = (name_en, name_ar)
+    
+    def result(self) -> dict:
+        count = len(self.item_slots)
+        totals = self.item_hours[:count].sum(axis=1)
+        items = [
+            {
+                'item_id': item_id,
+                'name_en': self.item_names[slot][0],
+                'name_ar': self.item_names[slot][1],
+                'quantity': int(totals[slot]),
+                'by_hour': self.item_hours[slot].astype(int).tolist(),
+            }
+            for item_id, slot in sorted(self.item_slots.items(), key=lambda entry: -totals[entry[1]])
+        ]
+        modifiers = [
+            {
+                'item_id': item_id,
+                'item_name_en': self.item_names[self.item_slots[item_id]][0],
+                'modifier_id': modifier_id,
+                'modifier_name_en': self.modifier_names[modifier_id][0],
+                'modifier_name_ar': self.modifier_names[modifier_id][1],
+                'lines': lines,
+                'attach_rate': round(lines / self.item_lines[self.item_slots[item_id]], 4),
+            }
+            for (item_id, modifier_id), lines in self.modifier_lines.items()
+        ]
+        modifiers.sort(key=lambda row: (-row['attach_rate'], -row['lines']))
+        return {'orders': self.orders, 'items': items, 'modifiers': modifiers}
+
+
+async def stream_order_pages(date_from: Optional[str], date_to: Optional[str], page_size: int = REPORT_PAGE_ORDERS):
+    """Yield (orders, order_items, order_item_modifiers) for non-cancelled orders in a range, one page at a time.
+    
+    Live orders come first, then any archived batches overlapping the range.
+    Unpaid online orders are skipped (only closed orders are archived).
+    """
+    position = None
+    created_range = date_range_filter('created_at', date_from, date_to)
+    while True:
+        params = {
+            'select': 'id,created_at',
+            'tenant_id': f'eq.{TENANT_ID}',
+            'status': 'neq.cancelled',
+            'payment_status': f'not.in.({",".join(UNPAID_PAYMENT_STATUSES)})',
+            'order': 'created_at.asc,id.asc',
+            'limit': str(page_size),
+        }
+        if created_range:
+            params['and'] = created_range
+        if position:
+            params['or'] = keyset_filter('created_at', position['created_at'], position['id'], descending=False)
+        orders = await supabase_request('GET', 'orders', params=params) or []
+        if not orders:
+            break
+        
+        items = await supabase_request('GET', 'order_items', params={
+            'order_id': f'in.({",".join(order["id"] for order in orders)})',
+            'select': order_item_select(('id', 'order_id', 'item_id', 'item_name_en', 'item_name_ar', 'quantity')),
+        }) or []
+        await attach_item_modifiers(items, select='order_item_id,modifier_id,modifier_name_en,modifier_name_ar')
+        modifiers = [modifier for item in items for modifier in item.pop('modifiers')]
+        
+        yield orders, items, modifiers
+        if len(orders) < page_size:
+            break
+        position = {'created_at': orders[-1]['created_at'], 'id': orders[-1]['id']}
+    
+    start = timestamp_seconds(parse_range_bound(date_from)) if date_from else None
+    end = timestamp_seconds(parse_range_bound(date_to, end=True)) if date_to else None
+    async for batch, orders in order_archive.pages(('id', 'created_at'), start, end, exclude_cancelled=True):
+        for offset in range(0, len(orders), page_size):
+            page = orders[offset:offset + page_size]
+            items, modifiers = await order_archive.batch_lines(batch, [order['id'] for order in page])
+            yield page, items, modifiers
+
+
+_item_sales_cache = OrderedDict()
+_item_sales_locks = OrderedDict()
+
+
+def item_sales_lock(key: tuple) -> asyncio.Lock:
+    """Lock for one report range; idle locks beyond REPORT_CACHE_SIZE are dropped, oldest first"""
+    lock = _item_sales_locks.get(key)
+    if lock is None:
+        lock = _item_sales_locks[key] = asyncio.Lock()
+        excess = len(_item_sales_locks) - REPORT_CACHE_SIZE
+        for stale in [stale for stale, held in _item_sales_locks.items() if not held.locked() and stale != key][:max(excess, 0)]:
+            del _item_sales_locks[stale]
+    return lock
+
+
+@api_router.get("/admin/reports/item-sales")
+async def get_item_sales_report(date_from: str = Query(..., alias="from"), date_to: str = Query(..., alias="to")):
+    """Item x hour-of-day (Kuwait time) quantities and modifier attach rates for a date range.
+    
+    attach_rate is the share of an item's order lines that carried the
+    modifier. Results are cached per range.
+    """
+    start = parse_range_bound(date_from)
+    end = parse_range_bound(date_to, end=True)
+    key = (start, end)
+    
+    cached = _item_sales_cache.get(key)
+    if cached and time.monotonic() < cached['expires']:
+        _item_sales_cache.move_to_end(key)
+        return cached['result']
+    
+    # Concurrent requests for the same range wait for one computation
+    async with item_sales_lock(key):
+        cached = _item_sales_cache.get(key)
+        if cached and time.monotonic() < cached['expires']:
+            return cached['result']
+        try:
+            accumulator = ItemSalesAccumulator()
+            async for orders, items, modifiers in stream_order_pages(date_from, date_to):
+                accumulator.add_page(orders, items, modifiers)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error building item sales report: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        result = {'from': start, 'to': end, **accumulator.result()}
+        closed = timestamp_seconds(end) < time.time() - ORDER_CHANGES_SETTLE_SECONDS
+        _item_sales_cache[key] = {'result': result, 'expires': time.monotonic() + (86400 if closed else REPORT_CACHE_SECONDS)}
+        while len(_item_sales_cache) > REPORT_CACHE_SIZE:
+            _item_sales_cache.popitem(last=False)
+        return result
+
+
+# ==================== ORDER ARCHIVE ====================
+
+# Closed orders older than ARCHIVE_AFTER_DAYS move out of the database into
+# zstd Parquet files under ARCHIVE_DIR/<tenant>/<YYYY-MM>/, one file per table
+# per batch. Rows keep every column (ids and foreign keys included) so an
+# archived order reads back exactly like a live one.
+ARCHIVE_TABLES = ('orders', 'order_items', 'order_item_modifiers', 'payments')
+ARCHIVE_STATUSES = ('completed', 'delivered', 'cancelled')
+ARCHIVE_BATCH_ORDERS = 500
+ARCHIVE_TS_COLUMN = '_created_ts'
+
+
+def archive_table(rows: list) -> pa.Table:
+    """Arrow table for archived rows; nested values are stored as JSON text"""
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    
+    arrays, json_columns = {}, []
+    for name in columns:
+        values = [row.get(name) for row in rows]
+        present = [value for value in values if value is not None]
+        if present and all(isinstance(value, bool) for value in present):
+            arrays[name] = pa.array(values, type=pa.bool_())
+        elif present and all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+            arrays[name] = pa.array(values, type=pa.int64())
+        elif present and all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+            arrays[name] = pa.array([None if value is None else float(value) for value in values], type=pa.float64())
+        elif any(isinstance(value, (dict, list)) for value in present):
+            json_columns.append(name)
+            arrays[name] = pa.array([None if value is None else json.dumps(value) for value in values], type=pa.string())
+        else:
+            arrays[name] = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+    
+    table = pa.table(arrays)
+    return table.replace_schema_metadata({'json_columns': json.dumps(json_columns)})
+
+
+def read_archive_rows(path: Path, filters=None, columns: list = None) -> list:
+    """Rows of one archive file through a memory-mapped read"""
+    if not path.exists():
+        return []
+    schema = pq.read_schema(path, memory_map=True)
+    if columns is not None:
+        columns = [column for column in columns if column in schema.names]
+    table = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+    json_columns = set(json.loads((schema.metadata or {}).get(b'json_columns', b'[]')))
+    rows = table.to_pylist()
+    for row in rows:
+        row.pop(ARCHIVE_TS_COLUMN, None)
+        for name in json_columns.intersection(row):
+            if row[name] is not None:
+                row[name] = json.loads(row[name])
+    return rows
+
+
+def write_archive_file(path: Path, rows: list, created_ts: list = None):
+    """Write rows atomically (temp file + rename)"""
+    table = archive_table(rows)
+    if created_ts is not None:
+        table = table.append_column(ARCHIVE_TS_COLUMN, pa.array(created_ts, type=pa.float64()))
+    temp = path.with_suffix('.tmp')
+    pq.write_table(table, temp, compression='zstd')
+    os.replace(temp, path)
+
+
+class OrderArchive:
+    """Read and write access to the Parquet order archive.
+    
+    A batch is the set of files sharing one name stem in a month directory;
+    its orders file is written last, so a batch without one is incomplete and
+    ignored. Lookups go through an in-memory index of order id and number to
+    batch, built on first use from the id/number columns only. Other workers
+    write batches too: a month directory whose mtime has changed is
+    re-listed and its new batches are added to the index.
+    """
+    
+    def __init__(self, root: Path):
+        self.root = root
+        self.index = None  # order id -> batch
+        self.numbers = {}  # order number -> order id
+        self.spans = {}  # batch -> (min, max) created timestamp
+        self.months = {}  # month directory -> mtime_ns when last listed
+        self.lock = asyncio.Lock()
+    
+    @property
+    def base(self) -> Path:
+        return self.root / TENANT_ID
+    
+    def batch_path(self, batch: str, table: str) -> Path:
+        month, stem = batch.split('/')
+        return self.base / month / f"{table}-{stem}.parquet"
+    
+    def _index_batch(self, path: Path):
+        batch = f"{path.parent.name}/{path.name[len('orders-'):-len('.parquet')]}"
+        table = pq.read_table(path, columns=['id', 'order_number', ARCHIVE_TS_COLUMN], memory_map=True)
+        ids = table.column('id').to_pylist()
+        for order_id, number in zip(ids, table.column('order_number').to_pylist()):
+            self.index[order_id] = batch
+            if number:
+                self.numbers[number] = order_id
+        created = table.column(ARCHIVE_TS_COLUMN).to_numpy()
+        if len(created):
+            self.spans[batch] = (float(created.min()), float(created.max()))
+    
+    def _ensure_index(self):
+        """Load the index, or add batches written (by any worker) since it was built"""
+        if self.index is None:
+            self.index, self.numbers, self.spans, self.months = {}, {}, {}, {}
+        if not self.base.is_dir():
+            return
+        for month_dir in self.base.iterdir():
+            if not month_dir.is_dir():
+                continue
+            mtime = month_dir.stat().st_mtime_ns
+            if self.months.get(month_dir.name) == mtime:
+                continue
+            for path in sorted(month_dir.glob('orders-*.parquet')):
+                if f"{month_dir.name}/{path.name[len('orders-'):-len('.parquet')]}" not in self.spans:
+                    self._index_batch(path)
+            self.months[month_dir.name] = mtime
+    
+    def _find(self, order_id: str = None, order_number: str = None) -> Optional[dict]:
+        self._ensure_index()
+        if order_number is not None:
+            order_id = self.numbers.get(order_number)
+        batch = self.index.get(order_id)
+        if not batch:
+            return None
+        
+        orders = read_archive_rows(self.batch_path(batch, 'orders'), filters=[('id', '=', order_id)])
+        if not orders:
+            return None
+        order = orders[0]
+        items = read_archive_rows(self.batch_path(batch, 'order_items'), filters=[('order_id', '=', order_id)])
+        modifiers = []
+        if items:
+            modifiers = read_archive_rows(
+                self.batch_path(batch, 'order_item_modifiers'),
+                filters=[('order_item_id', 'in', [item['id'] for item in items])],
+            )
+        payments = read_archive_rows(self.batch_path(batch, 'payments'), filters=[('order_id', '=', order_id)])
+        return {'order': order, 'items': items, 'modifiers': modifiers, 'payments': payments}
+    
+    async def get_order(self, order_id: str = None, order_number: str = None, fields: Optional[str] = None) -> Optional[dict]:
+        """An archived order in the shape get_order returns, or None"""
+        found = await asyncio.to_thread(self._find, order_id, order_number)
+        if not found:
+            return None
+        
+        order_columns = select_columns(ORDER_COLUMNS, fields).split(',')
+        order = {column: found['order'].get(column) for column in order_columns}
+        modifiers_by_item = {}
+        for modifier in expand_item_modifiers(found['items'], found['modifiers']):
+            modifiers_by_item.setdefault(modifier.get('order_item_id'), []).append(
+                {column: modifier.get(column) for column in ORDER_ITEM_MODIFIER_COLUMNS}
+            )
+        order['items'] = [
+            {**{column: item.get(column) for column in ORDER_ITEM_COLUMNS}, 'modifiers': modifiers_by_item.get(item['id'], [])}
+            for item in found['items']
+        ]
+        if found['payments']:
+            order['payment'] = {column: found['payments'][0].get(column) for column in PAYMENT_COLUMNS}
+        order['archived'] = True
+        return order
+    
+    def _batch_orders(self, batch: str, columns, start: Optional[float], end: Optional[float], exclude_cancelled: bool) -> list:
+        filters = []
+        if start is not None:
+            filters.append((ARCHIVE_TS_COLUMN, '>=', start))
+        if end is not None:
+            filters.append((ARCHIVE_TS_COLUMN, '<', end))
+        if exclude_cancelled:
+            filters.append(('status', '!=', 'cancelled'))
+        return read_archive_rows(self.batch_path(batch, 'orders'), filters=filters or None, columns=list(columns) if columns else None)
+    
+    async def pages(self, columns=None, start: Optional[float] = None, end: Optional[float] = None, exclude_cancelled: bool = False):
+        """Yield (batch, orders) for each archived batch with orders created in [start, end)"""
+        await asyncio.to_thread(self._ensure_index)
+        for batch, (low, high) in sorted(self.spans.items()):
+            if (start is not None and high < start) or (end is not None and low >= end):
+                continue
+            orders = await asyncio.to_thread(self._batch_orders, batch, columns, start, end, exclude_cancelled)
+            if orders:
+                yield batch, orders
+    
+    def _batch_lines(self, batch: str, order_ids: list) -> tuple:
+        items = read_archive_rows(self.batch_path(batch, 'order_items'), filters=[('order_id', 'in', order_ids)])
+        modifiers = []
+        if items:
+            modifiers = expand_item_modifiers(items, read_archive_rows(
+                self.batch_path(batch, 'order_item_modifiers'),
+                filters=[('order_item_id', 'in', [item['id'] for item in items])],
+            ))
+        for item in items:
+            item.pop('modifiers', None)
+        return items, modifiers
+    
+    async def batch_lines(self, batch: str, order_ids: list) -> tuple:
+        """(order_items, order_item_modifiers) of some orders in a batch"""
+        return await asyncio.to_thread(self._batch_lines, batch, order_ids)
+    
+    def _write(self, orders: list, items: list, modifiers: list, payments: list) -> list:
+        """Write orders and their child rows as one batch per month; returns the batch names"""
+        items_by_order, modifiers_by_item, payments_by_order = {}, {}, {}
+        for item in items:
+            items_by_order.setdefault(item['order_id'], []).append(item)
+        for modifier in modifiers:
+            modifiers_by_item.setdefault(modifier['order_item_id'], []).append(modifier)
+        for payment in payments:
+            payments_by_order.setdefault(payment['order_id'], []).append(payment)
+        
+        months = {}
+        for order in orders:
+            created = timestamp_seconds(order.get('created_at'))
+            month = datetime.fromtimestamp(created, KUWAIT_TZ).strftime('%Y-%m')
+            months.setdefault(month, []).append((created, order))
+        
+        stem = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        written = []
+        for month, entries in sorted(months.items()):
+            batch = f"{month}/{stem}"
+            (self.base / month).mkdir(parents=True, exist_ok=True)
+            month_orders = [order for _, order in entries]
+            month_items = [item for order in month_orders for item in items_by_order.get(order['id'], [])]
+            children = {
+                'order_items': month_items,
+                'order_item_modifiers': [modifier for item in month_items for modifier in modifiers_by_item.get(item['id'], [])],
+                'payments': [payment for order in month_orders for payment in payments_by_order.get(order['id'], [])],
+            }
+            for table, rows in children.items():
+                if rows:
+                    write_archive_file(self.batch_path(batch, table), rows)
+            write_archive_file(self.batch_path(batch, 'orders'), month_orders, [created for created, _ in entries])
+            
+            if self.index is not None:
+                for created, order in entries:
+                    self.index[order['id']] = batch
+                    if order.get('order_number'):
+                        self.numbers[order['order_number']] = order['id']
+                stamps = [created for created, _ in entries]
+                self.spans[batch] = (min(stamps), max(stamps))
+            written.append(batch)
+        return written
+    
+    async def write(self, orders: list, items: list, modifiers: list, payments: list) -> list:
+        return await asyncio.to_thread(self._write, orders, items, modifiers, payments)
+
+
+order_archive = OrderArchive(ARCHIVE_DIR)
+
+
+async def fetch_in_chunks(table: str, column: str, values: list, select: str = '*') -> list:
+    """GET rows whose column is in values, MAX_BULK_ORDERS values per request"""
+    rows = []
+    for start in range(0, len(values), MAX_BULK_ORDERS):
+        chunk = values[start:start + MAX_BULK_ORDERS]
+        rows.extend(await supabase_request('GET', table, params={
+            column: f'in.({",".join(chunk)})',
+            'select': select,
+        }) or [])
+    return rows
+
+
+async def delete_in_chunks(table: str, column: str, values: list):
+    for start in range(0, len(values), MAX_BULK_ORDERS):
+        chunk = values[start:start + MAX_BULK_ORDERS]
+        await supabase_send('DELETE', table, params={column: f'in.({",".join(chunk)})'}, headers={'Prefer': 'return=minimal'})
+
+
+@api_router.post("/admin/archive/run")
+async def run_order_archive(
+    older_than_days: int = Query(ARCHIVE_AFTER_DAYS, ge=1),
+    max_orders: int = Query(5000, ge=1, le=100000),
+    dry_run: bool = False,
+):
+    """Move closed orders older than N days into the Parquet archive.
+    
+    Each batch is written to disk before its rows are deleted. Orders that
+    coupon_usage or loyalty_transactions still reference stay in the database
+    so those foreign keys remain valid.
+    """
+    if order_archive.lock.locked():
+        raise HTTPException(status_code=409, detail="Archive job already running")
+    
+    async with order_archive.lock:
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+        position = None
+        archived = skipped = candidates = 0
+        batches = []
+        try:
+            while archived + skipped < max_orders:
+                params = {
+                    'select': '*',
+                    'tenant_id': f'eq.{TENANT_ID}',
+                    'status': f'in.({",".join(ARCHIVE_STATUSES)})',
+                    'created_at': f'lt.{cutoff}',
+                    'order': 'created_at.asc,id.asc',
+                    'limit': str(min(ARCHIVE_BATCH_ORDERS, max_orders - archived - skipped)),
+                }
+                if position:
+                    params['or'] = keyset_filter('created_at', position['created_at'], position['id'], descending=False)
+                orders = await supabase_request('GET', 'orders', params=params) or []
+                if not orders:
+                    break
+                candidates += len(orders)
+                position = {'created_at': orders[-1]['created_at'], 'id': orders[-1]['id']}
+                
+                order_ids = [order['id'] for order in orders]
+                referenced = {
+                    row['order_id']
+                    for table in ('coupon_usage', 'loyalty_transactions')
+                    for row in await fetch_in_chunks(table, 'order_id', order_ids, select='order_id')
+                }
+                movable = [order for order in orders if order['id'] not in referenced]
+                skipped += len(orders) - len(movable)
+                if not movable or dry_run:
+                    archived += len(movable)
+                    continue
+                
+                movable_ids = [order['id'] for order in movable]
+                items = await fetch_in_chunks('order_items', 'order_id', movable_ids)
+                item_ids = [item['id'] for item in items]
+                modifiers = await fetch_in_chunks('order_item_modifiers', 'order_item_id', item_ids)
+                payments = await fetch_in_chunks('payments', 'order_id', movable_ids)
+                
+                # Rollup rebuilds read the database and then the archive; pausing
+                # them keeps a rebuild from seeing a batch in both or neither
+                async with sales_rollups.paused():
+                    batches.extend(await order_archive.write(movable, items, modifiers, payments))
+                    await delete_in_chunks('order_item_modifiers', 'order_item_id', item_ids)
+                    await delete_in_chunks('order_items', 'order_id', movable_ids)
+                    await delete_in_chunks('payments', 'order_id', movable_ids)
+                    await delete_in_chunks('orders', 'id', movable_ids)
+                archived += len(movable)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logging.error(f"Error archiving orders: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        
+        if batches:
+            _item_sales_cache.clear()
+            logging.info(f"Archived {archived} orders into {len(batches)} batches")
+        return {
+            "dry_run": dry_run,
+            "cutoff": cutoff,
+            "candidates": candidates,
+            "archived": archived,
+            "skipped_referenced": skipped,
+            "batches": batches,
+        }
 
 
 # ==================== ADMIN SETTINGS ====================
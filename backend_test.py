@@ -629,6 +629,907 @@ def test_admin_orders_with_payment_info():
         print(f"❌ Admin orders retrieval failed: {result}")
         return False
 
+def test_admin_orders_pagination():
+    """Test 13: Admin Orders keyset pagination - GET /api/admin/orders?cursor=&from=&to=&count="""
+    print("\n" + "="*50)
+    print("TEST 13: Admin Orders Keyset Pagination")
+    print("="*50)
+    
+    try:
+        first = requests.get(f"{API_URL}/admin/orders", params={"limit": 5, "count": "exact"}, timeout=30)
+        print(f"Status Code: {first.status_code}")
+        if first.status_code != 200:
+            print(f"❌ First page failed: {first.text}")
+            return False
+        
+        first_page = first.json()
+        next_cursor = first.headers.get("X-Next-Cursor")
+        print(f"First page: {len(first_page)} orders, total: {first.headers.get('X-Total-Count')}, next cursor: {bool(next_cursor)}")
+        
+        if not next_cursor:
+            print("ℹ️  Only one page of orders available")
+            return len(first_page) <= 5
+        
+        second = requests.get(f"{API_URL}/admin/orders", params={"limit": 5, "cursor": next_cursor}, timeout=30)
+        second_page = second.json()
+        overlap = {o['id'] for o in first_page} & {o['id'] for o in second_page}
+        print(f"Second page: {len(second_page)} orders, overlap with first page: {len(overlap)}")
+        
+        if overlap:
+            print("❌ Pages overlap")
+            return False
+        if second_page and second_page[0]['created_at'] > first_page[-1]['created_at']:
+            print("❌ Second page is not older than the first")
+            return False
+        
+        ranged = requests.get(f"{API_URL}/admin/orders", params={"from": "2020-01-01", "to": "2020-01-02"}, timeout=30)
+        if ranged.status_code != 200 or ranged.json():
+            print(f"❌ Date range filter returned unexpected orders: {ranged.text[:200]}")
+            return False
+        
+        invalid = requests.get(f"{API_URL}/admin/orders", params={"cursor": "not-a-cursor"}, timeout=30)
+        if invalid.status_code != 400:
+            print(f"❌ Expected 400 for an invalid cursor, got {invalid.status_code}")
+            return False
+        
+        print("✅ Keyset pagination working")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+
+def test_admin_orders_changes():
+    """Test 14: Admin Orders delta sync - GET /api/admin/orders/changes?since="""
+    print("\n" + "="*50)
+    print("TEST 14: Admin Orders Delta Sync")
+    print("="*50)
+    
+    try:
+        snapshot = requests.get(f"{API_URL}/admin/orders", params={"limit": 5}, timeout=30)
+        changes_cursor = snapshot.headers.get("X-Changes-Cursor")
+        if snapshot.status_code != 200 or not changes_cursor:
+            print(f"❌ Admin orders did not return X-Changes-Cursor: {snapshot.status_code}")
+            return False
+        
+        success, result = test_api_endpoint("GET", "/admin/orders/changes", params={"since": changes_cursor}, expected_status=200)
+        if not success:
+            print(f"❌ Changes request failed: {result}")
+            return False
+        
+        if not isinstance(result, dict) or not isinstance(result.get('orders'), list) or not result.get('cursor'):
+            print("❌ Expected {orders, cursor, has_more}")
+            return False
+        
+        print(f"Changed orders since snapshot: {len(result['orders'])}, has_more: {result.get('has_more')}")
+        print("✅ Delta sync working")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+
+def test_admin_orders_stream():
+    """Test 15: Live order feed - GET /api/admin/orders/stream (SSE)"""
+    print("\n" + "="*50)
+    print("TEST 15: Live Order Feed (SSE)")
+    print("="*50)
+    
+    try:
+        with requests.get(f"{API_URL}/admin/orders/stream", stream=True, timeout=30) as response:
+            content_type = response.headers.get("Content-Type", "")
+            print(f"Status Code: {response.status_code}, Content-Type: {content_type}")
+            if response.status_code != 200 or not content_type.startswith("text/event-stream"):
+                print("❌ Expected a text/event-stream response")
+                return False
+            
+            first_line = next(response.iter_lines(decode_unicode=True), "")
+            print(f"First line: {first_line}")
+            if not first_line.startswith("retry:"):
+                print("❌ Expected the stream to open with a retry hint")
+                return False
+        
+        print("✅ Live order feed reachable")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+
+def test_order_status_long_poll(order_id):
+    """Test 16: Order tracking long-poll - GET /api/orders/{order_id}/wait"""
+    print("\n" + "="*50)
+    print("TEST 16: Order Tracking Long-Poll")
+    print("="*50)
+    
+    if not order_id:
+        print("❌ No order ID available for long-poll test")
+        return False
+    
+    # A stale known_status must return immediately with the current status
+    success, result = test_api_endpoint("GET", f"/orders/{order_id}/wait", params={"known_status": "unknown", "timeout": 10})
+    if not success or not result.get('changed'):
+        print(f"❌ Expected an immediate change for a stale status: {result}")
+        return False
+    current_status = result['orders'][0]['status']
+    
+    # The current status must hold the request until the timeout
+    started = datetime.now()
+    success, result = test_api_endpoint("GET", f"/orders/{order_id}/wait", params={"known_status": current_status, "timeout": 2})
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Held for {elapsed:.1f}s, changed: {result.get('changed') if success else result}")
+    if not success or result.get('changed') or elapsed < 1.5:
+        print("❌ Expected the request to be held until the timeout")
+        return False
+    
+    print("✅ Long-poll order tracking working")
+    return True
+
+def test_bulk_order_status_update(order_id):
+    """Test 17: Bulk status transition - PATCH /api/admin/orders/status"""
+    print("\n" + "="*50)
+    print("TEST 17: Bulk Order Status Update")
+    print("="*50)
+    
+    if not order_id:
+        print("❌ No order ID available for bulk status test")
+        return False
+    
+    missing_id = "00000000-0000-0000-0000-000000000000"
+    data = {"order_ids": [order_id, missing_id], "status": "preparing"}
+    success, result = test_api_endpoint("PATCH", "/admin/orders/status", data=data, expected_status=200)
+    
+    if not success or not isinstance(result, dict):
+        print(f"❌ Bulk status update failed: {result}")
+        return False
+    
+    by_id = {r['id']: r for r in result.get('results', [])}
+    print(f"Updated: {result.get('updated')}, results: {by_id}")
+    
+    if not by_id.get(order_id, {}).get('success'):
+        print("❌ Expected the order to move to preparing")
+        return False
+    if by_id.get(missing_id, {}).get('success') is not False:
+        print("❌ Expected a per-order error for the unknown ID")
+        return False
+    
+    print("✅ Bulk status update working")
+    return True
+
+# Per-endpoint payload budgets in bytes per returned row (default column set)
+PAYLOAD_BUDGETS = {
+    "/admin/orders": 2500,
+    "/menu/categories": 600,
+    "/menu/items": 1200,
+    "/delivery-zones": 1500,
+    "/admin/categories": 600,
+    "/admin/items": 1200,
+    "/admin/modifier-groups": 400,
+    "/admin/modifiers": 400,
+    "/admin/delivery-zones": 1500,
+    "/admin/coupons": 600,
+    "/loyalty/settings": 800,
+}
+
+def test_payload_sizes():
+    """Test 18: Column projection payload sizes - ?fields= on hot endpoints"""
+    print("\n" + "="*50)
+    print("TEST 18: Payload Sizes (column projection)")
+    print("="*50)
+    
+    all_ok = True
+    for endpoint, budget in PAYLOAD_BUDGETS.items():
+        try:
+            full = requests.get(f"{API_URL}{endpoint}", timeout=30)
+            narrow = requests.get(f"{API_URL}{endpoint}", params={"fields": "id"}, timeout=30)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ {endpoint}: request failed: {str(e)}")
+            all_ok = False
+            continue
+        
+        rows = full.json() if full.status_code == 200 else []
+        if isinstance(rows, dict):  # single-object endpoints such as /loyalty/settings
+            rows = [rows]
+        per_row = len(full.content) / len(rows) if rows else 0
+        print(f"{endpoint}: {len(rows)} rows, {len(full.content)} bytes ({per_row:.0f}/row), fields=id: {len(narrow.content)} bytes")
+        
+        if full.status_code != 200 or narrow.status_code != 200:
+            print(f"❌ {endpoint}: unexpected status {full.status_code}/{narrow.status_code}")
+            all_ok = False
+        elif per_row > budget:
+            print(f"❌ {endpoint}: {per_row:.0f} bytes per row exceeds budget of {budget}")
+            all_ok = False
+        elif rows and len(narrow.content) >= len(full.content):
+            print(f"❌ {endpoint}: fields=id did not reduce the payload")
+            all_ok = False
+        elif b"provider_response" in full.content:
+            print(f"❌ {endpoint}: payload still carries provider_response")
+            all_ok = False
+    
+    invalid = requests.get(f"{API_URL}/admin/orders", params={"fields": "provider_response"}, timeout=30)
+    if invalid.status_code != 400:
+        print(f"❌ Expected 400 for a column outside the endpoint's set, got {invalid.status_code}")
+        all_ok = False
+    
+    if all_ok:
+        print("✅ Payload sizes within budget")
+    return all_ok
+
+def test_menu_language_projection():
+    """Test 19: Language-projected menu - GET /api/menu/items?lang=en|ar with ETags"""
+    print("\n" + "="*50)
+    print("TEST 19: Language-Projected Menu Payloads")
+    print("="*50)
+    
+    try:
+        bilingual = requests.get(f"{API_URL}/menu/items", timeout=30)
+        arabic = requests.get(f"{API_URL}/menu/items", params={"lang": "ar"}, timeout=30)
+        english = requests.get(f"{API_URL}/menu/items", params={"lang": "en"}, timeout=30)
+        print(f"Bilingual: {len(bilingual.content)} bytes, ar: {len(arabic.content)} bytes, en: {len(english.content)} bytes")
+        
+        if any(r.status_code != 200 for r in (bilingual, arabic, english)):
+            print("❌ Menu request failed")
+            return False
+        
+        items = arabic.json()
+        if items and ('name_en' in items[0] or 'name' not in items[0]):
+            print(f"❌ Expected a single localized name field: {items[0]}")
+            return False
+        if items and len(arabic.content) >= len(bilingual.content):
+            print("❌ Localized payload is not smaller than the bilingual one")
+            return False
+        
+        etag_ar, etag_en = arabic.headers.get("ETag"), english.headers.get("ETag")
+        if not etag_ar or etag_ar == etag_en:
+            print(f"❌ Expected distinct per-language ETags, got {etag_ar} / {etag_en}")
+            return False
+        
+        revalidated = requests.get(f"{API_URL}/menu/items", params={"lang": "ar"}, headers={"If-None-Match": etag_ar}, timeout=30)
+        if revalidated.status_code != 304:
+            print(f"❌ Expected 304 for a matching ETag, got {revalidated.status_code}")
+            return False
+        
+        print("✅ Language projection and ETags working")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+
+def test_menu_search():
+    """Test 20: Bilingual menu search - GET /api/menu/search?q="""
+    print("\n" + "="*50)
+    print("TEST 20: Bilingual Menu Search")
+    print("="*50)
+    
+    success, english = test_api_endpoint("GET", "/menu/search", params={"q": "burg"})
+    if not success or not isinstance(english, list):
+        print(f"❌ English prefix search failed: {english}")
+        return False
+    print(f"'burg' matched {len(english)} results")
+    
+    # Diacritics and alef/ta-marbuta variants must normalize to the same tokens
+    _, plain = test_api_endpoint("GET", "/menu/search", params={"q": "برجر"})
+    _, marked = test_api_endpoint("GET", "/menu/search", params={"q": "بَرْجَر"})
+    if [r['id'] for r in plain] != [r['id'] for r in marked]:
+        print("❌ Arabic diacritics changed the results")
+        return False
+    
+    if english and any(r.get('score') is None for r in english):
+        print("❌ Results are missing scores")
+        return False
+    
+    print("✅ Menu search working")
+    return True
+
+def test_cart_quote():
+    """Test 21: Server-side cart quote - POST /api/cart/quote"""
+    print("\n" + "="*50)
+    print("TEST 21: Server-Side Cart Quote")
+    print("="*50)
+    
+    success, items = test_api_endpoint("GET", "/menu/items")
+    if not success or not items:
+        print("❌ No menu items available to quote")
+        return False
+    
+    item = items[0]
+    quote_data = {"order_type": "pickup", "items": [{"item_id": item['id'], "quantity": 2}]}
+    success, quote = test_api_endpoint("POST", "/cart/quote", data=quote_data)
+    if not success or not quote.get('valid') or not quote.get('quote_token'):
+        print(f"❌ Quote failed: {quote}")
+        return False
+    
+    expected_subtotal = round(float(item['base_price']) * 2, 3)
+    print(f"Quoted subtotal: {quote['subtotal']}, expected: {expected_subtotal}, total: {quote['total_amount']}")
+    if abs(quote['subtotal'] - expected_subtotal) > 0.0005:
+        print("❌ Quote subtotal does not match menu prices")
+        return False
+    
+    # A tampered quote must be rejected when placing the order
+    order_data = {
+        "order_type": "pickup",
+        "customer_name": "Quote Test",
+        "customer_phone": "+96599000000",
+        "items": [],
+        "subtotal": 0.001,
+        "total_amount": 0.001,
+        "payment_method": "cash",
+        "quote_token": quote['quote_token'][:-4] + "0000",
+    }
+    success, result = test_api_endpoint("POST", "/orders", data=order_data, expected_status=400)
+    if not success:
+        print(f"❌ Tampered quote was not rejected: {result}")
+        return False
+    
+    print("✅ Cart quote working")
+    return True
+
+def test_delivery_zone_resolve():
+    """Test 22: Delivery zone lookup by coordinates - GET /api/delivery-zones/resolve"""
+    print("\n" + "="*50)
+    print("TEST 22: Delivery Zone Resolve")
+    print("="*50)
+    
+    success, zones = test_api_endpoint("GET", "/delivery-zones")
+    if not success:
+        return False
+    
+    polygons = [z for z in zones if isinstance(z.get('coordinates'), list) and len(z['coordinates']) >= 3]
+    if polygons:
+        # The vertex average of a convex zone lies inside it
+        zone = polygons[0]
+        lat = sum(p[0] for p in zone['coordinates']) / len(zone['coordinates'])
+        lng = sum(p[1] for p in zone['coordinates']) / len(zone['coordinates'])
+    else:
+        lat, lng = 29.3759, 47.9774
+    
+    success, result = test_api_endpoint("GET", f"/delivery-zones/resolve?lat={lat}&lng={lng}")
+    if not success or 'deliverable' not in result:
+        print(f"❌ Resolve failed: {result}")
+        return False
+    print(f"({lat:.4f}, {lng:.4f}) -> {result.get('zone')}")
+    
+    # Lookups are served from the in-memory index; keep them well under the DB round trip
+    start = datetime.now()
+    for _ in range(20):
+        requests.get(f"{API_URL}/delivery-zones/resolve", params={"lat": lat, "lng": lng}, timeout=10)
+    per_lookup_ms = (datetime.now() - start).total_seconds() * 1000 / 20
+    print(f"Average resolve round trip: {per_lookup_ms:.1f} ms")
+    
+    print("✅ Delivery zone resolve working")
+    return True
+
+def test_geocode_cache():
+    """Test 23: Cached geocoding proxy - GET /api/geocode"""
+    print("\n" + "="*50)
+    print("TEST 23: Geocode Cache")
+    print("="*50)
+    
+    params = {"area": "Salmiya", "block": "10"}
+    first_ok, first = test_api_endpoint("GET", f"/geocode?area={params['area']}&block={params['block']}")
+    if not first_ok:
+        return False
+    
+    # Same address with different spelling/spacing must be served from the cache
+    second_ok, second = test_api_endpoint("GET", "/geocode?area=salmiya%20&block=Block%2010")
+    if not second_ok or not second.get('cached'):
+        print(f"❌ Repeated lookup was not served from cache: {second}")
+        return False
+    if first.get('found') != second.get('found') or first.get('lat') != second.get('lat'):
+        print("❌ Cached result differs from first lookup")
+        return False
+    
+    print("✅ Geocode cache working")
+    return True
+
+def test_dispatch_deliveries():
+    """Test 24: Delivery distances and ETAs - GET /api/admin/dispatch/deliveries"""
+    print("\n" + "="*50)
+    print("TEST 24: Dispatch Delivery Distances")
+    print("="*50)
+    
+    success, board = test_api_endpoint("GET", "/admin/dispatch/deliveries")
+    if not success:
+        # 503 means the branch has no coordinates configured yet
+        return False
+    
+    deliveries = board.get('deliveries', [])
+    print(f"Open deliveries with location: {board.get('count')}")
+    distances = [d['distance_km'] for d in deliveries]
+    if distances != sorted(distances):
+        print("❌ Deliveries are not sorted by distance")
+        return False
+    for delivery in deliveries[:3]:
+        print(f"  {delivery['order_number']}: {delivery['distance_km']} km, ~{delivery['travel_minutes']} min")
+    
+    print("✅ Dispatch distances working")
+    return True
+
+def test_dispatch_batches():
+    """Test 25: Delivery batching suggestions - GET /api/admin/dispatch/batches"""
+    print("\n" + "="*50)
+    print("TEST 25: Delivery Batching Suggestions")
+    print("="*50)
+    
+    start = datetime.now()
+    success, result = test_api_endpoint("GET", "/admin/dispatch/batches?capacity=3")
+    elapsed = (datetime.now() - start).total_seconds()
+    if not success:
+        return False
+    
+    runs = result.get('runs', [])
+    print(f"{result.get('orders')} ready orders -> {len(runs)} runs, saving {result.get('saved_km')} km ({elapsed:.2f}s)")
+    if any(len(run['orders']) > 3 for run in runs):
+        print("❌ A run exceeds the requested capacity")
+        return False
+    assigned = [order['id'] for run in runs for order in run['orders']]
+    if len(assigned) != len(set(assigned)) or len(assigned) != result.get('orders'):
+        print("❌ Each ready order must appear in exactly one run")
+        return False
+    
+    print("✅ Delivery batching working")
+    return True
+
+def test_kitchen_eta():
+    """Test 26: Kitchen load-aware ETA - GET /api/kitchen/eta"""
+    print("\n" + "="*50)
+    print("TEST 26: Kitchen ETA")
+    print("="*50)
+    
+    success, items = test_api_endpoint("GET", "/menu/items?fields=id,name_en")
+    if not success or not items:
+        return False
+    
+    cart = ",".join(f"{item['id']}:1" for item in items[:2])
+    success, eta = test_api_endpoint("GET", f"/kitchen/eta?items={cart}")
+    if not success:
+        return False
+    
+    for key in ('estimated_ready_time', 'prep_minutes', 'queue_minutes', 'load', 'accepting'):
+        if key not in eta:
+            print(f"❌ Missing {key} in ETA response")
+            return False
+    print(f"Ready by {eta['estimated_ready_time']} (prep {eta['prep_minutes']} min, queue {eta['queue_minutes']} min, load {eta['load']})")
+    
+    print("✅ Kitchen ETA working")
+    return True
+
+def test_kitchen_queue():
+    """Test 27: Kitchen display queue - GET /api/kitchen/queue"""
+    print("\n" + "="*50)
+    print("TEST 27: Kitchen Display Queue")
+    print("="*50)
+    
+    try:
+        response = requests.get(f"{API_URL}/kitchen/queue", timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        queue = response.json()
+        promised = [order['promised_at'] for order in queue['orders']]
+        print(f"{len(promised)} orders in queue, {len(response.content)} bytes")
+        if promised != sorted(promised):
+            print("❌ Queue is not ordered by promised time")
+            return False
+        
+        # Unchanged queue must answer 304 to a conditional poll
+        etag = response.headers.get('ETag')
+        again = requests.get(f"{API_URL}/kitchen/queue", headers={"If-None-Match": etag}, timeout=10)
+        print(f"Conditional poll status: {again.status_code}")
+        if again.status_code not in (200, 304):
+            return False
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Kitchen queue working")
+    return True
+
+def test_admin_stats():
+    """Test 28: Dashboard rollups - GET /api/admin/stats"""
+    print("\n" + "="*50)
+    print("TEST 28: Admin Stats Rollups")
+    print("="*50)
+    
+    success, stats = test_api_endpoint("GET", "/admin/stats?group=hour")
+    if not success:
+        return False
+    print(f"Today: {stats['totals']}")
+    
+    series_orders = sum(bucket['orders'] for bucket in stats['series'])
+    if series_orders != stats['totals']['orders']:
+        print(f"❌ Hourly series ({series_orders}) does not add up to totals")
+        return False
+    
+    start = datetime.now()
+    success, month = test_api_endpoint("GET", "/admin/stats?from=2025-01-01&to=2025-12-31")
+    elapsed_ms = (datetime.now() - start).total_seconds() * 1000
+    if not success:
+        return False
+    print(f"Full-year stats: {month['totals']['orders']} orders, {len(month['series'])} days in {elapsed_ms:.0f} ms")
+    
+    print("✅ Admin stats working")
+    return True
+
+def test_item_sales_report():
+    """Test 29: Item x hour and modifier attach report - GET /api/admin/reports/item-sales"""
+    print("\n" + "="*50)
+    print("TEST 29: Item Sales Report")
+    print("="*50)
+    
+    month_start = datetime.now().strftime('%Y-%m-01')
+    today = datetime.now().strftime('%Y-%m-%d')
+    path = f"/admin/reports/item-sales?from={month_start}&to={today}"
+    
+    start = datetime.now()
+    success, report = test_api_endpoint("GET", path)
+    first_ms = (datetime.now() - start).total_seconds() * 1000
+    if not success:
+        return False
+    
+    for item in report['items']:
+        if len(item['by_hour']) != 24 or sum(item['by_hour']) != item['quantity']:
+            print(f"❌ Hour matrix does not add up for {item['name_en']}")
+            return False
+    if any(not 0 <= row['attach_rate'] <= 1 for row in report['modifiers']):
+        print("❌ Attach rates must be between 0 and 1")
+        return False
+    
+    start = datetime.now()
+    test_api_endpoint("GET", path)
+    cached_ms = (datetime.now() - start).total_seconds() * 1000
+    print(f"{report['orders']} orders, {len(report['items'])} items, {len(report['modifiers'])} item/modifier pairs")
+    print(f"First request {first_ms:.0f} ms, cached {cached_ms:.0f} ms")
+    
+    print("✅ Item sales report working")
+    return True
+
+def test_orders_export():
+    """Test 30: Streaming order export - GET /api/admin/orders/export"""
+    print("\n" + "="*50)
+    print("TEST 30: Streaming Orders Export")
+    print("="*50)
+    
+    try:
+        response = requests.get(f"{API_URL}/admin/orders/export", params={"format": "ndjson"}, stream=True, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        ids = []
+        for line in response.iter_lines():
+            if line:
+                record = json.loads(line)
+                if 'error' in record:
+                    print(f"❌ Export interrupted: {record}")
+                    return False
+                ids.append(record['id'])
+        print(f"NDJSON export: {len(ids)} orders (transfer encoding: {response.headers.get('Content-Encoding', 'identity')})")
+        if len(ids) != len(set(ids)):
+            print("❌ Export repeated orders across pages")
+            return False
+        
+        response = requests.get(f"{API_URL}/admin/orders/export", params={"format": "csv", "fields": "id,order_number,created_at,total_amount"}, timeout=60)
+        lines = response.text.splitlines()
+        print(f"CSV export: header {lines[0] if lines else None}, {max(len(lines) - 1, 0)} rows")
+        if response.status_code != 200 or not lines or not lines[0].startswith('id,'):
+            return False
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Orders export working")
+    return True
+
+def test_order_archive(order_id):
+    """Test 31: Order archive dry run and archived-order reads - POST /api/admin/archive/run"""
+    print("\n" + "="*50)
+    print("TEST 31: Order Archive")
+    print("="*50)
+    
+    try:
+        response = requests.post(f"{API_URL}/admin/archive/run", params={"older_than_days": 180, "dry_run": "true"}, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        data = response.json()
+        print(f"Dry run: {data['candidates']} candidates, {data['archived']} archivable, {data['skipped_referenced']} kept for coupon/loyalty references")
+        if data['batches']:
+            print("❌ Dry run wrote archive batches")
+            return False
+        
+        # Live orders must still read the same way
+        if order_id:
+            response = requests.get(f"{API_URL}/orders/{order_id}", timeout=10)
+            if response.status_code != 200 or response.json().get('archived'):
+                print(f"❌ Live order lookup changed: {response.status_code}")
+                return False
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Order archive working")
+    return True
+
+def test_order_item_modifiers_backfill(order_id):
+    """Test 32: Modifiers JSON backfill dry run - POST /api/admin/migrations/order-item-modifiers"""
+    print("\n" + "="*50)
+    print("TEST 32: Order Item Modifiers Backfill")
+    print("="*50)
+    
+    try:
+        response = requests.post(f"{API_URL}/admin/migrations/order-item-modifiers", params={"dry_run": "true", "max_items": 500}, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        data = response.json()
+        print(f"Dry run: {data['scanned']} items without a modifiers column, {data['with_modifiers']} with modifier rows")
+        if data['updated']:
+            print("❌ Dry run wrote rows")
+            return False
+        
+        # Every item keeps a modifiers list whichever way it is stored
+        if order_id:
+            response = requests.get(f"{API_URL}/orders/{order_id}", timeout=10)
+            items = response.json().get('items', [])
+            if response.status_code != 200 or any(not isinstance(item.get('modifiers'), list) for item in items):
+                print(f"❌ Order items missing modifiers: {response.status_code}")
+                return False
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Order item modifiers backfill working")
+    return True
+
+def test_order_summaries_backfill():
+    """Test 33: Order summary backfill dry run - POST /api/admin/migrations/order-summaries"""
+    print("\n" + "="*50)
+    print("TEST 33: Order Summaries Backfill")
+    print("="*50)
+    
+    try:
+        response = requests.post(f"{API_URL}/admin/migrations/order-summaries", params={"dry_run": "true", "max_orders": 500}, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        data = response.json()
+        print(f"Dry run: {data['scanned']} orders without summary columns")
+        if data['updated']:
+            print("❌ Dry run wrote rows")
+            return False
+        
+        response = requests.get(f"{API_URL}/admin/orders", params={"limit": 5}, timeout=10)
+        if response.status_code != 200:
+            print(f"❌ Admin orders status {response.status_code}")
+            return False
+        for order in response.json():
+            print(f"  {order.get('order_number')}: {order.get('item_count')} items, payment {order.get('payment_method')}/{order.get('payment_status')}")
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Order summaries backfill working")
+    return True
+
+def test_sequential_order_numbers():
+    """Test 34: Sequence-based order numbers - POST /api/orders"""
+    print("\n" + "="*50)
+    print("TEST 34: Sequential Order Numbers")
+    print("="*50)
+    
+    order_data = {
+        "order_type": "pickup",
+        "customer_name": "Sara Al-Mutairi",
+        "customer_phone": "+96599765432",
+        "items": [
+            {
+                "item_id": "e5555555-5555-5555-5555-555555555555",
+                "item_name_en": "Regular Fries",
+                "item_name_ar": "بطاطس عادية متوسطة",
+                "quantity": 1,
+                "unit_price": 0.95,
+                "total_price": 0.95,
+                "modifiers": []
+            }
+        ],
+        "subtotal": 0.95,
+        "total_amount": 0.95,
+    }
+    
+    numbers = []
+    for _ in range(3):
+        success, result = test_api_endpoint("POST", "/orders", data=order_data, expected_status=200)
+        if not success or not isinstance(result, dict):
+            print(f"❌ Order creation failed: {result}")
+            return False
+        numbers.append(result.get('order_number', ''))
+    print(f"Order numbers: {', '.join(numbers)}")
+    
+    sequences = [number.rsplit('-', 1)[-1] for number in numbers]
+    if not all(sequence.isdigit() for sequence in sequences):
+        print("❌ Order numbers are not from the daily sequence")
+        return False
+    if [int(sequence) for sequence in sequences] != sorted(set(int(sequence) for sequence in sequences)):
+        print("❌ Order numbers are not unique and increasing")
+        return False
+    
+    print("✅ Sequential order numbers working")
+    return True
+
+def test_menu_import():
+    """Test 35: Bulk menu import validation - POST /api/admin/menu/import"""
+    print("\n" + "="*50)
+    print("TEST 35: Menu Import")
+    print("="*50)
+    
+    csv_body = "\n".join([
+        "type,name_en,name_ar,category,base_price,modifier_group,price,modifier_groups,max_select",
+        "category,Import Test,اختبار,,,,,,",
+        "modifier_group,Import Test Size,الحجم,,,,,,1",
+        "modifier,Large,كبير,,,Import Test Size,0.5,,",
+        "item,Import Test Burger,برجر,Import Test,2.5,,,Import Test Size,",
+    ])
+    try:
+        response = requests.post(f"{API_URL}/admin/menu/import", params={"dry_run": "true"}, data=csv_body.encode(),
+                                 headers={"Content-Type": "text/csv"}, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        data = response.json()
+        print(f"Dry run: created {data['created']}, updated {data['updated']}, links {data['links']}")
+        
+        # A bad row rejects the whole import with per-row errors
+        response = requests.post(f"{API_URL}/admin/items/bulk", params={"dry_run": "true"},
+                                 json=[{"name_en": "No Price", "name_ar": "x", "category": "Import Test"}], timeout=30)
+        if response.status_code != 422:
+            print(f"❌ Expected 422 for an invalid row, got {response.status_code}")
+            return False
+        print(f"Invalid row rejected: {response.json()['detail']['errors']}")
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Menu import working")
+    return True
+
+def test_menu_reorder():
+    """Test 36: Bulk reorder - POST /api/admin/categories/reorder"""
+    print("\n" + "="*50)
+    print("TEST 36: Menu Reorder")
+    print("="*50)
+    
+    try:
+        response = requests.get(f"{API_URL}/admin/categories", timeout=10)
+        categories = response.json() if response.status_code == 200 else []
+        if not categories:
+            print("❌ No categories to reorder")
+            return False
+        
+        # Re-applying the current order (renumbered from 0) then repeating it must be a no-op
+        ids = [category['id'] for category in sorted(categories, key=lambda category: category.get('sort_order') or 0)]
+        response = requests.post(f"{API_URL}/admin/categories/reorder", json={"ids": ids}, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ Status {response.status_code}: {response.text}")
+            return False
+        print(f"First pass: {response.json()}")
+        response = requests.post(f"{API_URL}/admin/categories/reorder", json={"ids": ids}, timeout=30)
+        if response.status_code != 200 or response.json().get('changed') != 0:
+            print(f"❌ Repeating the same order rewrote rows: {response.text}")
+            return False
+        
+        response = requests.post(f"{API_URL}/admin/categories/reorder", json={"ids": ids[:1] * 2}, timeout=30)
+        if response.status_code != 400:
+            print(f"❌ Expected 400 for repeated ids, got {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Request failed: {str(e)}")
+        return False
+    
+    print("✅ Menu reorder working")
+    return True
+
+def test_cart_quote_modifiers():
+    """Test 37: Cart quote modifier pricing - POST /api/cart/quote with modifier_ids"""
+    print("\n" + "="*50)
+    print("TEST 37: Cart Quote Modifier Pricing")
+    print("="*50)
+    
+    success, items = test_api_endpoint("GET", "/menu/items")
+    if not success or not items:
+        print("❌ No menu items available to quote")
+        return False
+    
+    # Find an item with modifiers, and a modifier from a group that item is not linked to
+    item, groups = None, []
+    for candidate in items:
+        success, candidate_groups = test_api_endpoint("GET", f"/menu/items/{candidate['id']}/modifiers")
+        if success and any(group.get('modifiers') for group in candidate_groups or []):
+            item, groups = candidate, candidate_groups
+            break
+    if item is None:
+        print("❌ No menu item with modifiers to quote")
+        return False
+    
+    linked_group_ids = {group['id'] for group in groups}
+    chosen = [group['modifiers'][0] for group in groups if group.get('modifiers')]
+    success, all_modifiers = test_api_endpoint("GET", "/admin/modifiers")
+    unlinked = next((modifier for modifier in (all_modifiers if success else [])
+                     if modifier.get('status', 'active') == 'active' and modifier['modifier_group_id'] not in linked_group_ids), None)
+    
+    quote_data = {"order_type": "pickup", "items": [{
+        "item_id": item['id'], "quantity": 3, "modifier_ids": [modifier['id'] for modifier in chosen]
+    }]}
+    success, quote = test_api_endpoint("POST", "/cart/quote", data=quote_data)
+    if not success or not quote.get('valid'):
+        print(f"❌ Quote failed: {quote}")
+        return False
+    
+    # Compare in fils so float rounding cannot hide or invent a difference
+    unit_fils = round(float(item['base_price']) * 1000) + sum(round(float(modifier.get('price') or 0) * 1000) for modifier in chosen)
+    expected_subtotal = unit_fils * 3 / 1000
+    print(f"Quoted subtotal: {quote['subtotal']}, expected: {expected_subtotal} ({len(chosen)} modifiers)")
+    if round(quote['subtotal'] * 1000) != unit_fils * 3:
+        print("❌ Quote subtotal does not equal base price plus modifier prices")
+        return False
+    
+    if unlinked is None:
+        print("⚠️  Every modifier group is linked to this item; skipping the unlinked-modifier check")
+    else:
+        quote_data['items'][0]['modifier_ids'] = [unlinked['id']]
+        success, quote = test_api_endpoint("POST", "/cart/quote", data=quote_data)
+        if not success or quote.get('valid') or quote.get('quote_token'):
+            print(f"❌ Modifier from an unlinked group was accepted: {quote}")
+            return False
+        print(f"Unlinked modifier rejected: {quote.get('errors')}")
+    
+    print("✅ Cart quote modifier pricing working")
+    return True
+
+def test_cart_quote_retry_after_failed_order():
+    """Test 38: A quote is still usable after an order attempt with it fails"""
+    print("\n" + "="*50)
+    print("TEST 38: Cart Quote Retry After Failed Order")
+    print("="*50)
+    
+    success, items = test_api_endpoint("GET", "/menu/items")
+    if not success or not items:
+        print("❌ No menu items available to quote")
+        return False
+    
+    success, quote = test_api_endpoint("POST", "/cart/quote", data={"order_type": "pickup", "items": [{"item_id": items[0]['id'], "quantity": 1}]})
+    if not success or not quote.get('quote_token'):
+        print(f"❌ Quote failed: {quote}")
+        return False
+    
+    order_data = {
+        "order_type": "pickup",
+        "customer_name": "Quote Retry Test",
+        "customer_phone": "+96599000000",
+        "items": [],
+        "subtotal": 0,
+        "total_amount": 0,
+        "payment_method": "cash",
+        # Postgres text cannot hold NUL, so the order insert itself fails
+        "notes": "retry\u0000test",
+        "quote_token": quote['quote_token'],
+    }
+    response = requests.post(f"{API_URL}/orders", json=order_data, timeout=30)
+    print(f"Failed attempt: {response.status_code} {response.text[:200]}")
+    if response.status_code == 200:
+        print("❌ Order with a NUL in its notes was expected to fail")
+        return False
+    
+    order_data['notes'] = "Quote retry test"
+    success, result = test_api_endpoint("POST", "/orders", data=order_data)
+    if not success:
+        print(f"❌ Quote was burned by the failed attempt: {result}")
+        return False
+    
+    success, result = test_api_endpoint("POST", "/orders", data=order_data, expected_status=400)
+    if not success:
+        print(f"❌ Quote was accepted a second time: {result}")
+        return False
+    
+    print("✅ Quote survives a failed order and is single-use once placed")
+    return True
+
 def main():
     """Run all backend API tests"""
     print("Bam Burgers Backend API Test Suite")
@@ -695,6 +1596,115 @@ def main():
     admin_payment_info_success = test_admin_orders_with_payment_info()
     results.append(("Admin Orders with Payment Info", admin_payment_info_success))
     
+    # PERFORMANCE TESTS
+    print("\n" + "🔥"*20)
+    print("PERFORMANCE TESTS")
+    print("🔥"*20)
+    
+    # Test 13: Admin Orders Keyset Pagination
+    pagination_success = test_admin_orders_pagination()
+    results.append(("Admin Orders Keyset Pagination", pagination_success))
+    
+    # Test 14: Admin Orders Delta Sync
+    changes_success = test_admin_orders_changes()
+    results.append(("Admin Orders Delta Sync", changes_success))
+    
+    # Test 15: Live Order Feed
+    stream_success = test_admin_orders_stream()
+    results.append(("Live Order Feed (SSE)", stream_success))
+    
+    # Test 16: Order Tracking Long-Poll (uses order from test 1)
+    long_poll_success = test_order_status_long_poll(order_id)
+    results.append(("Order Tracking Long-Poll", long_poll_success))
+    
+    # Test 17: Bulk Order Status Update (uses order from test 1)
+    bulk_status_success = test_bulk_order_status_update(order_id)
+    results.append(("Bulk Order Status Update", bulk_status_success))
+    
+    # Test 18: Payload Sizes
+    payload_success = test_payload_sizes()
+    results.append(("Payload Sizes (column projection)", payload_success))
+    
+    # Test 19: Language-Projected Menu Payloads
+    menu_lang_success = test_menu_language_projection()
+    results.append(("Language-Projected Menu Payloads", menu_lang_success))
+    
+    # Test 20: Bilingual Menu Search
+    menu_search_success = test_menu_search()
+    results.append(("Bilingual Menu Search", menu_search_success))
+    
+    # Test 21: Server-Side Cart Quote
+    cart_quote_success = test_cart_quote()
+    results.append(("Server-Side Cart Quote", cart_quote_success))
+    
+    # Test 22: Delivery Zone Resolve
+    zone_resolve_success = test_delivery_zone_resolve()
+    results.append(("Delivery Zone Resolve", zone_resolve_success))
+    
+    # Test 23: Geocode Cache
+    geocode_success = test_geocode_cache()
+    results.append(("Geocode Cache", geocode_success))
+    
+    # Test 24: Dispatch Delivery Distances
+    dispatch_success = test_dispatch_deliveries()
+    results.append(("Dispatch Delivery Distances", dispatch_success))
+    
+    # Test 25: Delivery Batching Suggestions
+    batches_success = test_dispatch_batches()
+    results.append(("Delivery Batching Suggestions", batches_success))
+    
+    # Test 26: Kitchen ETA
+    kitchen_eta_success = test_kitchen_eta()
+    results.append(("Kitchen ETA", kitchen_eta_success))
+    
+    # Test 27: Kitchen Display Queue
+    kitchen_queue_success = test_kitchen_queue()
+    results.append(("Kitchen Display Queue", kitchen_queue_success))
+    
+    # Test 28: Admin Stats Rollups
+    stats_success = test_admin_stats()
+    results.append(("Admin Stats Rollups", stats_success))
+    
+    # Test 29: Item Sales Report
+    item_sales_success = test_item_sales_report()
+    results.append(("Item Sales Report", item_sales_success))
+    
+    # Test 30: Streaming Orders Export
+    export_success = test_orders_export()
+    results.append(("Streaming Orders Export", export_success))
+    
+    # Test 31: Order Archive
+    archive_success = test_order_archive(order_id)
+    results.append(("Order Archive", archive_success))
+    
+    # Test 32: Order Item Modifiers Backfill
+    modifiers_backfill_success = test_order_item_modifiers_backfill(order_id)
+    results.append(("Order Item Modifiers Backfill", modifiers_backfill_success))
+    
+    # Test 33: Order Summaries Backfill
+    summaries_backfill_success = test_order_summaries_backfill()
+    results.append(("Order Summaries Backfill", summaries_backfill_success))
+    
+    # Test 34: Sequential Order Numbers
+    order_numbers_success = test_sequential_order_numbers()
+    results.append(("Sequential Order Numbers", order_numbers_success))
+    
+    # Test 35: Menu Import
+    menu_import_success = test_menu_import()
+    results.append(("Menu Import", menu_import_success))
+    
+    # Test 36: Menu Reorder
+    menu_reorder_success = test_menu_reorder()
+    results.append(("Menu Reorder", menu_reorder_success))
+    
+    # Test 37: Cart Quote Modifier Pricing
+    cart_quote_modifiers_success = test_cart_quote_modifiers()
+    results.append(("Cart Quote Modifier Pricing", cart_quote_modifiers_success))
+    
+    # Test 38: Cart Quote Retry After Failed Order
+    cart_quote_retry_success = test_cart_quote_retry_after_failed_order()
+    results.append(("Cart Quote Retry After Failed Order", cart_quote_retry_success))
+    
     # Summary
     print("\n" + "="*50)
     print("TEST SUMMARY")
@@ -719,7 +1729,7 @@ def main():
     print(f"Loyalty Integration Tests: {loyalty_passed}/{loyalty_total} passed")
     
     # Focus on payment tests
-    payment_tests = results[8:]  # Last 4 tests are payment-related
+    payment_tests = results[8:12]  # Tests 6-9 are payment-related
     payment_passed = sum(1 for _, success in payment_tests if success)
     payment_total = len(payment_tests)
     